@@ -0,0 +1,99 @@
+import logging
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+
+class FakeYFinance:
+    """
+    Sustituto local de yf.download para los benchmarks, sin red.
+
+    Responde con el mismo formato que yf.download(group_by='ticker') (columnas
+    MultiIndex (Ticker, Price)) y precios deterministas por símbolo y fecha. Al
+    sustituir yf.download, las medidas incluyen los lotes, el pool de hilos, el
+    limitador de tasa y los reintentos de data_fetchers.
+
+    Args:
+        latency (float): Segundos de espera por llamada.
+        latency_per_symbol (float): Segundos adicionales por símbolo de la llamada.
+        failure_rate (float): Fracción de símbolos sin datos ("possibly delisted").
+                              Siempre son los mismos, así que no se reintentan.
+        error_rate (float): Probabilidad de que una llamada falle con un error de
+                            conexión (transitorio, se reintenta).
+        end_date (str): Última fecha de las series generadas.
+        seed (int): Semilla para los errores transitorios.
+    """
+
+    def __init__(self, latency=0.0, latency_per_symbol=0.0, failure_rate=0.0, error_rate=0.0,
+                 end_date='2024-12-31', seed=0):
+        self.latency = latency
+        self.latency_per_symbol = latency_per_symbol
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.end_date = end_date
+        self.calls = 0
+        self.symbols = 0
+        self.errors = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        # Calendario de días hábiles generado una sola vez (pd.bdate_range es lento).
+        self._calendar = pd.bdate_range('1970-01-01', end_date, name='Date')
+
+    def _fails(self, ticker):
+        return zlib.crc32(ticker.encode()) / 2 ** 32 < self.failure_rate
+
+    def _frame(self, ticker, start):
+        dates = self._calendar[self._calendar.searchsorted(pd.Timestamp(start)):]
+        rng = np.random.default_rng(zlib.crc32(f"{ticker}:{start}".encode()))
+        close = rng.uniform(5, 200) * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+        return pd.DataFrame({
+            'Open': close * (1 + rng.normal(0, 0.005, len(dates))),
+            'High': close * 1.01,
+            'Low': close * 0.99,
+            'Close': close,
+            'Adj Close': close,
+            'Volume': rng.integers(10_000, 10_000_000, len(dates))
+        }, index=dates)
+
+    def download(self, tickers, start=None, **kwargs):
+        if isinstance(tickers, str):
+            tickers = tickers.split()
+        with self._lock:
+            self.calls += 1
+            self.symbols += len(tickers)
+            raise_error = self._rng.random() < self.error_rate
+            if raise_error:
+                self.errors += 1
+
+        time.sleep(self.latency + self.latency_per_symbol * len(tickers))
+        if raise_error:
+            raise ConnectionError("Connection reset by peer (simulado)")
+
+        logger = logging.getLogger('yfinance')
+        frames = {}
+        for ticker in tickers:
+            if self._fails(ticker):
+                logger.error(f"${ticker}: possibly delisted; no price data found")
+            else:
+                frames[ticker.upper()] = self._frame(ticker, start)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1, names=['Ticker', 'Price'])
+
+    def stats(self):
+        return {'calls': self.calls, 'symbols': self.symbols, 'transient_errors': self.errors}
+
+    @contextmanager
+    def installed(self):
+        """Sustituye yf.download por este objeto mientras dura el bloque."""
+        original = yf.download
+        yf.download = self.download
+        try:
+            yield self
+        finally:
+            yf.download = original
@@ -0,0 +1,434 @@
+"""
+Benchmarks del pipeline con datos sintéticos y un sustituto local de yfinance,
+sin necesidad del archivo de Kaggle ni de acceso a Yahoo.
+
+Uso:
+    python benchmarks/run_benchmarks.py --scales small medium
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/anterior.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+import pandas as pd
+
+import config
+import main as pipeline
+import manage_constituents
+from csv_writer import encode_frame, encode_frames
+from data_fetchers import load_and_preprocess_quandl
+from fake_yfinance import FakeYFinance
+from http_cache import get_response_cache
+from manifest import load_manifest, manifest_path_for, partial_path_for
+from process_local_data import load_and_process_local_data
+from quandl_store import open_quandl_store
+from run_report import get_run_report, reset_run_report
+from synthetic_data import (
+    generate_constituents_html,
+    generate_local_files,
+    generate_quandl_csv,
+    synthetic_tickers
+)
+
+# Tamaños de cada escala: tickers y años en Quandl, tickers que solo están en
+# yfinance, filas por archivo local, archivos locales adicionales (descubiertos con
+# config.LOCAL_FILE_GLOB) y constituyentes/cambios de la página de Wikipedia.
+# "large" se acerca al archivo real (~3000 tickers, ~15 millones de filas).
+SCALES = {
+    'small': {'quandl_tickers': 50, 'years': 5, 'yfinance_only': 10, 'local_rows': 1000,
+              'local_files': 20, 'constituents': 100, 'changes': 200},
+    'medium': {'quandl_tickers': 500, 'years': 10, 'yfinance_only': 50, 'local_rows': 5000,
+               'local_files': 100, 'constituents': 500, 'changes': 1000},
+    'large': {'quandl_tickers': 3000, 'years': 20, 'yfinance_only': 200, 'local_rows': 20000,
+              'local_files': 500, 'constituents': 500, 'changes': 5000},
+}
+
+BENCHMARKS = ['quandl_load', 'local_load', 'constituents', 'pipeline', 'csv_encode', 'startup']
+
+# Arranque de la CLI (cli.py): órdenes medidas, tiempo máximo aceptado por orden
+# (mediana, incluido el arranque del intérprete) y módulos pesados que no deben
+# importarse solo para mostrar la ayuda.
+STARTUP_COMMANDS = [['--help'], ['build', '--help'], ['constituents', '--help'],
+                    ['macro', '--help'], ['validate', '--help']]
+STARTUP_BUDGET_SECONDS = 0.25
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'yfinance', 'fredapi', 'requests']
+
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(func, repeat, setup=None):
+    """
+    Ejecuta `func` `repeat` veces y mide el tiempo de cada una (sin contar `setup`).
+
+    Retorna:
+        - (times, result): Segundos de cada ejecución y el resultado de la última.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def prepare_scale(scale, params, work_dir, seed=0):
+    """
+    Genera (o reutiliza, si ya existen en `work_dir`) los datos sintéticos de una escala.
+
+    Retorna:
+        - paths (dict): Rutas y tamaños de los datos generados.
+    """
+    scale_dir = os.path.join(work_dir, scale)
+    os.makedirs(scale_dir, exist_ok=True)
+    quandl_path = os.path.join(scale_dir, 'WIKI_PRICES.csv')
+    quandl_stats_path = quandl_path + '.stats.json'
+    local_dir = os.path.join(scale_dir, 'local')
+
+    if not os.path.exists(quandl_stats_path):
+        print(f"[INFO] Generando WIKI_PRICES.csv sintético ({scale})...")
+        quandl_stats = generate_quandl_csv(quandl_path, params['quandl_tickers'], years=params['years'], seed=seed)
+        with open(quandl_stats_path, 'w', encoding='utf-8') as f:
+            json.dump(quandl_stats, f)
+    with open(quandl_stats_path, encoding='utf-8') as f:
+        quandl_stats = json.load(f)
+
+    local_stats = generate_local_files(local_dir, params['local_rows'], params['local_files'], seed=seed)
+
+    return {
+        'dir': scale_dir,
+        'quandl_path': quandl_path,
+        'quandl_stats': quandl_stats,
+        'local_dir': local_dir,
+        'local_stats': local_stats
+    }
+
+
+def bench_quandl_load(paths, params, args):
+    times, data = _measure(lambda: load_and_preprocess_quandl(paths['quandl_path']), args.repeat)
+    return times, {'rows': paths['quandl_stats']['rows'], 'bytes': paths['quandl_stats']['bytes'],
+                   'tickers': len(data)}
+
+
+def bench_local_load(paths, params, args):
+    times, data = _measure(lambda: load_and_process_local_data(paths['local_dir']), args.repeat)
+    return times, {'rows': sum(len(df) for df in data.values()), 'files': len(data)}
+
+
+def bench_constituents(paths, params, args):
+    """
+    generate_files completo (lectura de las tablas, archivos de fechas e intervalos),
+    con la página sintética servida desde la caché de respuestas en modo "replay".
+    """
+    out_dir = os.path.join(paths['dir'], 'constituents')
+    os.makedirs(out_dir, exist_ok=True)
+    config.CONSTITUENTS_PATH = os.path.join(out_dir, 'sp500_constituents.csv')
+    config.HISTORICAL_CHANGES_PATH = os.path.join(out_dir, 'sp500_historical_changes.csv')
+    config.TICKER_DATES_PATH = os.path.join(out_dir, 'sp500_ticker_dates.csv')
+    config.MEMBERSHIP_INTERVALS_PATH = os.path.join(out_dir, 'sp500_membership_intervals.csv')
+
+    cache = get_response_cache()
+    cache.mode = 'normal'
+    html = generate_constituents_html(params['constituents'], params['changes'], seed=args.seed)
+    cache.store('wikipedia', ('GET', config.WIKIPEDIA_URL), html)
+    cache.mode = 'replay'
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            manage_constituents.generate_files()
+
+    times, _ = _measure(run, args.repeat)
+    return times, {'rows': params['changes'], 'constituents': params['constituents']}
+
+
+def bench_pipeline(paths, params, args):
+    """process_and_save_data sobre Quandl sintético, archivos locales y yfinance simulado."""
+    get_response_cache().mode = 'off'
+    config.QUANDL_CACHE_DIR = os.path.join(paths['dir'], 'quandl_cache')
+    config.QUANDL_INDEX_PATH = paths['quandl_path'] + '.idx.json'
+    config.MERGE_PROCESSES = args.merge_processes
+    config.ASYNC_PIPELINE = args.async_pipeline
+    config.YF_RATE_LIMIT_PER_SEC = args.rate_limit
+    config.YF_BACKOFF_SECONDS = args.backoff
+    # Cada repetición empieza sin registro de resolución: si no, las siguientes no
+    # pedirían los símbolos que fallaron en la primera.
+    config.RESOLUTION_STORE_PATH = os.path.join(paths['dir'], 'ticker_resolution.json')
+
+    quandl_tickers = synthetic_tickers(params['quandl_tickers'])
+    yfinance_only = synthetic_tickers(params['yfinance_only'], skip=params['quandl_tickers'])
+    all_tickers = set(quandl_tickers) | set(yfinance_only) | set(config.LOCAL_FILE_MAPPING.values())
+
+    quandl_store = open_quandl_store(paths['quandl_path'], backend=args.quandl_backend)
+    local_data = load_and_process_local_data(paths['local_dir'])
+    output_path = os.path.join(paths['dir'], 'sp500_precios_completos.csv')
+    fake = FakeYFinance(
+        latency=args.yf_latency, latency_per_symbol=args.yf_latency_per_symbol,
+        failure_rate=args.yf_failure_rate, error_rate=args.yf_error_rate, seed=args.seed
+    )
+
+    def clean():
+        partial_path = partial_path_for(output_path)
+        for path in (output_path, manifest_path_for(output_path), partial_path, manifest_path_for(partial_path),
+                     config.RESOLUTION_STORE_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+        reset_run_report()
+
+    def run():
+        return pipeline.process_and_save_data(all_tickers, quandl_store, local_data, output_path, {})
+
+    with fake.installed():
+        times, (failed, found) = _measure(run, args.repeat, setup=clean)
+    # Etapas de la última ejecución, según el informe del propio pipeline.
+    stages = {name: stage['seconds'] for name, stage in get_run_report().to_dict()['stages'].items()}
+
+    manifest = load_manifest(manifest_path_for(output_path))
+    rows = sum(entry['rows'] for entry in manifest['tickers'].values()) if manifest else 0
+    stats = fake.stats()
+    return times, {
+        'rows': rows,
+        'bytes': os.path.getsize(output_path) if os.path.exists(output_path) else 0,
+        'tickers': found,
+        'failed': len(failed),
+        'yfinance_calls': stats['calls'] // args.repeat,
+        'yfinance_transient_errors': stats['transient_errors'],
+        'stages': stages
+    }
+
+
+def bench_csv_encode(paths, params, args):
+    """
+    Codificación a CSV de los tickers de Quandl sintéticos ya normalizados: uno a uno
+    (series completas, como en una ejecución completa) y las últimas barras de todos
+    en un lote (como en una incremental), frente a DataFrame.to_csv. Se comprueba que
+    los bytes son idénticos.
+    """
+    data = load_and_preprocess_quandl(paths['quandl_path'])
+    frames = [pipeline._normalize_output(df.copy(), ticker) for ticker, df in data.items()]
+    tails = [frame.tail(1) for frame in frames]
+
+    def to_csv(batch):
+        return [frame.to_csv(header=False, index=False).encode('utf-8') for frame in batch]
+
+    times, encoded = _measure(lambda: [encode_frame(frame) for frame in frames], args.repeat)
+    baseline_times, expected = _measure(lambda: to_csv(frames), args.repeat)
+    tail_times, encoded_tails = _measure(lambda: encode_frames(tails), args.repeat)
+    baseline_tail_times, expected_tails = _measure(lambda: to_csv(tails), args.repeat)
+    return times, {
+        'rows': sum(len(frame) for frame in frames),
+        'bytes': sum(len(data) for data in encoded),
+        'tickers': len(frames),
+        'to_csv_seconds': round(statistics.median(baseline_times), 4),
+        'speedup': round(statistics.median(baseline_times) / statistics.median(times), 2),
+        'tails_seconds': round(statistics.median(tail_times), 4),
+        'tails_to_csv_seconds': round(statistics.median(baseline_tail_times), 4),
+        'identical': encoded == expected and encoded_tails == expected_tails
+    }
+
+
+def bench_startup(paths, params, args):
+    """
+    Tiempo de `python cli.py ... --help` en un proceso nuevo (no depende de la escala)
+    y módulos pesados importados por el camino. Se marca 'over_budget' si alguna orden
+    supera STARTUP_BUDGET_SECONDS o importa alguno de HEAVY_MODULES.
+    """
+    cli_path = os.path.join(REPO_ROOT, 'cli.py')
+    per_command = {}
+    for command in STARTUP_COMMANDS:
+        times, _ = _measure(
+            lambda: subprocess.run([sys.executable, cli_path] + command, check=True, capture_output=True),
+            args.repeat
+        )
+        per_command[' '.join(command)] = statistics.median(times)
+
+    probe = (
+        "import contextlib, io, runpy, sys\n"
+        "sys.argv = ['cli.py', '--help']\n"
+        "with contextlib.redirect_stdout(io.StringIO()):\n"
+        "    try:\n"
+        f"        runpy.run_path({cli_path!r}, run_name='__main__')\n"
+        "    except SystemExit:\n"
+        "        pass\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, '-c', probe], check=True, capture_output=True, text=True).stdout
+    heavy = [module for module in output.strip().split(',') if module]
+
+    slowest = max(per_command.values())
+    return [slowest], {
+        'commands': {command: round(seconds, 4) for command, seconds in per_command.items()},
+        'budget_seconds': STARTUP_BUDGET_SECONDS,
+        'heavy_modules_on_help': heavy,
+        'over_budget': slowest > STARTUP_BUDGET_SECONDS or bool(heavy)
+    }
+
+
+BENCHMARK_FUNCTIONS = {
+    'quandl_load': bench_quandl_load,
+    'local_load': bench_local_load,
+    'constituents': bench_constituents,
+    'pipeline': bench_pipeline,
+    'csv_encode': bench_csv_encode,
+    'startup': bench_startup,
+}
+
+
+def run_benchmarks(args, work_dir):
+    """
+    Ejecuta los benchmarks seleccionados en cada escala.
+
+    Retorna:
+        - report (dict): Informe con el entorno, la configuración y los resultados.
+    """
+    config.HTTP_CACHE_DIR = os.path.join(work_dir, 'http')
+
+    results = []
+    for scale in args.scales:
+        params = SCALES[scale]
+        paths = prepare_scale(scale, params, work_dir, seed=args.seed)
+        for name in args.benchmarks:
+            times, metrics = BENCHMARK_FUNCTIONS[name](paths, params, args)
+            median = statistics.median(times)
+            result = {
+                'benchmark': name,
+                'scale': scale,
+                'params': params,
+                'times': [round(t, 6) for t in times],
+                'min': round(min(times), 6),
+                'median': round(median, 6),
+                'metrics': metrics,
+            }
+            if metrics.get('rows') and median > 0:
+                result['rows_per_sec'] = round(metrics['rows'] / median, 1)
+            results.append(result)
+            print(f"[INFO] {name:<13} {scale:<7} mediana {median:8.3f} s  {metrics}")
+
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'settings': {
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'quandl_backend': args.quandl_backend,
+            'merge_processes': args.merge_processes,
+            'async_pipeline': args.async_pipeline,
+            'yf_latency': args.yf_latency,
+            'yf_latency_per_symbol': args.yf_latency_per_symbol,
+            'yf_failure_rate': args.yf_failure_rate,
+            'yf_error_rate': args.yf_error_rate,
+            'rate_limit': args.rate_limit,
+        },
+        'results': results
+    }
+
+
+def compare_reports(report, baseline, tolerance):
+    """
+    Compara las medianas con las de un informe anterior.
+
+    Retorna:
+        - regressions (list): (benchmark, escala, mediana anterior, mediana actual) de
+          los casos más lentos que el anterior en más de `tolerance` (fracción).
+    """
+    previous = {(r['benchmark'], r['scale']): r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        old = previous.get((result['benchmark'], result['scale']))
+        if old is None or old['median'] <= 0:
+            continue
+        ratio = result['median'] / old['median']
+        flag = 'REGRESIÓN' if ratio > 1 + tolerance else ''
+        print(f"{result['benchmark']:<13} {result['scale']:<7} {old['median']:8.3f} s -> "
+              f"{result['median']:8.3f} s  ({ratio:5.2f}x) {flag}")
+        if flag:
+            regressions.append((result['benchmark'], result['scale'], old['median'], result['median']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline con datos sintéticos.")
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small'])
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument('--repeat', type=int, default=3, help='Ejecuciones por benchmark.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help='Directorio de los datos sintéticos (se reutilizan si ya existen).')
+    parser.add_argument('--output', help='JSON de resultados. Por defecto benchmarks/results/<fecha>.json.')
+    parser.add_argument('--compare', help='JSON de una ejecución anterior con el que comparar.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Empeoramiento relativo tolerado al comparar (0.2 = 20 %%).')
+    parser.add_argument('--quandl-backend', choices=['parquet', 'index', 'memory'], default=config.QUANDL_BACKEND)
+    parser.add_argument('--merge-processes', type=int, default=config.MERGE_PROCESSES)
+    parser.add_argument('--async-pipeline', action='store_true', default=config.ASYNC_PIPELINE)
+    parser.add_argument('--yf-latency', type=float, default=0.05, help='Segundos por llamada a yfinance simulada.')
+    parser.add_argument('--yf-latency-per-symbol', type=float, default=0.0)
+    parser.add_argument('--yf-failure-rate', type=float, default=0.05,
+                        help='Fracción de símbolos sin datos en yfinance simulada.')
+    parser.add_argument('--yf-error-rate', type=float, default=0.0,
+                        help='Probabilidad de error de conexión por llamada (se reintenta).')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='Límite de símbolos por segundo (0: sin límite).')
+    parser.add_argument('--backoff', type=float, default=0.01, help='Espera base entre reintentos.')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='sp500-bench-')
+    try:
+        report = run_benchmarks(args, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Resultados guardados en '{output}'.")
+
+    over_budget = [r for r in report['results'] if r['metrics'].get('over_budget')]
+    for result in over_budget:
+        print(f"[ERROR] Arranque de la CLI fuera de presupuesto ({result['scale']}): {result['metrics']}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if regressions:
+            print(f"[ERROR] {len(regressions)} benchmarks más lentos que la referencia.")
+            sys.exit(1)
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
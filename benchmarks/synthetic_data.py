@@ -0,0 +1,179 @@
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+import config
+
+QUANDL_COLUMNS = [
+    'ticker', 'date', 'open', 'high', 'low', 'close', 'volume', 'ex-dividend', 'split_ratio',
+    'adj_open', 'adj_high', 'adj_low', 'adj_close', 'adj_volume'
+]
+
+# Último día de cotización del dataset WIKI de Quandl.
+QUANDL_LAST_DATE = '2018-03-27'
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def synthetic_tickers(n, skip=0):
+    """Genera `n` símbolos distintos (A, B, ..., Z, AA, AB, ...), saltando los `skip` primeros."""
+    tickers = []
+    for i in range(skip + 1, skip + n + 1):
+        name = ''
+        while i > 0:
+            i, rest = divmod(i - 1, 26)
+            name = chr(ord('A') + rest) + name
+        tickers.append(name)
+    return tickers
+
+
+def _ohlcv(rng, n):
+    """Serie OHLCV con un paseo aleatorio geométrico."""
+    close = rng.uniform(5, 200) * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * (1 + rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.01, n)))
+    volume = rng.integers(10_000, 10_000_000, n)
+    return open_, high, low, close, volume
+
+
+def generate_quandl_csv(path, n_tickers, years=None, rows=None, seed=0):
+    """
+    Escribe un WIKI_PRICES.csv sintético con el formato y el orden (por ticker) del
+    archivo de Kaggle.
+
+    Cerca de un 30 % de los tickers empieza a cotizar más tarde y un 20 % deja de
+    cotizar antes del final, como en los datos reales, así que el número de filas
+    es aproximado.
+
+    Args:
+        path (str): Ruta del CSV a generar.
+        n_tickers (int): Número de tickers.
+        years (float, opcional): Años de historia por ticker (hasta QUANDL_LAST_DATE).
+        rows (int, opcional): Filas totales deseadas; si se indica, se ignora `years`.
+        seed (int): Semilla del generador aleatorio.
+
+    Retorna:
+        - stats (dict): {'tickers', 'rows', 'bytes'} del archivo generado.
+    """
+    if rows is not None:
+        years = rows / (n_tickers * TRADING_DAYS_PER_YEAR)
+    n_days = max(2, int(round((years or 1) * TRADING_DAYS_PER_YEAR)))
+    dates = pd.bdate_range(end=QUANDL_LAST_DATE, periods=n_days).strftime('%Y-%m-%d').to_numpy()
+    rng = np.random.default_rng(seed)
+    total_rows = 0
+
+    with open(path, 'w', newline='') as f:
+        f.write(','.join(QUANDL_COLUMNS) + '\n')
+        for ticker in sorted(synthetic_tickers(n_tickers)):
+            start = int(rng.integers(0, n_days // 2)) if rng.random() < 0.3 else 0
+            end = int(rng.integers(max(start + 1, n_days // 2), n_days)) if rng.random() < 0.2 else n_days
+            n = end - start
+            open_, high, low, close, volume = _ohlcv(rng, n)
+            df = pd.DataFrame({
+                'ticker': ticker,
+                'date': dates[start:end],
+                'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume,
+                'ex-dividend': 0.0,
+                'split_ratio': 1.0,
+                'adj_open': open_, 'adj_high': high, 'adj_low': low, 'adj_close': close, 'adj_volume': volume
+            })
+            df.to_csv(f, header=False, index=False, float_format='%.4f', lineterminator='\n')
+            total_rows += n
+
+    return {'tickers': n_tickers, 'rows': total_rows, 'bytes': os.path.getsize(path)}
+
+
+def _format_volume(volume):
+    if volume >= 1_000_000:
+        return f"{volume / 1_000_000:.2f}M"
+    if volume >= 1_000:
+        return f"{volume / 1_000:.2f}K"
+    return f"{volume:.0f}"
+
+
+def generate_local_files(data_dir, rows, extra_files=0, seed=0):
+    """
+    Escribe los archivos locales (formato de Investing.com: fechas mm/dd/YYYY en orden
+    descendente, todo entre comillas, volumen como '1.21M' y BOM UTF-8) con `rows`
+    filas cada uno: los de config.LOCAL_FILE_MAPPING y, además, `extra_files`
+    archivos "<TICKER>.csv" de los que se descubren con config.LOCAL_FILE_GLOB.
+
+    Retorna:
+        - stats (dict): {'files', 'rows'} generados.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end='2023-03-10', periods=rows)[::-1].strftime('%m/%d/%Y')
+
+    paths = [os.path.join(data_dir, filename) for filename in config.LOCAL_FILE_MAPPING]
+    if extra_files:
+        pattern = os.path.join(data_dir, config.LOCAL_FILE_GLOB)
+        os.makedirs(os.path.dirname(pattern), exist_ok=True)
+        # Los tickers empiezan lejos de los de Quandl para no coincidir con ellos.
+        paths += [pattern.replace('*', ticker) for ticker in synthetic_tickers(extra_files, skip=20_000)]
+
+    for path in paths:
+        open_, high, low, close, volume = _ohlcv(rng, rows)
+        volumes = [_format_volume(v) for v in volume]
+        # Algunos días sin volumen, como en los archivos reales.
+        for i in np.flatnonzero(rng.random(rows) < 0.02):
+            volumes[i] = ''
+        change = np.concatenate(([0.0], close[:-1] / close[1:] - 1)) * 100
+        df = pd.DataFrame({
+            'Date': dates,
+            'Price': np.round(close, 2),
+            'Open': np.round(open_, 2),
+            'High': np.round(high, 2),
+            'Low': np.round(low, 2),
+            'Vol.': volumes,
+            'Change %': [f"{c:.2f}%" for c in change]
+        })
+        df.to_csv(path, index=False, encoding='utf-8-sig', quoting=csv.QUOTE_ALL, lineterminator='\n')
+
+    return {'files': len(paths), 'rows': rows * len(paths)}
+
+
+def generate_constituents_html(n_current, n_changes, seed=0):
+    """
+    Genera una página con las dos tablas que scrape_sp500_data lee de Wikipedia:
+    los constituyentes actuales y los cambios históricos (cabecera de dos niveles).
+
+    Los cambios se construyen hacia atrás desde la composición actual, de modo que
+    el historial es coherente (cada alta es miembro hasta su baja posterior).
+
+    Retorna:
+        - str: HTML de la página.
+    """
+    rng = np.random.default_rng(seed)
+    current = synthetic_tickers(n_current)
+    members = list(current)
+    new_names = iter(synthetic_tickers(n_changes, skip=n_current))
+    dates = pd.bdate_range(end='2025-06-30', periods=n_changes * 3)
+    change_dates = sorted(rng.choice(len(dates), n_changes, replace=False), reverse=True)
+
+    changes = []
+    for i in change_dates:
+        # Hacia atrás: el ticker añadido en esta fecha deja de ser miembro y el
+        # eliminado vuelve a serlo.
+        added = members.pop(int(rng.integers(0, len(members))))
+        removed = next(new_names)
+        members.append(removed)
+        changes.append((
+            dates[i].strftime('%B %d, %Y'), added, f"{added} Inc.", removed, f"{removed} Corp.",
+            rng.choice(['Market capitalization change.', 'Acquired by another company.', 'Spun off.'])
+        ))
+
+    df_current = pd.DataFrame({'Symbol': current, 'Security': [f"{t} Inc." for t in current]})
+    df_changes = pd.DataFrame(changes, columns=pd.MultiIndex.from_tuples([
+        ('Effective Date', 'Effective Date'), ('Added', 'Ticker'), ('Added', 'Security'),
+        ('Removed', 'Ticker'), ('Removed', 'Security'), ('Reason', 'Reason')
+    ]))
+    return (
+        "<html><body>"
+        + df_current.to_html(index=False)
+        + df_changes.to_html(index=False)
+        + "</body></html>"
+    )
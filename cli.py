@@ -0,0 +1,214 @@
+"""
+Punto de entrada único del proyecto, con un subcomando por tarea:
+
+    python cli.py build [--incremental] [--columnar] ...   (equivale a main.py)
+    python cli.py constituents [--current-only]            (manage_constituents.py)
+    python cli.py macro [--incremental] [--features]       (features/download_fred_data.py)
+    python cli.py validate [--input ...] [-v]              (data_quality.py)
+    python cli.py derived [--input ...] [--force]          (derived_features.py)
+
+Este módulo solo importa la biblioteca estándar y config: pandas, yfinance,
+requests, fredapi, etc. se importan dentro del subcomando que los usa, así que
+`--help` y los trabajos pequeños arrancan en milisegundos. Los scripts de cada
+tarea reutilizan de aquí la definición de sus argumentos.
+"""
+import argparse
+import os
+import sys
+
+import config
+
+FEATURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'features')
+
+
+def _shard_argument(text):
+    from shards import parse_shard
+    try:
+        return parse_shard(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_build_arguments(parser):
+    """Argumentos de la construcción del dataset (main.py y `cli.py build`)."""
+    parser.add_argument('-v', '--verbose', action='store_true', help='Activa el modo verbose para depuración.')
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Reutiliza la salida anterior y descarga de yfinance solo las barras nuevas de cada ticker.'
+    )
+    parser.add_argument(
+        '--retry-failed',
+        action='store_true',
+        help='Vuelve a pedir a yfinance los símbolos sin datos en ejecuciones anteriores aunque no haya vencido su espera.'
+    )
+    shard_mode = parser.add_mutually_exclusive_group()
+    shard_mode.add_argument(
+        '--shard',
+        type=_shard_argument,
+        metavar='i/N',
+        help=f'Procesa solo el shard i de N (reparto por hash del ticker) y escribe su salida en {config.SHARD_DIR}.'
+    )
+    shard_mode.add_argument(
+        '--compact',
+        type=int,
+        metavar='N',
+        help='Une las salidas de los N shards en el dataset final (sin descargar nada) y combina sus informes.'
+    )
+    parser.add_argument(
+        '--columnar',
+        action='store_true',
+        help='Genera además una copia en Parquet particionado del dataset final.'
+    )
+    parser.add_argument(
+        '--panel',
+        action='store_true',
+        help='Genera (o amplía, en modo incremental) el panel fechas x tickers con memory-map.'
+    )
+    parser.add_argument(
+        '--derived',
+        action='store_true',
+        help=f'Calcula (o amplía con las filas nuevas) rendimientos, volatilidad y volumen en dólares en {config.DERIVED_DIR}.'
+    )
+    parser.add_argument(
+        '--snapshot',
+        action='store_true',
+        help=f'Publica una instantánea versionada (por ticker, con deltas) del dataset final en {config.SNAPSHOT_DIR}.'
+    )
+    parser.add_argument(
+        '--validate',
+        action='store_true',
+        help=f'Revisa la calidad del dataset final y guarda el informe por ticker en {config.QUALITY_REPORT_PATH}.'
+    )
+    parser.add_argument(
+        '--compress',
+        choices=['gzip', 'zstd'],
+        default=config.CSV_COMPRESSION,
+        help='Guarda además una copia comprimida (.gz o .zst) del CSV final, escrita en streaming.'
+    )
+    parser.add_argument(
+        '--async-pipeline',
+        action='store_true',
+        default=config.ASYNC_PIPELINE,
+        help='Solapa descarga, unión y escritura en un pipeline asyncio con colas acotadas.'
+    )
+    parser.add_argument(
+        '--report',
+        default=config.RUN_REPORT_PATH,
+        help='Ruta del informe JSON de la ejecución (tiempos, memoria y latencias por ticker).'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=f'Perfila la ejecución con cProfile (estadísticas completas en {config.RUN_PROFILE_PATH}).'
+    )
+    parser.add_argument(
+        '--trace-memory',
+        action='store_true',
+        help='Registra con tracemalloc las líneas que más memoria reservan.'
+    )
+
+
+def add_constituents_arguments(parser):
+    """Argumentos de manage_constituents.py y `cli.py constituents`."""
+    parser.add_argument(
+        '--current-only',
+        action='store_true',
+        help="Si se establece, solo extrae y guarda los constituyentes actuales del S&P 500."
+    )
+
+
+def add_macro_arguments(parser):
+    """Argumentos de features/download_fred_data.py y `cli.py macro`."""
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Descarga solo las observaciones posteriores a la última de cada serie en el CSV guardado.'
+    )
+
+
+def add_validate_arguments(parser):
+    """Argumentos de data_quality.py y `cli.py validate`."""
+    parser.add_argument('--input', default=config.FINAL_OUTPUT_PATH, help='CSV de salida a revisar.')
+    parser.add_argument('--output', default=config.QUALITY_REPORT_PATH, help='Ruta del informe (CSV).')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Muestra el recuento de cada anomalía.')
+
+
+def add_derived_arguments(parser):
+    """Argumentos de derived_features.py y `cli.py derived`."""
+    parser.add_argument('--input', default=config.FINAL_OUTPUT_PATH, help='CSV de salida del que se derivan las series.')
+    parser.add_argument('--output', default=config.DERIVED_DIR, help='Directorio del dataset derivado (Parquet).')
+    parser.add_argument('--force', action='store_true', help='Lo recalcula todo aunque esté al día.')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Informa del progreso.')
+
+
+def _build(args):
+    import main
+    main.run(args)
+
+
+def _constituents(args):
+    from manage_constituents import generate_files
+    generate_files(args.current_only)
+
+
+def _macro(args):
+    sys.path.insert(0, FEATURES_DIR)
+    import download_fred_data
+    download_fred_data.run(args.incremental)
+    if args.features:
+        import macro_features
+        macro_features.build_macro_feature_matrix(verbose=True)
+
+
+def _validate(args):
+    from data_quality import validate_output
+    validate_output(args.input, args.output, args.verbose)
+
+
+def _derived(args):
+    from derived_features import derive_features
+    if derive_features(args.input, args.output, force=args.force, verbose=args.verbose) is None:
+        sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='cli.py', description="Dataset de precios del S&P 500 sin sesgo de supervivencia."
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True, metavar='COMANDO')
+
+    build = subparsers.add_parser('build', help='Construye (o actualiza) el dataset de precios.')
+    add_build_arguments(build)
+    build.set_defaults(handler=_build)
+
+    constituents = subparsers.add_parser('constituents', help='Descarga los constituyentes y cambios de Wikipedia.')
+    add_constituents_arguments(constituents)
+    constituents.set_defaults(handler=_constituents)
+
+    macro = subparsers.add_parser('macro', help='Descarga las series macroeconómicas de FRED.')
+    add_macro_arguments(macro)
+    macro.add_argument(
+        '--features',
+        action='store_true',
+        help='Genera además la matriz point-in-time de series macro (features/macro_features.py).'
+    )
+    macro.set_defaults(handler=_macro)
+
+    validate = subparsers.add_parser('validate', help='Revisa la calidad del dataset de precios.')
+    add_validate_arguments(validate)
+    validate.set_defaults(handler=_validate)
+
+    derived = subparsers.add_parser('derived', help='Calcula rendimientos, volatilidad y volumen en dólares.')
+    add_derived_arguments(derived)
+    derived.set_defaults(handler=_derived)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import os
+import shutil
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import config
+from manifest import load_manifest, manifest_path_for
+from utils import write_json_atomic
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Adj Close']
+
+OUTPUT_SCHEMA = pa.schema([
+    ('ticker', pa.dictionary(pa.int32(), pa.string())),
+    ('date', pa.date32()),
+    ('Open', pa.float64()),
+    ('High', pa.float64()),
+    ('Low', pa.float64()),
+    ('Adj Close', pa.float64()),
+    ('Volume', pa.int64()),
+])
+
+PARTITION_FIELDS = {
+    'ticker': pa.field('ticker', pa.dictionary(pa.int32(), pa.string())),
+    'year': pa.field('year', pa.int16()),
+}
+
+STATS_FILE_NAME = '_partitions.json'
+
+
+def _read_csv_block(csv_path, header, start, end):
+    """Lee las filas de un ticker del CSV de salida a partir de su rango de bytes."""
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    dtypes = {col: 'float64' for col in PRICE_COLUMNS + ['Volume']}
+    dtypes['ticker'] = 'str'
+    return pd.read_csv(BytesIO(header + data), dtype=dtypes, parse_dates=['date'])
+
+
+def _to_record_batch(df, partitioning):
+    """Convierte las filas de un ticker al esquema columnar (más las columnas de partición)."""
+    df['Volume'] = df['Volume'].round().astype('Int64')
+    schema = OUTPUT_SCHEMA
+    if 'year' in partitioning:
+        df['year'] = df['date'].dt.year.astype('int16')
+        schema = schema.append(PARTITION_FIELDS['year'])
+    return pa.RecordBatch.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+def _update_partition_stats(stats, df, partitioning):
+    """Acumula filas, tickers y rango de fechas de cada partición tocada por `df`."""
+    keys = [df['ticker'] if field == 'ticker' else df['date'].dt.year.rename('year') for field in partitioning]
+    if keys:
+        summary = df.groupby(keys, sort=False)['date'].agg(['size', 'min', 'max'])
+    else:
+        summary = pd.DataFrame({'size': [len(df)], 'min': [df['date'].min()], 'max': [df['date'].max()]}, index=[()])
+
+    for key, row in summary.iterrows():
+        key = key if isinstance(key, tuple) else (key,)
+        name = '/'.join(f"{field}={value}" for field, value in zip(partitioning, key))
+        part = stats.setdefault(name, {'rows': 0, 'tickers': 0, 'date_min': None, 'date_max': None})
+        date_min = row['min'].strftime('%Y-%m-%d')
+        date_max = row['max'].strftime('%Y-%m-%d')
+        part['rows'] += int(row['size'])
+        part['tickers'] += 1
+        part['date_min'] = date_min if part['date_min'] is None else min(part['date_min'], date_min)
+        part['date_max'] = date_max if part['date_max'] is None else max(part['date_max'], date_max)
+
+
+def write_columnar_output(csv_path, output_dir, partitioning=None, verbose=False):
+    """
+    Escribe el dataset final en formato Parquet particionado (estilo Hive) junto al CSV.
+
+    Las filas se leen ticker a ticker usando los rangos de bytes del manifiesto del CSV,
+    así que la memoria queda acotada por el ticker más grande. El ticker se guarda
+    como columna de diccionario, la fecha como date32 y los precios y el volumen con
+    tipos numéricos; cada archivo lleva estadísticas min/max por row group y se genera
+    además un resumen por partición (STATS_FILE_NAME) con filas y rango de fechas.
+
+    Args:
+        csv_path (str): Ruta al CSV de salida (debe tener un manifiesto completo).
+        output_dir (str): Directorio del dataset Parquet. Se reemplaza entero.
+        partitioning (tuple, opcional): Campos de partición ("ticker" y/o "year").
+                                        Por defecto config.COLUMNAR_PARTITIONING.
+        verbose (bool): Si es True, informa del progreso.
+
+    Retorna:
+        - stats (dict): Estadísticas por partición, o None si falla.
+    """
+    if partitioning is None:
+        partitioning = config.COLUMNAR_PARTITIONING
+    partitioning = tuple(partitioning)
+
+    manifest = load_manifest(manifest_path_for(csv_path))
+    if manifest is None or not manifest['complete']:
+        print(f"[ERROR] No hay un manifiesto completo para {csv_path}; no se genera la salida columnar.")
+        return None
+
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+
+    stats = {}
+    entries = sorted(manifest['tickers'].values(), key=lambda e: e['start'])
+
+    def batches():
+        for entry in entries:
+            df = _read_csv_block(csv_path, header, entry['start'], entry['end'])
+            if df.empty:
+                continue
+            _update_partition_stats(stats, df, partitioning)
+            yield _to_record_batch(df, partitioning)
+
+    schema = OUTPUT_SCHEMA
+    if 'year' in partitioning:
+        schema = schema.append(PARTITION_FIELDS['year'])
+    partition_schema = pa.schema([PARTITION_FIELDS[field] for field in partitioning])
+
+    tmp_dir = output_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    try:
+        parquet_format = ds.ParquetFileFormat()
+        ds.write_dataset(
+            batches(),
+            tmp_dir,
+            schema=schema,
+            format=parquet_format,
+            partitioning=ds.partitioning(partition_schema, flavor='hive') if partitioning else None,
+            file_options=parquet_format.make_write_options(compression=config.COLUMNAR_COMPRESSION),
+            min_rows_per_group=config.COLUMNAR_ROWS_PER_GROUP,
+            max_rows_per_group=config.COLUMNAR_ROWS_PER_GROUP,
+            max_partitions=4096,
+            existing_data_behavior='error'
+        )
+        write_json_atomic(os.path.join(tmp_dir, STATS_FILE_NAME), {
+            'partitioning': list(partitioning),
+            'partitions': stats
+        })
+
+        old_dir = output_dir + '.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(output_dir):
+            os.replace(output_dir, old_dir)
+        os.replace(tmp_dir, output_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        if verbose:
+            print(f"[INFO] Salida columnar guardada en '{output_dir}' ({len(stats)} particiones).")
+        return stats
+
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"[ERROR] No se pudo generar la salida columnar: {e}")
+        return None
@@ -4,12 +4,143 @@ DATA_DIR = "data"
 
 QUANDL_FILE_PATH = os.path.join(DATA_DIR, "WIKI_PRICES.csv")
 
+# Lectura por bloques de WIKI_PRICES.csv: memoria máxima (aprox.) de cada bloque
+# y si los precios se guardan en float32 en lugar de float64.
+QUANDL_MEMORY_BUDGET_MB = 256
+QUANDL_FLOAT32_PRICES = False
+
+# Origen de los datos de Quandl en main.py:
+#   "parquet": caché columnar en disco (se genera en la primera ejecución).
+#   "index": índice de bytes por ticker sobre el CSV original, sin segunda copia.
+#   "memory": carga completa del CSV en un diccionario.
+QUANDL_BACKEND = "parquet"
+QUANDL_CACHE_DIR = os.path.join(DATA_DIR, "cache", "quandl")
+QUANDL_INDEX_PATH = QUANDL_FILE_PATH + ".idx.json"
+
 CONSTITUENTS_PATH = os.path.join(DATA_DIR, "sp500_constituents.csv")
 HISTORICAL_CHANGES_PATH = os.path.join(DATA_DIR, "sp500_historical_changes.csv")
 TICKER_DATES_PATH = os.path.join(DATA_DIR, "sp500_ticker_dates.csv")
+MEMBERSHIP_INTERVALS_PATH = os.path.join(DATA_DIR, "sp500_membership_intervals.csv")
 
 FINAL_OUTPUT_PATH = os.path.join(DATA_DIR, "sp500_precios_completos.csv")
 
+# Archivos locales con el formato de Investing.com para tickers sin datos en Quandl
+# ni en yfinance. LOCAL_FILE_MAPPING asocia nombres de archivo (en DATA_DIR) a su
+# ticker; además se cargan los archivos que encajen con LOCAL_FILE_GLOB (relativo a
+# DATA_DIR), cuyo ticker es el nombre del archivo sin extensión (p. ej. "AV.csv").
+LOCAL_FILE_MAPPING = {
+    "Avaya Stock Price History.csv": "AV",
+    "Catalent Inc Stock Price History.csv": "CTLT",
+    "First Data Corp Stock Price History.csv": "FDC",
+    "NYSE Euronext Stock Price History.csv": "NYX"
+}
+LOCAL_FILE_GLOB = os.path.join("local", "*.csv")
+LOCAL_MAX_WORKERS = 4
+
+# Construcción repartida (main.py --shard i/N): cada shard escribe su salida, su
+# manifiesto (con sus fallidos) y su informe en SHARD_DIR, y main.py --compact N
+# los une en FINAL_OUTPUT_PATH.
+SHARD_DIR = os.path.join(DATA_DIR, "shards")
+
+# Cada cuántos tickers se guarda un checkpoint de la salida en curso.
+CHECKPOINT_EVERY = 25
+
+# Escritura del CSV de salida (csv_writer.py): los bloques de los tickers se
+# acumulan y se escriben de CSV_WRITE_BATCH_BYTES en CSV_WRITE_BATCH_BYTES. Con
+# CSV_COMPRESSION ("gzip" o "zstd", o main.py --compress) se guarda además una copia
+# comprimida junto al CSV; None para no generarla.
+CSV_WRITE_BATCH_BYTES = 16 * 1024 * 1024
+CSV_COMPRESSION = None
+
+# Informe de cada ejecución de main.py (tiempos y memoria por etapa, latencias por
+# ticker, bytes y filas escritos) y estadísticas de cProfile con --profile.
+RUN_REPORT_PATH = os.path.join(DATA_DIR, "run_report.json")
+RUN_PROFILE_PATH = os.path.join(DATA_DIR, "run_profile.prof")
+
+# Salida columnar (Parquet particionado) generada junto al CSV con --columnar.
+# COLUMNAR_PARTITIONING admite "ticker" y/o "year".
+COLUMNAR_OUTPUT_DIR = os.path.join(DATA_DIR, "sp500_precios_completos_parquet")
+COLUMNAR_PARTITIONING = ("year",)
+COLUMNAR_COMPRESSION = "zstd"
+COLUMNAR_ROWS_PER_GROUP = 128 * 1024
+
+# Panel fechas × tickers (un .npy con memory-map por campo) generado con --panel.
+PANEL_DIR = os.path.join(DATA_DIR, "sp500_panel")
+PANEL_DTYPE = "float64"
+
+# Series derivadas (main.py --derived, derived_features.py): rendimientos simple y
+# logarítmico, volatilidad móvil (desviación típica de los rendimientos log. de las
+# últimas DERIVED_VOLATILITY_WINDOW barras, con al menos
+# DERIVED_VOLATILITY_MIN_PERIODS válidos) y volumen en dólares. Las actualizaciones
+# incrementales se añaden como partes del dataset; al pasar de DERIVED_MAX_PARTS se
+# compactan en una sola.
+DERIVED_DIR = os.path.join(DATA_DIR, "sp500_derived")
+DERIVED_VOLATILITY_WINDOW = 21
+DERIVED_VOLATILITY_MIN_PERIODS = 15
+DERIVED_MAX_PARTS = 32
+
+# Instantáneas versionadas del CSV de salida (main.py --snapshot, snapshots.py):
+# cada ticker se guarda una vez por contenido (hash SHA-256) junto con un delta de
+# las filas añadidas o modificadas respecto a la versión anterior. Se conservan
+# las SNAPSHOT_KEEP_VERSIONS últimas versiones. Compresión: "gzip" o "none".
+SNAPSHOT_DIR = os.path.join(DATA_DIR, "snapshots")
+SNAPSHOT_COMPRESSION = "gzip"
+SNAPSHOT_KEEP_VERSIONS = 7
+
+# Validación de la salida (data_quality.py, main.py --validate): informe de
+# anomalías por ticker y calendario de sesiones deducido de los propios datos (un
+# día es hábil si cotiza al menos QUALITY_CALENDAR_MIN_SHARE de los tickers vivos).
+# Un salto en la unión Quandl/yfinance es anómalo si su rendimiento logarítmico
+# supera QUALITY_SEAM_MAX_RETURN o QUALITY_SEAM_ZSCORE desviaciones robustas del
+# ticker; QUALITY_JUMP_RETURN marca los saltos en cualquier otra fecha.
+QUALITY_REPORT_PATH = os.path.join(DATA_DIR, "sp500_quality_report.csv")
+QUALITY_CALENDAR_PATH = os.path.join(DATA_DIR, "cache", "trading_calendar.npz")
+QUALITY_CALENDAR_MIN_SHARE = 0.5
+QUALITY_SEAM_MAX_RETURN = 0.25
+QUALITY_SEAM_ZSCORE = 8.0
+QUALITY_JUMP_RETURN = 0.5
+# Último día del dataset WIKI de Quandl: unión supuesta cuando el manifiesto no la registra.
+QUANDL_LAST_DATE = "2018-03-27"
+
+# Procesos que unen y convierten a CSV los datos de cada ticker en paralelo
+# (la escritura sigue siendo secuencial y en orden). 0 o 1: sin pool.
+MERGE_PROCESSES = 4
+
+# Pipeline asyncio (main.py --async-pipeline): la descarga, la unión y la escritura
+# se solapan, unidas por colas de como mucho ASYNC_QUEUE_SIZE tickers.
+ASYNC_PIPELINE = False
+ASYNC_QUEUE_SIZE = 64
+
+# Descarga de yfinance: lotes de símbolos con la misma fecha de inicio, ejecutados
+# en un pool de hilos, con un límite global de símbolos por segundo y reintentos
+# con espera exponencial ante fallos transitorios.
+YF_MAX_WORKERS = 4
+YF_BATCH_SIZE = 20
+YF_RATE_LIMIT_PER_SEC = 5.0
+YF_MAX_RETRIES = 3
+YF_BACKOFF_SECONDS = 2.0
+
+# Registro de resolución de tickers (resolution_store.py): fuente y símbolo con los
+# que salió cada ticker. Los tickers sin datos locales ni de Quandl cuyo símbolo no
+# devolvió nada en yfinance no se vuelven a pedir hasta pasados RESOLUTION_RETRY_DAYS
+# días (el doble tras cada fallo seguido, hasta RESOLUTION_MAX_RETRY_DAYS); main.py
+# --retry-failed los pide igualmente. Con RESOLUTION_STORE_PATH = None no se usa.
+RESOLUTION_STORE_PATH = os.path.join(DATA_DIR, "cache", "ticker_resolution.json")
+RESOLUTION_RETRY_DAYS = 7
+RESOLUTION_MAX_RETRY_DAYS = 90
+
+# Caché en disco de las respuestas de Wikipedia, yfinance y FRED.
+# Modos: "normal" (TTL por fuente), "record" (siempre descarga y guarda),
+# "replay" (sin red, solo respuestas guardadas) y "off".
+HTTP_CACHE_DIR = os.path.join(DATA_DIR, "cache", "http")
+HTTP_CACHE_MODE = os.environ.get("HTTP_CACHE_MODE", "normal")
+HTTP_CACHE_MAX_MB = 1024
+HTTP_CACHE_TTL_SECONDS = {
+    "wikipedia": 24 * 3600,
+    "yfinance": 12 * 3600,
+    "fred": 24 * 3600
+}
+
 WIKIPEDIA_URL = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
 REQUEST_HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
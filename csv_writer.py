@@ -0,0 +1,262 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import config
+
+# Caracteres que obligan al módulo csv (QUOTE_MINIMAL) a entrecomillar un campo.
+_QUOTE_CHARS = (',', '"', '\n', '\r')
+
+# Con un solo DataFrame de menos filas, to_csv es más rápido que montarlo con pyarrow.
+_MIN_BATCH_ROWS = 100
+
+# Extensión del archivo comprimido según config.CSV_COMPRESSION.
+COMPRESSED_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _format_float64(array):
+    """
+    Texto de cada valor float64 igual que astype(str) (la representación más corta que
+    conserva el valor, como repr), con '' en los NaN.
+
+    pyarrow convierte a texto unas diez veces más rápido que NumPy y da los mismos
+    dígitos, pero escribe los enteros sin '.0' y usa notación exponencial con otros
+    umbrales. Por eso se le añade '.0' a los enteros y los valores que Python no
+    escribe en notación decimal (fuera de [1e-4, 1e16)) o con exponente en pyarrow
+    se convierten con NumPy, que son muy pocos en precios y volúmenes.
+    """
+    text = pc.cast(pa.array(array, pa.float64()), pa.string())
+    magnitude = np.abs(array)
+    with np.errstate(invalid='ignore'):
+        exceptional = ~np.isfinite(array) | (magnitude >= 1e16) | ((magnitude < 1e-4) & (array != 0))
+    exceptional |= pc.match_substring(text, 'e').to_numpy(zero_copy_only=False)
+    integral = ~exceptional & ~pc.match_substring(text, '.').to_numpy(zero_copy_only=False)
+    if integral.any():
+        text = pc.if_else(integral, pc.binary_join_element_wise(text, '.0', ''), text)
+    if exceptional.any():
+        replacements = array[exceptional].astype(str).astype(object)
+        replacements[np.isnan(array[exceptional])] = ''
+        text = pc.replace_with_mask(text, pa.array(exceptional), pa.array(replacements, pa.string()))
+    return text
+
+
+def _format_column(values):
+    """
+    Texto de cada celda de una columna tal como lo escribe DataFrame.to_csv (sin
+    float_format ni date_format, con na_rep=''), o None si su tipo no está cubierto.
+
+    Los números (también los enteros y decimales con nulos de pandas) salen como con
+    astype(str), igual que en pandas; las fechas sin hora, como 'YYYY-MM-DD'; las
+    columnas de texto se aceptan si ningún valor necesita comillas.
+
+    Retorna:
+        - pa.StringArray, o None.
+    """
+    dtype = values.dtype
+    if not isinstance(dtype, np.dtype) and not isinstance(dtype, pd.StringDtype):
+        # Tipos con nulos de pandas (Int64, Float64...): to_csv escribe str() de cada
+        # valor y '' en los nulos, que es lo mismo que su versión NumPy.
+        if dtype.kind in 'iu':
+            return pc.fill_null(pc.cast(pa.array(values), pa.string()), '')
+        if dtype.kind == 'f' and dtype.itemsize == 8:
+            return _format_float64(values.to_numpy(dtype='float64', na_value=np.nan))
+        return None
+
+    if dtype == np.float64:
+        return _format_float64(values.to_numpy())
+
+    if dtype.kind in 'fb':
+        array = values.to_numpy()
+        formatted = array.astype(str).astype(object)
+        if dtype.kind == 'f':
+            formatted[np.isnan(array)] = ''
+        return pa.array(formatted, pa.string())
+
+    if dtype.kind in 'iu':
+        return pc.cast(pa.array(values.to_numpy()), pa.string())
+
+    if dtype.kind == 'M':
+        array = values.to_numpy()
+        mask = np.isnat(array)
+        days = array.astype('datetime64[D]')
+        if (array[~mask] != days[~mask]).any():
+            return None
+        formatted = pc.cast(pa.array(days), pa.string())
+        return pc.fill_null(formatted, '') if mask.any() else formatted
+
+    if dtype == object or isinstance(dtype, pd.StringDtype):
+        array = values.to_numpy(dtype=object, na_value=None)
+        mask = pd.isna(values).to_numpy()
+        unique = pd.unique(array[~mask])
+        if not all(isinstance(value, str) and not any(c in value for c in _QUOTE_CHARS) for value in unique):
+            return None
+        if len(unique) == 1 and not mask.any():
+            return pa.array(np.full(len(array), unique[0], dtype=object), pa.string())
+        array = array.copy()
+        array[mask] = ''
+        return pa.array(array, pa.string())
+
+    return None
+
+
+def _join_rows(columns):
+    """Une columnas de texto en líneas CSV; retorna (datos, desplazamientos de cada línea)."""
+    rows = pc.binary_join_element_wise(*columns, ',')
+    lines = pc.binary_join_element_wise(rows, '', os.linesep)
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32, count=len(lines) + 1, offset=lines.offset * 4)
+    return lines.buffers()[2], offsets
+
+
+def _encode_group(frames):
+    """
+    Codifica varios DataFrames con las mismas columnas y tipos en un solo lote (con
+    to_csv si es uno solo de menos de _MIN_BATCH_ROWS filas).
+
+    Retorna:
+        - list: Bytes de cada DataFrame, o None si algún tipo no está cubierto.
+    """
+    if len(frames) == 1 and len(frames[0]) < _MIN_BATCH_ROWS:
+        return [frames[0].to_csv(header=False, index=False).encode('utf-8')]
+
+    batch = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    columns = []
+    for name in batch.columns:
+        formatted = _format_column(batch[name])
+        if formatted is None:
+            return None
+        columns.append(formatted)
+
+    data, offsets = _join_rows(columns)
+    bounds = offsets[np.concatenate(([0], np.cumsum([len(frame) for frame in frames])))]
+    return [data.slice(start, end - start).to_pybytes() for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def encode_frames(frames):
+    """
+    Codifica las filas de varios DataFrames como texto CSV (sin cabecera ni índice),
+    con los mismos bytes que df.to_csv(header=False, index=False) para cada uno.
+
+    Los DataFrames con las mismas columnas y tipos se concatenan y cada columna se
+    formatea de una vez con pyarrow o NumPy; las filas se montan con un único cruce de
+    pyarrow (binary_join_element_wise) y se reparten por los desplazamientos de cada
+    línea. Así, muchos bloques pequeños (p. ej. las barras nuevas de cada ticker en
+    una ejecución incremental) cuestan como uno grande. Los que tengan columnas de
+    tipos no cubiertos por _format_column se codifican uno a uno, y si aún así no
+    encajan, con to_csv.
+
+    Retorna:
+        - list: Bytes (UTF-8, líneas terminadas en os.linesep) de cada DataFrame.
+    """
+    encoded = [b''] * len(frames)
+    groups = {}
+    for i, frame in enumerate(frames):
+        if not frame.empty:
+            groups.setdefault(tuple(zip(frame.columns, frame.dtypes.tolist())), []).append(i)
+
+    for indices in groups.values():
+        group = [frames[i] for i in indices]
+        results = _encode_group(group) if len(group) > 1 else None
+        for i, data in zip(indices, results or [encode_frame(frame) for frame in group]):
+            encoded[i] = data
+    return encoded
+
+
+def encode_frame(df):
+    """Codifica un DataFrame como df.to_csv(header=False, index=False) (ver encode_frames)."""
+    if df.empty:
+        return b''
+    encoded = _encode_group([df])
+    return encoded[0] if encoded is not None else df.to_csv(header=False, index=False).encode('utf-8')
+
+
+class CsvBatchWriter:
+    """
+    Envoltorio del archivo de salida que acumula los bloques de varios tickers y los
+    escribe en una sola llamada cada `batch_bytes` (por defecto
+    config.CSV_WRITE_BATCH_BYTES), en lugar de una o dos escrituras por ticker.
+
+    tell() devuelve la posición lógica (lo escrito más lo pendiente), así que los
+    rangos de bytes del manifiesto se calculan igual que sobre el archivo.
+    rollback() descarta lo escrito desde una posición, esté ya en disco o no, y
+    flush() vacía el búfer antes de cada checkpoint.
+    """
+
+    def __init__(self, f, batch_bytes=None):
+        self.f = f
+        self.batch_bytes = config.CSV_WRITE_BATCH_BYTES if batch_bytes is None else batch_bytes
+        self._chunks = []
+        self._flushed = f.tell()
+        self._position = self._flushed
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        if data:
+            self._chunks.append(data)
+            self._position += len(data)
+            if self._position - self._flushed >= self.batch_bytes:
+                self._write_pending()
+        return len(data)
+
+    def _write_pending(self):
+        if self._chunks:
+            self.f.write(b''.join(self._chunks))
+            self._chunks = []
+            self._flushed = self._position
+
+    def rollback(self, position):
+        """Descarta todo lo escrito a partir de `position`."""
+        if position >= self._flushed:
+            kept = b''.join(self._chunks)[:position - self._flushed]
+            self._chunks = [kept] if kept else []
+        else:
+            self._chunks = []
+            self.f.seek(position)
+            self.f.truncate()
+            self._flushed = position
+        self._position = position
+
+    def flush(self):
+        self._write_pending()
+        self.f.flush()
+
+    def fileno(self):
+        return self.f.fileno()
+
+
+def compress_output(csv_path, compression=None, output_path=None, verbose=False):
+    """
+    Copia comprimida del CSV de salida para los consumidores que lo descargan
+    entero, escrita en streaming por bloques con pyarrow (sin cargarlo en memoria).
+    El CSV sin comprimir se mantiene: el manifiesto, las ejecuciones incrementales y
+    las consultas por ticker leen sus rangos de bytes.
+
+    Args:
+        compression (str, opcional): "gzip" o "zstd". Por defecto config.CSV_COMPRESSION.
+        output_path (str, opcional): Por defecto csv_path más la extensión de COMPRESSED_EXTENSIONS.
+
+    Retorna:
+        - str: Ruta del archivo comprimido, o None si falla.
+    """
+    compression = compression or config.CSV_COMPRESSION
+    if compression not in COMPRESSED_EXTENSIONS:
+        print(f"[ERROR] Compresión no soportada: {compression}. Opciones: {sorted(COMPRESSED_EXTENSIONS)}")
+        return None
+    output_path = output_path or csv_path + COMPRESSED_EXTENSIONS[compression]
+    tmp_path = output_path + '.tmp'
+    try:
+        with open(csv_path, 'rb') as src, pa.CompressedOutputStream(tmp_path, compression) as out:
+            while chunk := src.read(config.CSV_WRITE_BATCH_BYTES):
+                out.write(chunk)
+        os.replace(tmp_path, output_path)
+    except (OSError, pa.ArrowException) as e:
+        print(f"[ERROR] No se pudo comprimir {csv_path}: {e}")
+        return None
+    if verbose:
+        print(f"[INFO] Copia {compression} de la salida guardada en '{output_path}' "
+              f"({os.path.getsize(output_path) / os.path.getsize(csv_path):.1%} del tamaño original).")
+    return output_path
@@ -1,12 +1,17 @@
-import pandas as pd
-import requests
-import sys
-import yfinance as yf
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import StringIO
-import os
+
+import numpy as np
+import pandas as pd
 
 import config
-from utils import categorize_change
+from http_cache import get_response_cache
+from run_report import get_run_report
+from utils import categorize_change, RateLimiter
 
 def scrape_sp500_data():
     """
@@ -19,9 +24,9 @@ def scrape_sp500_data():
         - set: Un conjunto (set) de todos los tickers que alguna vez han estado en el índice.
     """
     try:
-        response = requests.get(config.WIKIPEDIA_URL, headers=config.REQUEST_HEADERS)
-        response.raise_for_status()
-        html_content = response.text
+        html_content = get_response_cache().get_text(
+            'wikipedia', config.WIKIPEDIA_URL, headers=config.REQUEST_HEADERS
+        )
 
         tables = pd.read_html(StringIO(html_content))
         df_current = tables[0]
@@ -66,34 +71,119 @@ def scrape_sp500_data():
         print(f"Error scraping Wikipedia data: {e}")
         return None, None, None
 
-def load_and_preprocess_quandl(csv_path):
+QUANDL_COLUMN_MAP = {
+    'adj_open': 'Open',
+    'adj_high': 'High',
+    'adj_low': 'Low',
+    'adj_close': 'Adj Close',
+    'adj_volume': 'Volume'
+}
+
+# Bytes estimados por fila durante el parseo (texto + columnas ya convertidas).
+QUANDL_BYTES_PER_ROW = 200
+
+
+def quandl_read_csv_kwargs(float32_prices=None):
+    """
+    Argumentos de pd.read_csv para leer WIKI_PRICES.csv con tipos compactos.
+
+    Args:
+        float32_prices (bool, opcional): Si es True, los precios se leen en float32.
+                                         Por defecto config.QUANDL_FLOAT32_PRICES.
+    """
+    if float32_prices is None:
+        float32_prices = config.QUANDL_FLOAT32_PRICES
+
+    price_dtype = 'float32' if float32_prices else 'float64'
+    dtypes = {'ticker': 'category', 'adj_volume': 'float64'}
+    dtypes.update({col: price_dtype for col in ['adj_open', 'adj_high', 'adj_low', 'adj_close']})
+    return {
+        'usecols': ['ticker', 'date'] + list(QUANDL_COLUMN_MAP),
+        'dtype': dtypes,
+        'parse_dates': ['date']
+    }
+
+
+def quandl_ticker_frame(parts):
+    """
+    Une los trozos de un mismo ticker y los deja con el formato que espera el pipeline
+    (índice 'date', columnas renombradas y volumen entero).
+    """
+    df = pd.concat(parts) if len(parts) > 1 else parts[0]
+    df = df.rename(columns=QUANDL_COLUMN_MAP).set_index('date')
+    df['Volume'] = df['Volume'].round().astype('Int64')
+    return df
+
+
+def iter_quandl_tickers(csv_path, tickers=None, memory_budget_mb=None, float32_prices=None):
+    """
+    Lee WIKI_PRICES.csv por bloques y produce un DataFrame por ticker a medida que
+    se completa, sin materializar nunca el archivo entero.
+
+    El archivo de Quandl viene ordenado por ticker, así que un ticker está completo
+    en cuanto aparece el siguiente. La memoria pico queda acotada por el tamaño del
+    bloque (derivado de `memory_budget_mb`) más el ticker en curso.
+
+    Args:
+        csv_path (str): Ruta al archivo WIKI_PRICES.csv
+        tickers (set, opcional): Si se indica, solo se producen estos tickers.
+        memory_budget_mb (int, opcional): Memoria aproximada por bloque. Por defecto
+                                          config.QUANDL_MEMORY_BUDGET_MB.
+        float32_prices (bool, opcional): Si es True, los precios se guardan en float32.
+                                         Por defecto config.QUANDL_FLOAT32_PRICES.
+
+    Produce:
+        - (ticker, DataFrame): Tupla con el ticker y sus datos indexados por 'date'.
+    """
+    if memory_budget_mb is None:
+        memory_budget_mb = config.QUANDL_MEMORY_BUDGET_MB
+    chunksize = max(1, int(memory_budget_mb * 1024 * 1024 / QUANDL_BYTES_PER_ROW))
+
+    reader = pd.read_csv(csv_path, chunksize=chunksize, **quandl_read_csv_kwargs(float32_prices))
+
+    pending_ticker = None
+    pending_parts = []
+
+    with reader:
+        for chunk in reader:
+            codes = chunk['ticker'].cat.codes.to_numpy()
+            categories = chunk['ticker'].cat.categories
+            bounds = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1, [len(chunk)]))
+
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                ticker = categories[codes[start]]
+                if ticker != pending_ticker:
+                    if pending_parts:
+                        yield pending_ticker, quandl_ticker_frame(pending_parts)
+                    pending_ticker = ticker
+                    pending_parts = []
+                if tickers is None or ticker in tickers:
+                    pending_parts.append(chunk.iloc[start:end])
+
+    if pending_parts:
+        yield pending_ticker, quandl_ticker_frame(pending_parts)
+
+
+def load_and_preprocess_quandl(csv_path, tickers=None):
     """
     Carga y pre-procesa el archivo CSV masivo de Quandl en un diccionario
-    para acceso rápido.
+    para acceso rápido. La lectura se hace por bloques con tipos compactos
+    (ver iter_quandl_tickers).
     
     Args:
         csv_path (str): Ruta al archivo WIKI_PRICES.csv
+        tickers (set, opcional): Si se indica, solo se conservan estos tickers.
         
     Retorna:
         - quandl_data_dict (dict): Diccionario donde {ticker: DataFrame}
     """
     try:
-        df_quandl = pd.read_csv(
-            csv_path,
-            parse_dates=['date'],
-            usecols=['ticker', 'date', 'adj_open', 'adj_high', 'adj_low', 'adj_close', 'adj_volume']
-        )
-        df_quandl.rename(columns={
-            'adj_open': 'Open',
-            'adj_high': 'High',
-            'adj_low': 'Low',
-            'adj_close': 'Adj Close',
-            'adj_volume': 'Volume'
-        }, inplace=True)
-        
-        df_quandl.set_index('date', inplace=True) 
-        
-        quandl_data_dict = dict(tuple(df_quandl.groupby('ticker')))
+        quandl_data_dict = {}
+        for ticker, df in iter_quandl_tickers(csv_path, tickers=tickers):
+            if ticker in quandl_data_dict:
+                # El archivo no estaba ordenado por ticker: se juntan ambos tramos.
+                df = pd.concat([quandl_data_dict[ticker], df]).sort_index()
+            quandl_data_dict[ticker] = df
         
         return quandl_data_dict
         
@@ -102,6 +192,211 @@ def load_and_preprocess_quandl(csv_path):
     except Exception as e:
         return None
 
+YFINANCE_COLUMNS = ['Open', 'High', 'Low', 'Adj Close', 'Volume']
+
+# Fragmentos de mensajes de yfinance que indican un fallo transitorio (se reintenta).
+YFINANCE_TRANSIENT_ERRORS = ('ratelimit', 'rate limit', 'too many requests', 'timed out', 'timeout', 'connection')
+
+_yfinance_rate_limiter = None
+_yfinance_rate_limiter_lock = threading.Lock()
+
+
+class _YFinanceLogCapture(logging.Handler):
+    """Guarda los mensajes del logger de yfinance emitidos por el hilo que lo creó."""
+
+    def __init__(self):
+        super().__init__()
+        self.thread_id = threading.get_ident()
+        self.messages = []
+
+    def emit(self, record):
+        if record.thread == self.thread_id:
+            self.messages.append(record.getMessage())
+
+
+@contextmanager
+def capture_yfinance_logs():
+    """
+    Captura los mensajes de yfinance de la llamada en curso. Mientras el handler
+    está registrado, los mensajes no llegan a stderr; cada hilo solo ve los suyos.
+
+    Produce:
+        - list: Lista (que se va llenando) con los mensajes capturados.
+    """
+    logger = logging.getLogger('yfinance')
+    handler = _YFinanceLogCapture()
+    logger.addHandler(handler)
+    try:
+        yield handler.messages
+    finally:
+        logger.removeHandler(handler)
+
+
+def get_yfinance_rate_limiter():
+    """Devuelve el limitador de tasa global para yfinance (config.YF_RATE_LIMIT_PER_SEC)."""
+    global _yfinance_rate_limiter
+    with _yfinance_rate_limiter_lock:
+        if _yfinance_rate_limiter is None:
+            _yfinance_rate_limiter = RateLimiter(config.YF_RATE_LIMIT_PER_SEC)
+        return _yfinance_rate_limiter
+
+
+def _yfinance_start_str(start_date):
+    """La descarga empieza el día siguiente a la última fecha disponible."""
+    return (pd.to_datetime(start_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def _normalize_yfinance_frame(df):
+    """Deja el DataFrame de un ticker con índice 'date' y las columnas del pipeline."""
+    if df is None:
+        return None
+    df = df.dropna(how='all')
+    if df.empty:
+        return None
+    df = df[YFINANCE_COLUMNS].copy()
+    df.columns.name = None
+    df.index.name = 'date'
+    return df
+
+
+def _download_yfinance_batch(tickers, start_date_str, verbose=False):
+    """
+    Descarga un lote de tickers que comparten fecha de inicio en una sola llamada
+    a yf.download, con límite de tasa global y reintentos con espera exponencial
+    para los fallos transitorios.
+
+    Retorna:
+        - (results, transient): {ticker: DataFrame o None} y los tickers que siguen sin
+          datos tras agotar los reintentos de un fallo transitorio.
+    """
+    # yfinance tarda en importarse; solo lo necesitan las descargas (no, p. ej.,
+    # manage_constituents.py).
+    import yfinance as yf
+
+    results = {ticker: None for ticker in tickers}
+    pending = list(dict.fromkeys(tickers))
+    limiter = get_yfinance_rate_limiter()
+    report = get_run_report()
+
+    for attempt in range(config.YF_MAX_RETRIES + 1):
+        if attempt > 0:
+            report.count('yfinance_retries')
+            time.sleep(config.YF_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+        wait_start = time.perf_counter()
+        limiter.acquire(len(pending))
+        report.count('yfinance_rate_limit_wait_seconds', time.perf_counter() - wait_start)
+        report.count('yfinance_calls')
+        report.count('yfinance_symbols_requested', len(pending))
+        raised = None
+        call_start = time.perf_counter()
+        with capture_yfinance_logs() as messages:
+            try:
+                df = yf.download(
+                    pending,
+                    start=start_date_str,
+                    auto_adjust=False,
+                    progress=False,
+                    threads=False,
+                    group_by='ticker'
+                )
+            except Exception as e:
+                df = None
+                raised = e
+        report.observe('yfinance_call', time.perf_counter() - call_start)
+
+        if verbose:
+            for message in messages:
+                print(f"[DEBUG] yfinance: {message.strip()}")
+            if raised is not None:
+                print(f"[DEBUG] yfinance: error descargando {pending}: {raised}")
+
+        if df is not None and not df.empty:
+            available = set(df.columns.get_level_values(0)) if isinstance(df.columns, pd.MultiIndex) else set()
+            for ticker in pending:
+                if ticker.upper() in available:
+                    results[ticker] = _normalize_yfinance_frame(df[ticker.upper()])
+
+        transient = raised is not None or any(
+            marker in message.lower() for message in messages for marker in YFINANCE_TRANSIENT_ERRORS
+        )
+        pending = [ticker for ticker in pending if results[ticker] is None]
+        if not pending or not transient:
+            break
+
+    return results, set(pending) if transient else set()
+
+
+def fetch_yfinance_data(requests_by_key, verbose=False, max_workers=None, batch_size=None, transient=None):
+    """
+    Descarga de yfinance los datos de muchos tickers a la vez. Las peticiones se
+    agrupan por fecha de inicio en lotes de varios símbolos, que se ejecutan en un
+    pool de hilos acotado. Las respuestas pasan por la caché compartida
+    (ver http_cache.ResponseCache).
+
+    Args:
+        requests_by_key (dict): {clave: (ticker_yf, start_date)}. La descarga empieza
+                                el día siguiente a `start_date`.
+        verbose (bool): Si es True, muestra los mensajes de yfinance.
+        max_workers (int, opcional): Hilos simultáneos. Por defecto config.YF_MAX_WORKERS.
+        batch_size (int, opcional): Símbolos por llamada. Por defecto config.YF_BATCH_SIZE.
+        transient (set, opcional): Si se pasa, se le añaden las claves sin datos por un
+                                   fallo transitorio (o sin respuesta guardada en modo
+                                   "replay"), que no implican que el símbolo no exista.
+
+    Retorna:
+        - results (dict): {clave: DataFrame o None}
+    """
+    if max_workers is None:
+        max_workers = config.YF_MAX_WORKERS
+    if batch_size is None:
+        batch_size = config.YF_BATCH_SIZE
+
+    cache = get_response_cache()
+    downloaded = {}
+    unresolved = set()
+    groups = {}
+    for key, (ticker, start_date) in requests_by_key.items():
+        start_date_str = _yfinance_start_str(start_date)
+        if (ticker, start_date_str) in downloaded:
+            continue
+        cached = cache.get('yfinance', (ticker, start_date_str))
+        if cached is not None:
+            get_run_report().count('yfinance_cache_hits')
+        if cached is not None or cache.mode == "replay":
+            downloaded[(ticker, start_date_str)] = cached
+            if cached is None:
+                unresolved.add((ticker, start_date_str))
+        else:
+            groups.setdefault(start_date_str, []).append(ticker)
+
+    batches = []
+    for start_date_str, tickers in groups.items():
+        tickers = sorted(set(tickers))
+        for i in range(0, len(tickers), batch_size):
+            batches.append((tickers[i:i + batch_size], start_date_str))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [pool.submit(_download_yfinance_batch, tickers, start, verbose) for tickers, start in batches]
+        for future, (tickers, start) in zip(futures, batches):
+            results, failed = future.result()
+            for ticker, df in results.items():
+                downloaded[(ticker, start)] = df
+                if df is not None:
+                    cache.store('yfinance', (ticker, start), df)
+            unresolved.update((ticker, start) for ticker in failed)
+
+    if transient is not None:
+        transient.update(
+            key for key, (ticker, start_date) in requests_by_key.items()
+            if (ticker, _yfinance_start_str(start_date)) in unresolved
+        )
+    return {
+        key: downloaded.get((ticker, _yfinance_start_str(start_date)))
+        for key, (ticker, start_date) in requests_by_key.items()
+    }
+
+
 def get_yfinance_data(ticker, start_date, verbose=False):
     """
     Obtiene datos de yfinance Y ESTANDARIZA el nombre del índice a 'date'.
@@ -109,39 +404,12 @@ def get_yfinance_data(ticker, start_date, verbose=False):
     Args:
         ticker (str): Ticker a consultar.
         start_date (str o datetime): Fecha de inicio para la consulta.
-        verbose (bool): Si es True, no suprime los mensajes de error de yfinance.
+        verbose (bool): Si es True, muestra los mensajes de error de yfinance.
         
     Retorna:
         - df (pd.DataFrame): DataFrame con los datos, o None si falla.
     """
     try:
-        start_date_str = (pd.to_datetime(start_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
-        
-        if not verbose:
-            original_stderr = sys.stderr
-            sys.stderr = open(os.devnull, 'w')
-
-        df = yf.download(
-            ticker,
-            start=start_date_str,
-            auto_adjust=False,
-            progress=False
-        )
-
-        if not verbose:
-            sys.stderr.close()
-            sys.stderr = original_stderr
-        
-        if df.empty:
-            return None
-        
-        df.index.name = 'date' 
-        
-        df = df[['Open', 'High', 'Low', 'Adj Close', 'Volume']]
-        return df
-        
+        return fetch_yfinance_data({ticker: (ticker, start_date)}, verbose)[ticker]
     except Exception as e:
-        if not verbose:
-            sys.stderr.close()
-            sys.stderr = original_stderr
-        return None
\ No newline at end of file
+        return None
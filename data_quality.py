@@ -0,0 +1,360 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+import config
+from cli import add_validate_arguments
+from manifest import load_manifest, manifest_path_for
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Adj Close']
+
+# Factor que convierte la desviación absoluta mediana en una desviación típica (normal).
+MAD_SCALE = 1.4826
+
+REPORT_COLUMNS = [
+    'rows', 'first_date', 'last_date', 'out_of_order', 'duplicate_bars', 'off_calendar_bars',
+    'missing_days', 'gaps', 'max_gap_days', 'nan_prices', 'nonpositive_prices', 'high_below_low',
+    'jumps', 'max_abs_return', 'seam_date', 'seam_return', 'seam_zscore', 'seam_outlier',
+    'zero_volume_days', 'zero_volume_runs', 'max_zero_volume_run', 'flagged'
+]
+
+
+def load_long_output(csv_path):
+    """
+    Lee el CSV de salida entero en formato largo con pyarrow.csv (multihilo), con el
+    ticker como categoría y las fechas como días desde epoch.
+
+    Retorna:
+        - dict: Arrays 'codes' (int32), 'tickers' (símbolos de cada código), 'days'
+                (int64) y uno por columna de precios y 'Volume' (float64), en el
+                orden del archivo.
+    """
+    table = pa_csv.read_csv(
+        csv_path,
+        convert_options=pa_csv.ConvertOptions(
+            column_types={
+                'ticker': pa.dictionary(pa.int32(), pa.string()),
+                'date': pa.date32(),
+                **{column: pa.float64() for column in PRICE_COLUMNS + ['Volume']}
+            },
+            strings_can_be_null=False
+        )
+    )
+    ticker = table['ticker'].to_pandas()
+    data = {
+        'codes': ticker.cat.codes.to_numpy().astype(np.int32),
+        'tickers': ticker.cat.categories.to_numpy(dtype=str),
+        'days': table['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    }
+    for column in PRICE_COLUMNS + ['Volume']:
+        data[column] = table[column].to_numpy()
+    return data
+
+
+def _calendar_signature(csv_path):
+    stat = os.stat(csv_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _group_bounds(codes, n_groups):
+    """Primera y última fila de cada grupo en arrays ordenados por código (-1 si no tiene filas)."""
+    starts = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1]))) if len(codes) else np.array([], dtype=np.int64)
+    ends = np.concatenate((starts[1:], [len(codes)])) - 1
+    first = np.full(n_groups, -1, dtype=np.int64)
+    last = np.full(n_groups, -1, dtype=np.int64)
+    first[codes[starts]] = starts
+    last[codes[starts]] = ends
+    return first, last
+
+
+def build_trading_calendar(codes, days, min_share=None, presorted=False):
+    """
+    Deduce el calendario de sesiones de los propios datos: un día es hábil si tiene
+    barra al menos `min_share` de los tickers que cotizaban entonces (entre su
+    primera y su última fecha). Así no depende de una lista de festivos.
+
+    Args:
+        codes (np.ndarray): Código del ticker de cada fila.
+        days (np.ndarray): Día (desde epoch) de cada fila.
+        min_share (float, opcional): Por defecto config.QUALITY_CALENDAR_MIN_SHARE.
+        presorted (bool): Si las filas ya están ordenadas por (código, día).
+
+    Retorna:
+        - np.ndarray: Días hábiles (int64, días desde epoch), ordenados.
+    """
+    if min_share is None:
+        min_share = config.QUALITY_CALENDAR_MIN_SHARE
+    if not len(days):
+        return np.array([], dtype=np.int64)
+    if not presorted:
+        order = np.lexsort((days, codes))
+        codes, days = codes[order], days[order]
+
+    # Las fechas caben en un rango denso de pocos miles de días: se cuentan con bincount.
+    first_day = int(days.min())
+    offsets = days - first_day
+    n_days = int(offsets.max()) + 1
+    repeated = np.concatenate(([False], (codes[1:] == codes[:-1]) & (days[1:] == days[:-1])))
+    traded = np.bincount(offsets[~repeated], minlength=n_days)
+
+    first, last = _group_bounds(codes, int(codes.max()) + 1)
+    present = first >= 0
+    alive = np.zeros(n_days + 1, dtype=np.int64)
+    np.add.at(alive, offsets[first[present]], 1)
+    np.add.at(alive, offsets[last[present]] + 1, -1)
+    alive = np.cumsum(alive[:-1])
+
+    sessions = (traded > 0) & (traded >= np.ceil(min_share * alive))
+    return np.flatnonzero(sessions).astype(np.int64) + first_day
+
+
+def _load_calendar(csv_path, cache_path):
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached['signature'], _calendar_signature(csv_path)):
+                return cached['days']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _save_calendar(csv_path, cache_path, days):
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = cache_path + '.tmp.npz'
+    np.savez(tmp_path, days=days, signature=_calendar_signature(csv_path))
+    os.replace(tmp_path, cache_path)
+
+
+def trading_calendar(csv_path, data=None, cache_path=None):
+    """
+    Calendario de sesiones del CSV de salida, guardado en `cache_path` (por defecto
+    config.QUALITY_CALENDAR_PATH) y reutilizado mientras el CSV no cambie.
+    """
+    cache_path = cache_path or config.QUALITY_CALENDAR_PATH
+    days = _load_calendar(csv_path, cache_path)
+    if days is None:
+        if data is None:
+            data = load_long_output(csv_path)
+        days = build_trading_calendar(data['codes'], data['days'])
+        _save_calendar(csv_path, cache_path, days)
+    return days
+
+
+def _seam_days(tickers, manifest):
+    """
+    Día de la unión Quandl/yfinance de cada símbolo (int64, -1 si no tiene). Se toma
+    'seam_date' del manifiesto; en manifiestos anteriores se supone el último día de
+    Quandl (config.QUANDL_LAST_DATE) para las fuentes 'quandl+yfinance'.
+    """
+    seams = np.full(len(tickers), -1, dtype=np.int64)
+    if not manifest:
+        return seams
+    position = {ticker: i for i, ticker in enumerate(tickers)}
+    fallback = pd.Timestamp(config.QUANDL_LAST_DATE)
+    for entry in manifest['tickers'].values():
+        i = position.get(entry['ticker'])
+        if i is None or not entry['source'].endswith('+yfinance'):
+            continue
+        seam = pd.Timestamp(entry['seam_date']) if entry.get('seam_date') else fallback
+        seams[i] = max(seams[i], (seam - pd.Timestamp(0)).days)
+    return seams
+
+
+def _group_max(values, first_row, initial):
+    """Máximo de `values` por grupo en arrays ordenados por código (ver _group_bounds)."""
+    result = np.full(len(first_row), initial, dtype=values.dtype)
+    has_rows = first_row >= 0
+    if has_rows.any():
+        result[has_rows] = np.maximum.reduceat(values, first_row[has_rows])
+    return result
+
+
+def scan_output(csv_path=None, data=None, calendar=None, manifest=None):
+    """
+    Revisa la calidad del CSV de salida en una sola pasada vectorizada (sin bucles
+    por ticker): fechas desordenadas o duplicadas, barras fuera del calendario,
+    sesiones que faltan, precios vacíos o incoherentes, saltos de precio, el salto
+    en la unión Quandl/yfinance y rachas de volumen cero.
+
+    Args:
+        csv_path (str, opcional): CSV de salida. Por defecto config.FINAL_OUTPUT_PATH.
+        data (dict, opcional): Datos ya leídos con load_long_output.
+        calendar (np.ndarray, opcional): Días hábiles. Por defecto, trading_calendar.
+        manifest (dict, opcional): Manifiesto del CSV (para las fechas de unión).
+
+    Retorna:
+        - pd.DataFrame: Informe con una fila por símbolo (REPORT_COLUMNS); 'flagged'
+                        indica si tiene alguna anomalía.
+    """
+    csv_path = csv_path or config.FINAL_OUTPUT_PATH
+    if data is None:
+        data = load_long_output(csv_path)
+    if manifest is None:
+        manifest = load_manifest(manifest_path_for(csv_path))
+
+    tickers = data['tickers']
+    n = len(tickers)
+    codes = data['codes']
+    days = data['days']
+
+    # Orden del archivo: fechas que retroceden dentro del bloque de un ticker.
+    same_file = codes[1:] == codes[:-1]
+    out_of_order = np.bincount(codes[1:][same_file & (days[1:] < days[:-1])], minlength=n)
+
+    order = np.lexsort((days, codes))
+    codes = codes[order]
+    days = days[order]
+    close = data['Adj Close'][order]
+    prices = np.column_stack([data[column][order] for column in PRICE_COLUMNS])
+    volume = data['Volume'][order]
+
+    rows = np.bincount(codes, minlength=n)
+    same = np.concatenate(([False], codes[1:] == codes[:-1]))
+    duplicate = same & np.concatenate(([False], days[1:] == days[:-1]))
+    first_row, last_row = _group_bounds(codes, n)
+    has_rows = first_row >= 0
+
+    if calendar is None:
+        calendar = _load_calendar(csv_path, config.QUALITY_CALENDAR_PATH)
+        if calendar is None:
+            calendar = build_trading_calendar(codes, days, presorted=True)
+            _save_calendar(csv_path, config.QUALITY_CALENDAR_PATH, calendar)
+
+    # Calendario: posición de cada barra y sesiones que faltan entre la primera y la última.
+    position = np.searchsorted(calendar, days)
+    on_calendar = (position < len(calendar)) & (calendar[np.minimum(position, len(calendar) - 1)] == days)
+    counted = on_calendar & ~duplicate
+    first_position = np.where(has_rows, position[first_row], 0)
+    last_position = np.where(has_rows, position[last_row] - (~on_calendar[last_row]).astype(np.int64), -1)
+    expected = np.maximum(last_position - first_position + 1, 0)
+    missing_days = np.maximum(expected - np.bincount(codes[counted], minlength=n), 0)
+
+    step = np.concatenate(([0], np.diff(position)))
+    step = np.where(same & counted, step - 1, 0)
+    gaps = np.bincount(codes[step > 0], minlength=n)
+    max_gap = _group_max(step, first_row, 0)
+
+    nan_prices = np.bincount(codes[np.isnan(prices).any(axis=1)], minlength=n)
+    nonpositive = np.bincount(codes[(prices <= 0).any(axis=1)], minlength=n)
+    high_below_low = np.bincount(codes[prices[:, 2] > prices[:, 1]], minlength=n)
+
+    # Rendimientos logarítmicos entre barras consecutivas del mismo ticker.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_close = np.log(np.where(close > 0, close, np.nan))
+    returns = np.where(same & ~duplicate, np.concatenate(([np.nan], np.diff(log_close))), np.nan)
+    valid = ~np.isnan(returns)
+    abs_returns = np.abs(returns)
+    grouped = pd.Series(returns[valid]).groupby(codes[valid])
+    median = grouped.median().reindex(range(n)).to_numpy()
+    mad = (pd.Series(np.abs(returns[valid] - median[codes[valid]])).groupby(codes[valid])
+           .median().reindex(range(n)).to_numpy())
+    scale = MAD_SCALE * mad
+
+    # Unión Quandl/yfinance: primera barra posterior a la fecha de la unión.
+    seam_days = _seam_days(tickers, manifest)
+    seam_row = valid & (seam_days[codes] >= 0) & (days > seam_days[codes]) & \
+        (np.concatenate(([np.iinfo(np.int64).min], days[:-1])) <= seam_days[codes])
+    seam_return = np.full(n, np.nan)
+    seam_return[codes[seam_row]] = returns[seam_row]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seam_zscore = np.abs(seam_return - median) / scale
+    seam_zscore = np.where(scale > 0, seam_zscore, np.where(seam_return == median, 0.0, np.inf))
+    seam_zscore = np.where(np.isnan(seam_return), np.nan, seam_zscore)
+    seam_outlier = (np.abs(seam_return) > config.QUALITY_SEAM_MAX_RETURN) | (seam_zscore > config.QUALITY_SEAM_ZSCORE)
+
+    jump = valid & (abs_returns > config.QUALITY_JUMP_RETURN) & ~seam_row
+    max_abs_return = _group_max(np.where(valid, abs_returns, -np.inf), first_row, -np.inf)
+
+    # Rachas de volumen cero: número y longitud de la más larga.
+    zero = volume == 0
+    run_start = zero & ~(same & np.concatenate(([False], zero[:-1])))
+    run_id = np.cumsum(run_start) - 1
+    run_lengths = np.bincount(run_id[zero], minlength=int(run_start.sum()))
+    max_zero_run = np.zeros(n, dtype=np.int64)
+    np.maximum.at(max_zero_run, codes[run_start], run_lengths)
+
+    def to_dates(values, mask):
+        return pd.to_datetime(np.where(mask, values, 0).astype('datetime64[D]')).where(mask)
+
+    report = pd.DataFrame({
+        'rows': rows,
+        'first_date': to_dates(days[first_row], has_rows),
+        'last_date': to_dates(days[last_row], has_rows),
+        'out_of_order': out_of_order,
+        'duplicate_bars': np.bincount(codes[duplicate], minlength=n),
+        'off_calendar_bars': np.bincount(codes[~on_calendar], minlength=n),
+        'missing_days': missing_days,
+        'gaps': gaps,
+        'max_gap_days': max_gap,
+        'nan_prices': nan_prices,
+        'nonpositive_prices': nonpositive,
+        'high_below_low': high_below_low,
+        'jumps': np.bincount(codes[jump], minlength=n),
+        'max_abs_return': np.where(np.isfinite(max_abs_return), max_abs_return, np.nan),
+        'seam_date': to_dates(seam_days, seam_days >= 0),
+        'seam_return': seam_return,
+        'seam_zscore': seam_zscore,
+        'seam_outlier': seam_outlier,
+        'zero_volume_days': np.bincount(codes[zero], minlength=n),
+        'zero_volume_runs': np.bincount(codes[run_start], minlength=n),
+        'max_zero_volume_run': max_zero_run,
+    }, index=pd.Index(tickers, name='ticker'))
+
+    report['flagged'] = (
+        (report[['out_of_order', 'duplicate_bars', 'off_calendar_bars', 'missing_days', 'nan_prices',
+                 'nonpositive_prices', 'high_below_low', 'jumps']] > 0).any(axis=1)
+        | report['seam_outlier']
+    )
+    return report[report['rows'] > 0][REPORT_COLUMNS]
+
+
+def summarize(report):
+    """Totales del informe: tickers revisados y con cada tipo de anomalía."""
+    counts = {
+        'tickers': len(report),
+        'flagged': int(report['flagged'].sum()),
+        'seam_outliers': int(report['seam_outlier'].sum()),
+    }
+    for column in ['out_of_order', 'duplicate_bars', 'off_calendar_bars', 'missing_days', 'gaps',
+                   'nan_prices', 'nonpositive_prices', 'high_below_low', 'jumps', 'zero_volume_runs']:
+        counts[f"with_{column}"] = int((report[column] > 0).sum())
+    return counts
+
+
+def validate_output(csv_path=None, report_path=None, verbose=False):
+    """
+    Genera el informe de calidad del CSV de salida y lo guarda en `report_path`
+    (por defecto config.QUALITY_REPORT_PATH).
+
+    Retorna:
+        - report (pd.DataFrame): Informe por ticker, o None si no hay salida.
+    """
+    csv_path = csv_path or config.FINAL_OUTPUT_PATH
+    report_path = report_path or config.QUALITY_REPORT_PATH
+    if not os.path.exists(csv_path):
+        print(f"[ERROR] No existe {csv_path}; no se puede validar.")
+        return None
+
+    report = scan_output(csv_path)
+    report.to_csv(report_path, date_format='%Y-%m-%d')
+
+    summary = summarize(report)
+    print(f"[INFO] Calidad de los datos: {summary['flagged']} de {summary['tickers']} tickers con anomalías "
+          f"({summary['seam_outliers']} saltos en la unión Quandl/yfinance). Informe: '{report_path}'.")
+    if verbose:
+        for name, value in summary.items():
+            print(f"  - {name}: {value}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Informe de calidad del dataset de precios por ticker.")
+    add_validate_arguments(parser)
+    args = parser.parse_args()
+    validate_output(args.input, args.output, args.verbose)
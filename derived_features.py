@@ -0,0 +1,483 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import config
+from cli import add_derived_arguments
+from data_quality import _group_bounds, build_trading_calendar, load_long_output
+from manifest import load_manifest, manifest_path_for
+from utils import write_json_atomic
+
+DERIVED_COLUMNS = ['return', 'log_return', 'volatility', 'dollar_volume']
+
+DERIVED_SCHEMA = pa.schema(
+    [('ticker', pa.dictionary(pa.int32(), pa.string())), ('date', pa.date32())] +
+    [(column, pa.float64()) for column in DERIVED_COLUMNS]
+)
+
+META_FILE_NAME = '_derived.json'
+STATE_FILE_NAME = '_state.npz'
+
+
+def _params():
+    """Parámetros de los que dependen los resultados; si cambian, se recalcula todo."""
+    return {
+        'window': config.DERIVED_VOLATILITY_WINDOW,
+        'min_periods': config.DERIVED_VOLATILITY_MIN_PERIODS,
+        'calendar_min_share': config.QUALITY_CALENDAR_MIN_SHARE,
+        'seam_max_return': config.QUALITY_SEAM_MAX_RETURN,
+    }
+
+
+def _source_key(manifest):
+    """Huella de la salida de precios: rangos de bytes, filas y última fecha de cada ticker."""
+    blocks = {
+        ticker_wiki: [entry['start'], entry['end'], entry['rows'], entry['last_date']]
+        for ticker_wiki, entry in manifest['tickers'].items()
+    }
+    return hashlib.sha1(json.dumps(blocks, sort_keys=True).encode()).hexdigest()
+
+
+def _days(date):
+    return (pd.Timestamp(date) - pd.Timestamp(0)).days
+
+
+def _block_seam_days(entries):
+    """Día de la unión Quandl/yfinance de cada bloque del CSV (-1 si no tiene); ver data_quality._seam_days."""
+    seams = np.full(len(entries), -1, dtype=np.int64)
+    for i, (_, entry) in enumerate(entries):
+        if entry['source'].endswith('+yfinance'):
+            seams[i] = _days(entry.get('seam_date') or config.QUANDL_LAST_DATE)
+    return seams
+
+
+def compute_returns(blocks, days, close, calendar, seam_days=None):
+    """
+    Rendimientos diarios de filas ordenadas por (bloque, día), en una sola pasada.
+
+    Solo hay rendimiento entre dos barras del mismo bloque (ticker) en sesiones
+    consecutivas del calendario: la primera barra de cada ticker, las barras tras
+    sesiones que faltan (p. ej. en la unión de fuentes o antes de una exclusión) y
+    las barras fuera del calendario quedan en NaN, igual que los precios vacíos o no
+    positivos. En la unión Quandl/yfinance (`seam_days`, por bloque), un salto mayor
+    que config.QUALITY_SEAM_MAX_RETURN se considera un desajuste entre fuentes y
+    también queda en NaN.
+
+    Retorna:
+        - (simple, log): Rendimientos simples y logarítmicos (float64).
+    """
+    same = np.concatenate(([False], blocks[1:] == blocks[:-1]))
+    position = np.searchsorted(calendar, days)
+    on_calendar = (position < len(calendar)) & (calendar[np.minimum(position, len(calendar) - 1)] == days)
+    consecutive = (
+        same & on_calendar & np.concatenate(([False], on_calendar[:-1]))
+        & (np.concatenate(([0], np.diff(position))) == 1)
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_close = np.log(np.where(close > 0, close, np.nan))
+    log_return = np.where(consecutive, np.concatenate(([np.nan], np.diff(log_close))), np.nan)
+
+    if seam_days is not None:
+        seam = seam_days[blocks]
+        previous_day = np.concatenate(([np.iinfo(np.int64).min], days[:-1]))
+        at_seam = (seam >= 0) & (days > seam) & (previous_day <= seam)
+        log_return[at_seam & (np.abs(log_return) > config.QUALITY_SEAM_MAX_RETURN)] = np.nan
+
+    return np.expm1(log_return), log_return
+
+
+def rolling_volatility(blocks, log_return, window, min_periods):
+    """
+    Desviación típica móvil de los rendimientos logarítmicos en las últimas `window`
+    barras de cada bloque, con al menos `min_periods` rendimientos válidos.
+
+    Se calcula con una única ventana móvil de pandas sobre todos los tickers: entre
+    bloque y bloque se intercalan window - 1 huecos (NaN), de modo que ninguna
+    ventana mezcla dos tickers.
+    """
+    if not len(blocks):
+        return np.array([], dtype='float64')
+    starts = np.concatenate(([True], blocks[1:] != blocks[:-1]))
+    ordinal = np.cumsum(starts) - 1
+    positions = np.arange(len(blocks)) + ordinal * (window - 1)
+    padded = np.full(positions[-1] + 1, np.nan)
+    padded[positions] = log_return
+    volatility = pd.Series(padded).rolling(window, min_periods=min_periods).std().to_numpy()
+    return volatility[positions]
+
+
+def _last_values(values, first_row, last_row, count):
+    """Últimos `count` valores de cada bloque (rellenos con NaN por delante), forma (bloques, count)."""
+    offsets = np.arange(count - 1, -1, -1)
+    index = last_row[:, None] - offsets[None, :]
+    valid = (index >= first_row[:, None]) & (first_row[:, None] >= 0)
+    return np.where(valid, values[np.maximum(index, 0)], np.nan)
+
+
+def _take(values, rows, fill):
+    """values[rows], con `fill` donde rows es -1 (bloques sin filas)."""
+    return np.where(rows >= 0, values[np.maximum(rows, 0)], fill)
+
+
+def _to_table(ticker_codes, tickers, days, columns):
+    arrays = [
+        pa.DictionaryArray.from_arrays(pa.array(ticker_codes, pa.int32()), pa.array(tickers, pa.string())),
+        pa.array(days.astype('int32'), pa.int32()).cast(pa.date32()),
+    ] + [pa.array(columns[column], pa.float64()) for column in DERIVED_COLUMNS]
+    return pa.Table.from_arrays(arrays, schema=DERIVED_SCHEMA)
+
+
+def _part_name(index):
+    return f"part-{index:05d}.parquet"
+
+
+def _next_part_index(meta):
+    return int(meta['parts'][-1][len('part-'):-len('.parquet')]) + 1 if meta['parts'] else 0
+
+
+def _save_state(path, state):
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **state)
+    os.replace(tmp_path, path)
+
+
+def _meta(manifest, entries, params, parts, rows):
+    return {
+        'params': params,
+        'columns': DERIVED_COLUMNS,
+        'wiki_tickers': [ticker_wiki for ticker_wiki, _ in entries],
+        'source_key': _source_key(manifest),
+        'source_updated_at': manifest['updated_at'],
+        'source_blocks': {ticker_wiki: [entry['start'], entry['end']] for ticker_wiki, entry in entries},
+        'parts': parts,
+        'rows': int(rows)
+    }
+
+
+def _build(csv_path, derived_dir, manifest, verbose=False):
+    """Calcula las series derivadas de todo el CSV y reemplaza `derived_dir`."""
+    params = _params()
+    window = params['window']
+    entries = sorted(manifest['tickers'].items(), key=lambda item: item[1]['start'])
+    data = load_long_output(csv_path)
+    rows_per_block = np.array([entry['rows'] for _, entry in entries], dtype=np.int64)
+    if rows_per_block.sum() != len(data['days']) or not len(data['days']):
+        raise ValueError("Las filas del CSV no coinciden con las del manifiesto.")
+
+    blocks = np.repeat(np.arange(len(entries)), rows_per_block)
+    order = np.lexsort((data['days'], blocks))
+    blocks = blocks[order]
+    days = data['days'][order]
+    codes = data['codes'][order]
+    close = data['Adj Close'][order]
+    volume = data['Volume'][order]
+
+    calendar = build_trading_calendar(blocks, days, params['calendar_min_share'], presorted=True)
+    simple, log_return = compute_returns(blocks, days, close, calendar, _block_seam_days(entries))
+    volatility = rolling_volatility(blocks, log_return, window, params['min_periods'])
+
+    tmp_dir = derived_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    table = _to_table(codes, data['tickers'], days, {
+        'return': simple, 'log_return': log_return, 'volatility': volatility, 'dollar_volume': close * volume
+    })
+    pq.write_table(table, os.path.join(tmp_dir, _part_name(0)), compression=config.COLUMNAR_COMPRESSION)
+
+    first_row, last_row = _group_bounds(blocks, len(entries))
+    _save_state(os.path.join(tmp_dir, STATE_FILE_NAME), {
+        'calendar': calendar,
+        'first_day': _take(days, first_row, -1),
+        'last_day': _take(days, last_row, -1),
+        'last_close': _take(close, last_row, np.nan),
+        'last_log_returns': _last_values(log_return, first_row, last_row, window - 1),
+    })
+    write_json_atomic(os.path.join(tmp_dir, META_FILE_NAME), _meta(manifest, entries, params, [_part_name(0)], len(days)))
+
+    old_dir = derived_dir + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(derived_dir):
+        os.replace(derived_dir, old_dir)
+    os.replace(tmp_dir, derived_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    if verbose:
+        print(f"[INFO] Series derivadas calculadas en '{derived_dir}': {len(days)} filas, {len(entries)} tickers.")
+    return _read_meta(derived_dir)
+
+
+def _read_meta(derived_dir):
+    path = os.path.join(derived_dir, META_FILE_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _read_tails(csv_path, manifest, meta):
+    """
+    Filas añadidas al final del bloque de cada ticker desde el último cálculo (ver
+    panel_store.update_panel), leídas de una vez.
+
+    Retorna:
+        - (blocks, table): Bloque de cada fila nueva y sus columnas, o (None, None)
+          si no hay filas nuevas.
+    """
+    chunks = []
+    block_rows = []
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        for i, ticker_wiki in enumerate(meta['wiki_tickers']):
+            entry = manifest['tickers'][ticker_wiki]
+            old_start, old_end = meta['source_blocks'][ticker_wiki]
+            start = entry['start'] + (old_end - old_start)
+            if entry['end'] <= start:
+                continue
+            f.seek(start)
+            chunk = f.read(entry['end'] - start)
+            chunks.append(chunk)
+            block_rows.append((i, chunk.count(b'\n')))
+    if not chunks:
+        return None, None
+
+    table = pa_csv.read_csv(
+        BytesIO(header + b''.join(chunks)),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=['ticker', 'date', 'Adj Close', 'Volume'],
+            column_types={'ticker': pa.string(), 'date': pa.date32(), 'Adj Close': pa.float64(), 'Volume': pa.float64()}
+        )
+    )
+    blocks = np.repeat([i for i, _ in block_rows], [n for _, n in block_rows])
+    if len(blocks) != table.num_rows:
+        raise ValueError("No se pudieron delimitar las filas nuevas de cada ticker.")
+    return blocks, table
+
+
+def _update(csv_path, derived_dir, manifest, meta, verbose=False):
+    """
+    Añade las series derivadas de las filas nuevas como una parte más del dataset.
+    Para cada ticker solo hace falta su última barra y sus window - 1 últimos
+    rendimientos, guardados en STATE_FILE_NAME.
+
+    Retorna:
+        - meta (dict), o None si hay que recalcularlo todo.
+    """
+    params = meta['params']
+    window = params['window']
+    entries = [(ticker_wiki, manifest['tickers'][ticker_wiki]) for ticker_wiki in meta['wiki_tickers']]
+    state_path = os.path.join(derived_dir, STATE_FILE_NAME)
+    with np.load(state_path) as saved:
+        state = {name: saved[name] for name in saved.files}
+
+    tail_blocks, table = _read_tails(csv_path, manifest, meta)
+    if tail_blocks is not None:
+        tail_days = table['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        if tail_days.min() <= state['last_day'].max():
+            if verbose:
+                print("[INFO] Hay fechas nuevas anteriores al final de las series derivadas. Se recalcula todo.")
+            return None
+        order = np.lexsort((tail_days, tail_blocks))
+        tail_blocks, tail_days = tail_blocks[order], tail_days[order]
+        tail_close = table['Adj Close'].to_numpy()[order]
+        tail_volume = table['Volume'].to_numpy()[order]
+        tail_tickers = table['ticker'].to_numpy(zero_copy_only=False)[order]
+
+        # Calendario: las fechas nuevas son sesiones con la misma regla que en
+        # build_trading_calendar (tickers con barra frente a tickers vivos ese día).
+        repeated = np.concatenate(([False], (tail_blocks[1:] == tail_blocks[:-1]) & (tail_days[1:] == tail_days[:-1])))
+        new_days, traded = np.unique(tail_days[~repeated], return_counts=True)
+        last_day = state['last_day'].copy()
+        np.maximum.at(last_day, tail_blocks, tail_days)
+        alive_last = np.sort(last_day[last_day >= 0])
+        alive = len(alive_last) - np.searchsorted(alive_last, new_days, side='left')
+        sessions = new_days[(traded > 0) & (traded >= np.ceil(params['calendar_min_share'] * alive))]
+        calendar = np.concatenate((state['calendar'], sessions))
+
+        # Rendimientos: cada ticker con filas nuevas parte de su última barra guardada.
+        blocks_with_tail = np.unique(tail_blocks)
+        has_previous = state['last_day'][blocks_with_tail] >= 0
+        context_blocks = blocks_with_tail[has_previous]
+        all_blocks = np.concatenate((context_blocks, tail_blocks))
+        all_days = np.concatenate((state['last_day'][context_blocks], tail_days))
+        all_close = np.concatenate((state['last_close'][context_blocks], tail_close))
+        is_tail = np.concatenate((np.zeros(len(context_blocks), dtype=bool), np.ones(len(tail_blocks), dtype=bool)))
+        order = np.lexsort((~is_tail, all_days, all_blocks))
+        simple, log_return = compute_returns(
+            all_blocks[order], all_days[order], all_close[order], calendar, _block_seam_days(entries)
+        )
+        simple = simple[is_tail[order]]
+        log_return = log_return[is_tail[order]]
+
+        # Volatilidad: los window - 1 rendimientos guardados preceden a los nuevos.
+        history_blocks = np.repeat(blocks_with_tail, window - 1)
+        rolled_blocks = np.concatenate((history_blocks, tail_blocks))
+        rolled_values = np.concatenate((state['last_log_returns'][blocks_with_tail].ravel(), log_return))
+        is_new = np.concatenate((np.zeros(len(history_blocks), dtype=bool), np.ones(len(tail_blocks), dtype=bool)))
+        order = np.argsort(rolled_blocks, kind='stable')
+        rolled_blocks, rolled_values, is_new = rolled_blocks[order], rolled_values[order], is_new[order]
+        volatility = rolling_volatility(rolled_blocks, rolled_values, window, params['min_periods'])[is_new]
+
+        tickers, codes = np.unique(tail_tickers.astype(str), return_inverse=True)
+        part = _part_name(_next_part_index(meta))
+        pq.write_table(
+            _to_table(codes, tickers, tail_days, {
+                'return': simple, 'log_return': log_return, 'volatility': volatility,
+                'dollar_volume': tail_close * tail_volume
+            }),
+            os.path.join(derived_dir, part), compression=config.COLUMNAR_COMPRESSION
+        )
+
+        # Estado: última barra y últimos rendimientos de cada ticker actualizado.
+        n_blocks = len(entries)
+        first_tail, last_tail = _group_bounds(tail_blocks, n_blocks)
+        first_rolled, last_rolled = _group_bounds(rolled_blocks, n_blocks)
+        state['calendar'] = calendar
+        state['first_day'] = np.where(state['first_day'] >= 0, state['first_day'], _take(tail_days, first_tail, -1))
+        state['last_day'] = last_day
+        state['last_close'][blocks_with_tail] = tail_close[last_tail[blocks_with_tail]]
+        state['last_log_returns'][blocks_with_tail] = _last_values(
+            rolled_values, first_rolled, last_rolled, window - 1
+        )[blocks_with_tail]
+        _save_state(state_path, state)
+        meta['parts'].append(part)
+        meta['rows'] += len(tail_blocks)
+
+    meta.update({
+        'source_key': _source_key(manifest),
+        'source_updated_at': manifest['updated_at'],
+        'source_blocks': {ticker_wiki: [entry['start'], entry['end']] for ticker_wiki, entry in entries},
+    })
+    write_json_atomic(os.path.join(derived_dir, META_FILE_NAME), meta)
+    if len(meta['parts']) > config.DERIVED_MAX_PARTS:
+        _compact(derived_dir, meta)
+    if verbose:
+        added = 0 if tail_blocks is None else len(tail_blocks)
+        print(f"[INFO] Series derivadas actualizadas: {added} filas nuevas.")
+    return meta
+
+
+def _compact(derived_dir, meta):
+    """Reúne todas las partes del dataset en una sola."""
+    table = ds.dataset([os.path.join(derived_dir, part) for part in meta['parts']], format='parquet').to_table()
+    part = _part_name(_next_part_index(meta))
+    pq.write_table(table.unify_dictionaries().combine_chunks(), os.path.join(derived_dir, part),
+                   compression=config.COLUMNAR_COMPRESSION)
+    old_parts = meta['parts']
+    meta['parts'] = [part]
+    write_json_atomic(os.path.join(derived_dir, META_FILE_NAME), meta)
+    for old_part in old_parts:
+        os.remove(os.path.join(derived_dir, old_part))
+
+
+def derive_features(csv_path=None, derived_dir=None, force=False, verbose=False):
+    """
+    Calcula (o actualiza) los rendimientos simple y logarítmico, la volatilidad móvil
+    y el volumen en dólares de todos los tickers del CSV de salida, en una pasada
+    vectorizada sin bucles por ticker (ver compute_returns y rolling_volatility).
+
+    El resultado se guarda en `derived_dir` como dataset Parquet, junto con la huella
+    de la salida de precios de la que procede, y se reutiliza mientras esta no
+    cambie. Tras una ejecución incremental de main.py solo se calculan las filas
+    nuevas de cada ticker y se añaden como una parte más (las partes se compactan al
+    pasar de config.DERIVED_MAX_PARTS). Si el conjunto de tickers o los parámetros
+    cambian, o la salida no procede de una ejecución incremental sobre la ya
+    calculada, se recalcula todo.
+
+    Args:
+        csv_path (str, opcional): CSV de salida. Por defecto config.FINAL_OUTPUT_PATH.
+        derived_dir (str, opcional): Directorio del resultado. Por defecto config.DERIVED_DIR.
+        force (bool): Si es True, se recalcula todo aunque esté al día.
+        verbose (bool): Si es True, informa del progreso.
+
+    Retorna:
+        - meta (dict): Metadatos del dataset derivado, o None si falla.
+    """
+    csv_path = csv_path or config.FINAL_OUTPUT_PATH
+    derived_dir = derived_dir or config.DERIVED_DIR
+    manifest = load_manifest(manifest_path_for(csv_path))
+    if manifest is None or not manifest['complete']:
+        print(f"[ERROR] No hay un manifiesto completo para {csv_path}; no se calculan las series derivadas.")
+        return None
+
+    try:
+        meta = None if force else _read_meta(derived_dir)
+        if meta is not None and meta['params'] == _params():
+            if meta['source_key'] == _source_key(manifest):
+                if verbose:
+                    print(f"[INFO] Series derivadas al día; se reutiliza '{derived_dir}'.")
+                return meta
+            can_append = (
+                manifest['incremental'] and manifest.get('base_updated_at') == meta['source_updated_at']
+                and sorted(manifest['tickers']) == sorted(meta['wiki_tickers'])
+            )
+            if can_append:
+                updated = _update(csv_path, derived_dir, manifest, meta, verbose)
+                if updated is not None:
+                    return updated
+        return _build(csv_path, derived_dir, manifest, verbose)
+
+    except (OSError, ValueError, pa.ArrowException) as e:
+        print(f"[ERROR] No se pudieron calcular las series derivadas: {e}")
+        return None
+
+
+def load_derived(tickers=None, start=None, end=None, columns=None, derived_dir=None):
+    """
+    Lee las series derivadas, con los filtros aplicados en el escáner de Parquet.
+
+    Args:
+        tickers (iterable, opcional): Símbolos de la salida (los de yfinance).
+        start, end (str o fecha, opcional): Rango de fechas (incluido).
+        columns (list, opcional): Columnas de DERIVED_COLUMNS. Por defecto todas.
+        derived_dir (str, opcional): Por defecto config.DERIVED_DIR.
+
+    Retorna:
+        - pd.DataFrame: Columnas ['ticker', 'date'] + columns, ordenado por ticker y fecha.
+    """
+    derived_dir = derived_dir or config.DERIVED_DIR
+    meta = _read_meta(derived_dir)
+    if meta is None:
+        raise FileNotFoundError(f"No hay series derivadas en {derived_dir}; ejecuta derive_features.")
+    columns = list(columns or DERIVED_COLUMNS)
+    unknown = [column for column in columns if column not in DERIVED_COLUMNS]
+    if unknown:
+        raise ValueError(f"Columnas desconocidas: {unknown}. Disponibles: {DERIVED_COLUMNS}")
+
+    expression = None
+    conditions = []
+    if tickers is not None:
+        conditions.append(ds.field('ticker').isin(sorted([tickers] if isinstance(tickers, str) else tickers)))
+    if start is not None:
+        conditions.append(ds.field('date') >= pa.scalar(pd.Timestamp(start).date(), pa.date32()))
+    if end is not None:
+        conditions.append(ds.field('date') <= pa.scalar(pd.Timestamp(end).date(), pa.date32()))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    dataset = ds.dataset([os.path.join(derived_dir, part) for part in meta['parts']], format='parquet')
+    df = dataset.to_table(columns=['ticker', 'date'] + columns, filter=expression).to_pandas()
+    df['ticker'] = df['ticker'].astype(str)
+    df['date'] = pd.to_datetime(df['date'])
+    return df.sort_values(['ticker', 'date'], kind='stable').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calcula rendimientos, volatilidad móvil y volumen en dólares del dataset de precios."
+    )
+    add_derived_arguments(parser)
+    args = parser.parse_args()
+    if derive_features(args.input, args.output, force=args.force, verbose=args.verbose) is None:
+        sys.exit(1)
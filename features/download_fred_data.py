@@ -1,8 +1,15 @@
 import os
+import sys
+import json
+import argparse
 import pandas as pd
-from fredapi import Fred
-from dotenv import load_dotenv
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cli import add_macro_arguments
+from http_cache import get_response_cache
+from utils import write_json_atomic
 
 SERIES_CONFIG = {
     'sp500_price': 'SP500',
@@ -18,10 +25,44 @@ SERIES_CONFIG = {
     'industrial_production_index': 'INDPRO'
 }
 
+# Días naturales desde la fecha de referencia de cada observación hasta que se
+# publica (y se puede usar). Las series diarias de mercado se conocen al cierre o
+# al día siguiente; las mensuales se publican semanas después del mes al que se
+# refieren (p. ej. el IPC de enero, fechado el 1 de enero, sale a mediados de febrero).
+# Los usa features/macro_features.py para el cruce point-in-time con los precios.
+PUBLICATION_LAG_DAYS = {
+    'sp500_price': 0,
+    'vix_close': 0,
+    'treasury_yield_10y': 1,
+    'treasury_yield_2y': 1,
+    'federal_funds_rate': 32,
+    'breakeven_inflation_10y': 1,
+    'cpi': 45,
+    'wti_oil_price': 7,
+    'trade_weighted_dollar_index': 7,
+    'unemployment_rate': 35,
+    'industrial_production_index': 47
+}
+
 START_DATE = '1990-01-01'
 END_DATE = date.today().strftime('%Y-%m-%d')
 
-OUTPUT_CSV_PATH = 'macro_data_fred.csv'
+# Las rutas son relativas a este directorio (no al de trabajo), para que este script,
+# `cli.py macro` y macro_features.py usen los mismos archivos.
+FEATURES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+OUTPUT_CSV_PATH = os.path.join(FEATURES_DIR, 'macro_data_fred.csv')
+
+# Observaciones tal como las publica FRED (sin rellenar), indexadas por su fecha de
+# referencia. Sin ellas no se puede saber cuándo se conoció cada valor.
+RAW_CSV_PATH = os.path.join(FEATURES_DIR, 'macro_data_fred_raw.csv')
+
+# Última observación de cada serie en el CSV guardado (el CSV está rellenado hacia
+# adelante, así que no basta con su última fila). Lo usa el modo incremental.
+STATE_PATH = OUTPUT_CSV_PATH + '.state.json'
+
+# Series descargadas a la vez.
+MAX_WORKERS = 4
 
 
 def initialize_fred_client():
@@ -34,6 +75,10 @@ def initialize_fred_client():
     Lanza (Raises):
         ValueError: Si la FRED_API_KEY no se encuentra en las variables de entorno.
     """
+    # fredapi y dotenv solo hacen falta con la API (no en modo "replay").
+    from dotenv import load_dotenv
+    from fredapi import Fred
+
     load_dotenv()
     api_key = os.getenv('FRED_API_KEY')
     if not api_key:
@@ -46,28 +91,51 @@ def initialize_fred_client():
         exit()
 
 
-def download_fred_series(fred_client, series_dict, start, end):
+def download_fred_series(fred_client, series_dict, start, end, max_workers=None):
     """
-    Descarga múltiples series de FRED y las combina en un único DataFrame.
+    Descarga múltiples series de FRED a la vez y las combina en un único DataFrame.
+    Las respuestas pasan por la caché compartida (ver http_cache.ResponseCache).
 
     Args:
         fred_client (Fred): El cliente Fred inicializado.
         series_dict (dict): Un diccionario que mapea los nombres de columna a los IDs de serie de FRED.
-        start (str): La fecha de inicio para la descarga de datos (YYYY-MM-DD).
+        start (str o dict): La fecha de inicio para la descarga de datos (YYYY-MM-DD), o un
+                            diccionario {columna: fecha de inicio} con una fecha por serie.
         end (str): La fecha de finalización para la descarga de datos (YYYY-MM-DD).
+        max_workers (int, opcional): Series descargadas a la vez. Por defecto MAX_WORKERS.
 
     Retorna:
         pd.DataFrame: Un DataFrame que contiene todas las series descargadas, unidas.
     """
-    print(f"Descargando datos desde {start} hasta {end}...")
-    
+    starts = start if isinstance(start, dict) else {column_name: start for column_name in series_dict}
+    if isinstance(start, dict):
+        print(f"Descargando datos nuevos de {len(series_dict)} series hasta {end}...")
+    else:
+        print(f"Descargando datos desde {start} hasta {end}...")
+
+    def fetch(column_name, series_id):
+        series_start = starts[column_name]
+        # La clave no incluye `end` (la fecha de hoy): así el modo "replay" encuentra
+        # la respuesta grabada cualquier otro día; la vigencia la da el TTL de 'fred'.
+        return get_response_cache().cached_call(
+            'fred',
+            (series_id, series_start),
+            lambda: fred_client.get_series(series_id, observation_start=series_start, observation_end=end)
+        )
+
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as pool:
+        futures = {
+            column_name: pool.submit(fetch, column_name, series_id)
+            for column_name, series_id in series_dict.items()
+        }
+
     all_series = []
-    for column_name, series_id in series_dict.items():
+    for column_name, future in futures.items():
+        series_id = series_dict[column_name]
         try:
-            series_data = fred_client.get_series(series_id, observation_start=start, observation_end=end)
-            df_series = series_data.to_frame(name=column_name)
+            df_series = future.result().to_frame(name=column_name)
             all_series.append(df_series)
-            print(f" Descargado exitosamente '{series_id}' como '{column_name}'.")
+            print(f" Descargado exitosamente '{series_id}' como '{column_name}' ({len(df_series)} observaciones).")
         except Exception as e:
             print(f"No se pudo descargar {series_id}. Error: {e}")
             
@@ -104,15 +172,124 @@ def process_and_clean_data(df):
     return df_processed
 
 
+def last_observation_dates(raw_df):
+    """Última fecha con valor de cada serie descargada, como texto YYYY-MM-DD."""
+    return {
+        column_name: raw_df[column_name].last_valid_index().strftime('%Y-%m-%d')
+        for column_name in raw_df.columns
+        if raw_df[column_name].last_valid_index() is not None
+    }
+
+
+def load_state(series_dict):
+    """
+    Lee el estado del CSV guardado.
+
+    Retorna:
+        - dict: {columna: última fecha observada}, o None si no existen los CSV o el
+                estado, o si no corresponde a las series de `series_dict`.
+    """
+    if not all(os.path.exists(path) for path in (OUTPUT_CSV_PATH, RAW_CSV_PATH, STATE_PATH)):
+        return None
+    try:
+        with open(STATE_PATH, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get('series') != series_dict or set(state.get('last_dates', {})) != set(series_dict):
+        return None
+    return state['last_dates']
+
+
+def save_state(series_dict, last_dates):
+    write_json_atomic(STATE_PATH, {
+        'series': series_dict,
+        'last_dates': last_dates,
+        'updated_at': datetime.now().isoformat(timespec='seconds')
+    })
+
+
+def merge_new_observations(df_saved, raw_new, last_dates):
+    """
+    Añade al CSV ya limpio las observaciones nuevas y vuelve a limpiar solo la cola.
+
+    Para cada serie, los valores posteriores a su última observación eran relleno
+    hacia adelante: se descartan y se sustituyen por las observaciones nuevas. A
+    partir de la fecha más antigua afectada se vuelve a rellenar hacia adelante;
+    las filas anteriores no cambian. El resultado es el mismo que con una descarga
+    completa.
+
+    Args:
+        df_saved (pd.DataFrame): Datos limpios guardados (índice 'date').
+        raw_new (pd.DataFrame): Observaciones nuevas de cada serie (sin limpiar).
+        last_dates (dict): {columna: última fecha observada en df_saved}.
+
+    Retorna:
+        pd.DataFrame: Datos limpios actualizados.
+    """
+    last_dates = {column_name: pd.Timestamp(d) for column_name, d in last_dates.items()}
+    tail_start = min(last_dates.values())
+    head = df_saved[df_saved.index < tail_start]
+    tail = df_saved[df_saved.index >= tail_start]
+
+    tail = tail.reindex(tail.index.union(raw_new.index))
+    for column_name, last_date in last_dates.items():
+        tail.loc[tail.index > last_date, column_name] = float('nan')
+    tail = tail.combine_first(raw_new)[df_saved.columns]
+    tail.index.name = 'date'
+
+    return pd.concat([head, tail.ffill().dropna()])
+
+
 def main():
-    fred_client = initialize_fred_client()
-    
-    raw_df = download_fred_series(fred_client, SERIES_CONFIG, START_DATE, END_DATE)
-    
-    if raw_df.empty:
-        return
-        
-    cleaned_df = process_and_clean_data(raw_df)
+    parser = argparse.ArgumentParser(description="Descarga las series macroeconómicas de FRED.")
+    add_macro_arguments(parser)
+    args = parser.parse_args()
+    run(args.incremental)
+
+
+def run(incremental=False):
+    """
+    Descarga las series de SERIES_CONFIG y guarda el CSV limpio, las observaciones
+    sin rellenar y el estado del modo incremental.
+
+    Args:
+        incremental (bool): Si es True y hay un estado válido, solo se descargan las
+                            observaciones posteriores a la última de cada serie.
+    """
+    # En modo "replay" las series salen de la caché y no hace falta la API.
+    fred_client = None if get_response_cache().mode == "replay" else initialize_fred_client()
+
+    last_dates = load_state(SERIES_CONFIG) if incremental else None
+    if incremental and last_dates is None:
+        print("No hay un estado válido del CSV anterior. Se descarga todo.")
+
+    if last_dates is not None:
+        starts = {
+            column_name: (pd.Timestamp(last_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+            for column_name, last_date in last_dates.items()
+        }
+        pending = {c: series_id for c, series_id in SERIES_CONFIG.items() if starts[c] <= END_DATE}
+        raw_new = download_fred_series(fred_client, pending, starts, END_DATE) if pending else pd.DataFrame()
+        if raw_new.empty:
+            print("No hay observaciones nuevas.")
+            return
+
+        raw_new.index = pd.to_datetime(raw_new.index)
+        df_saved = pd.read_csv(OUTPUT_CSV_PATH, index_col='date', parse_dates=['date'], float_precision='round_trip')
+        cleaned_df = merge_new_observations(df_saved, raw_new, last_dates)
+        last_dates.update(last_observation_dates(raw_new))
+        raw_saved = pd.read_csv(RAW_CSV_PATH, index_col='date', parse_dates=['date'], float_precision='round_trip')
+        raw_df = raw_new.combine_first(raw_saved)[raw_saved.columns]
+    else:
+        raw_df = download_fred_series(fred_client, SERIES_CONFIG, START_DATE, END_DATE)
+
+        if raw_df.empty:
+            return
+
+        raw_df.index = pd.to_datetime(raw_df.index)
+        last_dates = last_observation_dates(raw_df)
+        cleaned_df = process_and_clean_data(raw_df)
 
     if cleaned_df.empty:
         print("El DataFrame está vacío después de la limpieza. No se guardará ningún archivo.")
@@ -120,10 +297,18 @@ def main():
 
     try:
         cleaned_df.to_csv(OUTPUT_CSV_PATH)
+        raw_df.rename_axis('date').to_csv(RAW_CSV_PATH)
         print(f"\nDatos guardados exitosamente en: {OUTPUT_CSV_PATH}")
     except Exception as e:
         print(f"\nERROR: No se pudo guardar el archivo CSV. Error: {e}")
+        return
+
+    if set(last_dates) == set(SERIES_CONFIG):
+        save_state(SERIES_CONFIG, last_dates)
+    elif os.path.exists(STATE_PATH):
+        # Faltan series: la próxima ejecución incremental hará una descarga completa.
+        os.remove(STATE_PATH)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+FEATURES_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(FEATURES_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, FEATURES_DIR)
+import config
+from download_fred_data import OUTPUT_CSV_PATH, PUBLICATION_LAG_DAYS, RAW_CSV_PATH, SERIES_CONFIG
+
+# Matriz fechas × series macro alineada con las fechas del dataset de precios.
+FEATURE_MATRIX_PATH = os.path.join(FEATURES_DIR, 'macro_features_pit.parquet')
+
+# Clave de los metadatos del Parquet con la huella de las entradas de la matriz.
+FINGERPRINT_KEY = b'macro_features_fingerprint'
+
+
+def load_observations(raw_path=None, cleaned_path=None):
+    """
+    Observaciones de cada serie indexadas por su fecha de referencia, sin rellenar.
+
+    Se leen de RAW_CSV_PATH (lo genera download_fred_data.py). Si no existe, se
+    deducen del CSV rellenado: cada cambio de valor es una observación y el primer
+    tramo de cada serie se descarta, porque puede ser relleno hacia atrás (no se
+    sabe cuándo se conoció).
+
+    Retorna:
+        - pd.DataFrame: Una columna por serie, con NaN donde no hay observación.
+    """
+    raw_path = raw_path or RAW_CSV_PATH
+    if os.path.exists(raw_path):
+        return pd.read_csv(raw_path, index_col='date', parse_dates=['date'], float_precision='round_trip')
+
+    cleaned_path = cleaned_path or OUTPUT_CSV_PATH
+    print(f"[AVISO] No existe {raw_path}; las observaciones se deducen de {cleaned_path}. "
+          f"Ejecuta download_fred_data.py para tener las fechas de referencia exactas.")
+    df = pd.read_csv(cleaned_path, index_col='date', parse_dates=['date'], float_precision='round_trip')
+    changed = df.ne(df.shift())
+    first_run = changed.cumsum() <= 1
+    return df.where(changed & ~first_run)
+
+
+def available_values(observations, lags=None):
+    """
+    Valor vigente de cada serie en cada fecha en que se publica algo nuevo.
+
+    Cada observación pasa a estar disponible `lags[serie]` días después de su fecha
+    de referencia. Las observaciones de todas las series se ordenan por esa fecha y
+    se rellenan hacia adelante, de modo que cada fila solo contiene datos ya
+    publicados en su fecha.
+
+    Args:
+        observations (pd.DataFrame): Salida de load_observations.
+        lags (dict, opcional): {serie: días de retraso}. Por defecto PUBLICATION_LAG_DAYS.
+
+    Retorna:
+        - pd.DataFrame: Indexado por 'available_date', ordenado y sin fechas repetidas.
+    """
+    if lags is None:
+        lags = PUBLICATION_LAG_DAYS
+    missing = [column for column in observations.columns if column not in lags]
+    if missing:
+        raise ValueError(f"Sin retraso de publicación configurado para: {missing}")
+
+    published = []
+    for column in observations.columns:
+        series = observations[column].dropna()
+        series.index = series.index + pd.Timedelta(days=lags[column])
+        published.append(series)
+
+    available = pd.concat(published, axis=1).sort_index()
+    available = available.groupby(level=0).last()
+    available.index.name = 'available_date'
+    return available.ffill()
+
+
+def price_dates(prices_path=None):
+    """Fechas distintas del dataset de precios (solo se lee la columna 'date')."""
+    prices_path = prices_path or os.path.join(REPO_ROOT, config.FINAL_OUTPUT_PATH)
+    table = pa_csv.read_csv(
+        prices_path,
+        convert_options=pa_csv.ConvertOptions(include_columns=['date'], column_types={'date': pa.date32()})
+    )
+    dates = pd.to_datetime(pc.unique(table['date'].combine_chunks()).to_numpy(zero_copy_only=False))
+    return pd.DatetimeIndex(dates.sort_values(), name='date').as_unit('ns')
+
+
+def point_in_time_join(left, available, on='date'):
+    """
+    Añade a `left` los valores macro publicados hasta cada fecha, con un único
+    cruce as-of ordenado (pd.merge_asof). El orden original de `left` se conserva.
+
+    Args:
+        left (pd.DataFrame): Filas con una columna de fechas `on` (p. ej. los precios
+                             en formato largo, o solo las fechas).
+        available (pd.DataFrame): Salida de available_values.
+
+    Retorna:
+        - pd.DataFrame: `left` con una columna más por serie.
+    """
+    order = np.argsort(left[on].to_numpy(), kind='stable')
+    joined = pd.merge_asof(
+        left.iloc[order].reset_index(drop=True),
+        available.reset_index().astype({'available_date': left[on].dtype}),
+        left_on=on, right_on='available_date', direction='backward'
+    ).drop(columns='available_date')
+    joined = joined.iloc[np.argsort(order)]
+    joined.index = left.index
+    return joined
+
+
+def _fingerprint(paths, lags):
+    """Huella de las entradas de la matriz: tamaño y fecha de los archivos y retrasos."""
+    parts = {'lags': lags, 'series': SERIES_CONFIG}
+    for path in paths:
+        stat = os.stat(path)
+        parts[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def build_macro_feature_matrix(prices_path=None, output_path=None, lags=None, force=False, verbose=False,
+                               raw_path=None, cleaned_path=None):
+    """
+    Genera (o reutiliza) la matriz point-in-time fechas × series macro, alineada con
+    las fechas del dataset de precios, y la guarda en Parquet.
+
+    La matriz se reutiliza mientras no cambien los precios, las observaciones de
+    FRED ni los retrasos de publicación, así que los experimentos la leen sin
+    repetir el cruce.
+
+    Args:
+        prices_path (str, opcional): CSV de precios. Por defecto config.FINAL_OUTPUT_PATH.
+        output_path (str, opcional): Parquet de salida. Por defecto FEATURE_MATRIX_PATH.
+        lags (dict, opcional): Retrasos por serie. Por defecto PUBLICATION_LAG_DAYS.
+        force (bool): Si es True, se regenera aunque esté al día.
+        verbose (bool): Si es True, informa de si se reutiliza o se genera.
+        raw_path, cleaned_path (str, opcional): Observaciones de FRED (ver load_observations).
+
+    Retorna:
+        - pd.DataFrame: Matriz indexada por fecha, una columna por serie.
+    """
+    prices_path = prices_path or os.path.join(REPO_ROOT, config.FINAL_OUTPUT_PATH)
+    output_path = output_path or FEATURE_MATRIX_PATH
+    lags = dict(PUBLICATION_LAG_DAYS if lags is None else lags)
+    raw_path = raw_path or RAW_CSV_PATH
+    cleaned_path = cleaned_path or OUTPUT_CSV_PATH
+    macro_path = raw_path if os.path.exists(raw_path) else cleaned_path
+    fingerprint = _fingerprint([prices_path, macro_path], lags)
+
+    if not force and os.path.exists(output_path):
+        metadata = pq.read_schema(output_path).metadata or {}
+        if metadata.get(FINGERPRINT_KEY) == fingerprint.encode():
+            if verbose:
+                print(f"[INFO] Matriz macro al día; se reutiliza '{output_path}'.")
+            return load_macro_feature_matrix(output_path)
+
+    available = available_values(load_observations(raw_path, cleaned_path), lags)
+    dates = pd.DataFrame({'date': price_dates(prices_path)})
+    matrix = point_in_time_join(dates, available).set_index('date')
+
+    table = pa.Table.from_pandas(matrix, preserve_index=True)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), FINGERPRINT_KEY: fingerprint.encode()})
+    tmp_path = output_path + '.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, output_path)
+    if verbose:
+        print(f"[INFO] Matriz macro point-in-time guardada en '{output_path}' "
+              f"({len(matrix)} fechas x {matrix.shape[1]} series).")
+    return matrix
+
+
+def load_macro_feature_matrix(path=None):
+    """Lee la matriz guardada por build_macro_feature_matrix (indexada por fecha)."""
+    return pd.read_parquet(path or FEATURE_MATRIX_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cruza point-in-time las series de FRED con las fechas del dataset de precios."
+    )
+    parser.add_argument('--prices', default=os.path.join(REPO_ROOT, config.FINAL_OUTPUT_PATH),
+                        help='CSV de precios cuyas fechas se alinean.')
+    parser.add_argument('--output', default=FEATURE_MATRIX_PATH, help='Parquet de salida.')
+    parser.add_argument('--force', action='store_true', help='Regenera la matriz aunque esté al día.')
+    args = parser.parse_args()
+    build_macro_feature_matrix(args.prices, args.output, force=args.force, verbose=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+import requests
+
+import config
+
+
+class CacheMiss(Exception):
+    """No hay respuesta guardada para una petición en modo "replay"."""
+
+
+class ResponseCache:
+    """
+    Caché en disco de respuestas de las fuentes externas (Wikipedia, yfinance, FRED).
+
+    Cada entrada es un archivo pickle con el valor y sus metadatos (fecha de guardado,
+    ETag, Last-Modified). La fecha de modificación del archivo se actualiza en cada
+    acierto, de modo que al superar el tamaño máximo se eliminan primero las entradas
+    usadas hace más tiempo (LRU).
+
+    Modos:
+        - "normal": usa la caché mientras no venza el TTL de la fuente.
+        - "record": siempre consulta la red y guarda la respuesta.
+        - "replay": nunca consulta la red; si no hay respuesta guardada lanza CacheMiss.
+        - "off": no lee ni escribe la caché.
+    """
+
+    def __init__(self, cache_dir, mode="normal", ttls=None, max_bytes=None):
+        if mode not in ("normal", "record", "replay", "off"):
+            raise ValueError(f"Modo de caché desconocido: {mode}")
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.ttls = ttls or {}
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    def _path(self, source, key):
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, source, digest + '.pkl')
+
+    def _is_fresh(self, source, entry):
+        ttl = self.ttls.get(source)
+        return ttl is None or time.time() - entry['stored_at'] < ttl
+
+    def load(self, source, key):
+        """
+        Lee una entrada de la caché sin comprobar su vigencia. Una entrada ilegible
+        (corrupta, o guardada con otra versión de pandas o NumPy) cuenta como si no
+        existiera y se borra, para que se vuelva a descargar.
+
+        Retorna:
+            - dict: {'value', 'stored_at', 'etag', 'last_modified'}, o None si no existe.
+        """
+        if self.mode == "off":
+            return None
+        path = self._path(source, key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except OSError:
+            return None
+        except Exception:
+            entry = None
+        if not isinstance(entry, dict) or 'value' not in entry or 'stored_at' not in entry:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, source, key, value, etag=None, last_modified=None):
+        """Guarda una entrada y aplica la política de tamaño máximo."""
+        if self.mode == "off":
+            return
+        path = self._path(source, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'value': value, 'stored_at': time.time(), 'etag': etag, 'last_modified': last_modified}
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict(os.path.getsize(path))
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith('.pkl'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def evict(self, added_bytes=0):
+        """
+        Elimina las entradas menos usadas hasta quedar por debajo de `max_bytes`.
+        El tamaño total se lleva en memoria y el directorio solo se recorre al
+        arrancar o cuando se supera el límite.
+        """
+        if not self.max_bytes:
+            return
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._total_bytes += added_bytes
+            if self._total_bytes <= self.max_bytes:
+                return
+
+            files = self._scan()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._total_bytes = total
+
+    def get(self, source, key):
+        """
+        Devuelve el valor guardado si se puede usar en el modo actual (vigente en
+        "normal", cualquiera en "replay"), o None en otro caso.
+        """
+        if self.mode not in ("normal", "replay"):
+            return None
+        entry = self.load(source, key)
+        if entry is not None and (self.mode == "replay" or self._is_fresh(source, entry)):
+            return entry['value']
+        return None
+
+    def cached_call(self, source, key, fetch):
+        """
+        Devuelve el valor guardado para (source, key) o, si no hay uno vigente,
+        llama a `fetch()` y guarda el resultado (salvo que sea None).
+
+        Lanza (Raises):
+            CacheMiss: En modo "replay" si no hay respuesta guardada.
+        """
+        value = self.get(source, key)
+        if value is not None:
+            return value
+        if self.mode == "replay":
+            raise CacheMiss(f"{source}: {key}")
+
+        value = fetch()
+        if value is not None:
+            self.store(source, key, value)
+        return value
+
+    def get_text(self, source, url, headers=None, timeout=30):
+        """
+        GET HTTP con caché. Cuando la entrada ha vencido, se revalida con
+        If-None-Match / If-Modified-Since y, si el servidor responde 304, se
+        reutiliza el contenido guardado.
+
+        Retorna:
+            - str: Cuerpo de la respuesta.
+
+        Lanza (Raises):
+            requests.HTTPError: Si el servidor responde con un error.
+            CacheMiss: En modo "replay" si no hay respuesta guardada.
+        """
+        key = ('GET', url)
+        entry = self.load(source, key) if self.mode != "record" else None
+
+        if entry is not None and (self.mode == "replay" or self._is_fresh(source, entry)):
+            return entry['value']
+        if self.mode == "replay":
+            raise CacheMiss(f"{source}: {url}")
+
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        response = requests.get(url, headers=request_headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            self.store(source, key, entry['value'], entry.get('etag'), entry.get('last_modified'))
+            return entry['value']
+        response.raise_for_status()
+
+        self.store(
+            source, key, response.text,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified')
+        )
+        return response.text
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Devuelve la caché compartida configurada en config.py (HTTP_CACHE_*)."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                config.HTTP_CACHE_DIR,
+                mode=config.HTTP_CACHE_MODE,
+                ttls=config.HTTP_CACHE_TTL_SECONDS,
+                max_bytes=config.HTTP_CACHE_MAX_MB * 1024 * 1024
+            )
+        return _response_cache
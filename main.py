@@ -1,131 +1,822 @@
+import asyncio
+import os
 import sys
+import time
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from datetime import datetime
 import argparse
 
 import config
+from cli import add_build_arguments
 from data_fetchers import (
     scrape_sp500_data,
-    load_and_preprocess_quandl,
-    get_yfinance_data
+    fetch_yfinance_data
 )
 from process_local_data import load_and_process_local_data
+from columnar_output import write_columnar_output
+from csv_writer import CsvBatchWriter, compress_output, encode_frame, encode_frames
+from data_quality import validate_output
+from derived_features import derive_features
+from manifest import (
+    load_manifest,
+    manifest_path_for,
+    new_manifest,
+    partial_path_for,
+    save_manifest
+)
+from panel_store import build_panel, update_panel
+from quandl_store import open_quandl_store
+from resolution_store import ResolutionStore, resolve_symbols
+from run_report import get_run_report
+from shards import compact_shards, in_shard, shard_output_path, shard_report_path
+from snapshots import publish_snapshot
+
+OUTPUT_COLUMNS = ['ticker', 'date', 'Open', 'High', 'Low', 'Adj Close', 'Volume']
+CSV_HEADER = (','.join(OUTPUT_COLUMNS) + os.linesep).encode('utf-8')
+
+def _plan_ticker(ticker_wiki, symbols, quandl_dict, local_dict, verbose=False, load_quandl=True, route=None):
+    """
+    Decide de dónde salen los datos de un ticker antes de descargar nada.
+
+    Args:
+        symbols (tuple): (ticker_quandl, ticker_yf) de resolution_store.resolve_symbols.
+        load_quandl (bool): Si es False y el almacén de Quandl permite consultar la
+                            última fecha sin leer los datos (`last_date`), no se cargan
+                            aquí: los cargará el proceso que haga la unión.
+        route (str, opcional): Fuente de la que salió el ticker en la última ejecución
+                               (ver ResolutionStore.source). Con "yfinance" no se
+                               busca en Quandl.
+
+    Retorna:
+        - (ticker_yf, base_data, quandl_key, yf_start, source): `base_data` son los datos
+          locales o de Quandl ya disponibles (o None), `quandl_key` el ticker de Quandl
+          que queda por cargar (o None), `yf_start` la fecha a partir de la cual hay que
+          completar con yfinance (o None si no hace falta) y `source` la fuente
+          principal ('local', 'quandl' o 'yfinance').
+    """
+    ticker_q, ticker_yf = symbols
+
+    if ticker_wiki in local_dict:
+        if verbose:
+            print(f"[DEBUG] Ticker {ticker_wiki}: Encontrado en datos locales.")
+        return ticker_yf, local_dict[ticker_wiki].copy(), None, None, 'local'
+
+    if route == 'yfinance':
+        if verbose:
+            print(f"[DEBUG] Ticker {ticker_wiki}: Resuelto con yfinance en la ejecución anterior. Descargando la información completa.")
+        return ticker_yf, None, None, '1990-01-01', 'yfinance'
+
+    if not load_quandl and hasattr(quandl_dict, 'last_date') and ticker_q in quandl_dict:
+        df_quandl, quandl_key = None, ticker_q
+        last_quandl_date = quandl_dict.last_date(ticker_q)
+    else:
+        df_quandl, quandl_key = quandl_dict.get(ticker_q, pd.DataFrame()).copy(), None
+        last_quandl_date = None if df_quandl.empty else df_quandl.index.max()
+
+    if last_quandl_date is not None:
+        if verbose:
+            print(f"[DEBUG] Ticker {ticker_wiki}: Encontrado en Quandl.")
+        if last_quandl_date < datetime.now() - pd.Timedelta(days=1):
+            if verbose:
+                print(f"[DEBUG] Ticker {ticker_wiki}: Intentando complementar la información con yfinance...")
+            return ticker_yf, df_quandl, quandl_key, last_quandl_date, 'quandl'
+        return ticker_yf, df_quandl, quandl_key, None, 'quandl'
+
+    if verbose:
+        print(f"[DEBUG] Ticker {ticker_wiki}: No encontrado en Quandl. Intentando descargar la información completa con yfinance.")
+    return ticker_yf, None, None, '1990-01-01', 'yfinance'
+
+
+def _merge_ticker_data(ticker_wiki, base_data, df_yfinance, verbose=False):
+    """
+    Une los datos base (locales o Quandl) con los de yfinance, priorizando los
+    primeros en fechas duplicadas.
+
+    Retorna:
+        - full_data (pd.DataFrame): Datos combinados, o None si no hay ninguno.
+    """
+    has_base = base_data is not None and not base_data.empty
+    has_yfinance = df_yfinance is not None and not df_yfinance.empty
+
+    if not has_yfinance:
+        return base_data if has_base else None
+
+    full_data = pd.concat([base_data, df_yfinance]) if has_base else df_yfinance.copy()
+    full_data = full_data[~full_data.index.duplicated(keep='first')]
+    full_data.sort_index(inplace=True)
+    if verbose:
+        print(f"[DEBUG] Ticker {ticker_wiki}: Descargando la información completa. Datos desde {full_data.index.min().strftime('%Y-%m-%d')} hasta {full_data.index.max().strftime('%Y-%m-%d')}.")
+    return full_data
+
+
+def _normalize_output(full_data, ticker_yf):
+    """Deja los datos de un ticker con las columnas y el orden del CSV de salida."""
+    full_data['ticker'] = ticker_yf
+    full_data.reset_index(inplace=True) 
+    
+    for col in OUTPUT_COLUMNS:
+        if col not in full_data.columns:
+            full_data[col] = pd.NA
+
+    return full_data[OUTPUT_COLUMNS]
+
+
+def _plan_incremental(entry):
+    """
+    Plan de un ticker que ya está en el manifiesto: solo se piden a yfinance las
+    barras posteriores a la última fecha escrita (los datos locales no se refrescan).
+    """
+    last_date = pd.Timestamp(entry['last_date'])
+    if entry['source'] != 'local' and last_date < datetime.now() - pd.Timedelta(days=1):
+        return entry['ticker'], None, None, last_date, entry['source']
+    return entry['ticker'], None, None, None, entry['source']
+
+
+def _open_checkpoint(output_path, previous, verbose=False):
+    """
+    Abre el archivo parcial de la ejecución. Si hay un checkpoint compatible de una
+    ejecución interrumpida, lo retoma truncando el parcial hasta el último ticker
+    confirmado; si no, empieza de cero.
+
+    Retorna:
+        - (f, checkpoint): Archivo parcial abierto en binario y su manifiesto.
+    """
+    partial_path = partial_path_for(output_path)
+    checkpoint_path = manifest_path_for(partial_path)
+    incremental = previous is not None
+
+    checkpoint = load_manifest(checkpoint_path)
+    can_resume = (
+        checkpoint is not None
+        and not checkpoint['complete']
+        and checkpoint['incremental'] == incremental
+        and (not incremental or checkpoint.get('base_updated_at') == previous['updated_at'])
+        and os.path.exists(partial_path)
+        and os.path.getsize(partial_path) >= checkpoint['bytes_written']
+    )
+
+    if can_resume:
+        f = open(partial_path, 'r+b')
+        f.truncate(checkpoint['bytes_written'])
+        f.seek(checkpoint['bytes_written'])
+        if verbose:
+            done = len(checkpoint['tickers']) + len(checkpoint['failed'])
+            print(f"[INFO] Retomando la ejecución interrumpida: {done} tickers ya procesados.")
+        return f, checkpoint
+
+    checkpoint = new_manifest(incremental)
+    if incremental:
+        checkpoint['base_updated_at'] = previous['updated_at']
+    return open(partial_path, 'wb'), checkpoint
+
+
+def _save_checkpoint(f, checkpoint, output_path):
+    """Confirma en disco lo escrito hasta ahora y guarda el manifiesto del parcial."""
+    f.flush()
+    os.fsync(f.fileno())
+    checkpoint['bytes_written'] = f.tell()
+    save_manifest(manifest_path_for(partial_path_for(output_path)), checkpoint)
+
+
+def _prepare_ticker(ticker_wiki, ticker_yf, base_data, df_yfinance, source, verbose=False):
+    """
+    Une los datos de un ticker y los convierte al texto CSV de la salida, sin
+    escribir nada (puede ejecutarse en otro proceso).
+
+    Retorna:
+        - (entry, data): Entrada del manifiesto sin el rango de bytes y las filas ya
+          codificadas, o None si no hay datos.
+    """
+    full_data = _merge_ticker_data(ticker_wiki, base_data, df_yfinance, verbose)
+    if full_data is None or full_data.empty:
+        if verbose:
+            print(f"[DEBUG] Ticker {ticker_wiki}: Falló el análisis con Quandl y yfinance.")
+        return None
+
+    # Última fecha de los datos base: a partir de ella la serie continúa con yfinance.
+    seam_date = None
+    if source != 'yfinance' and df_yfinance is not None and not df_yfinance.empty:
+        source = f"{source}+yfinance"
+        seam_date = base_data.index.max().strftime('%Y-%m-%d')
+    last_date = full_data.index.max().strftime('%Y-%m-%d')
+    full_data = _normalize_output(full_data, ticker_yf)
+
+    entry = {
+        'ticker': ticker_yf,
+        'source': source,
+        'last_date': last_date,
+        'rows': len(full_data)
+    }
+    if seam_date is not None:
+        entry['seam_date'] = seam_date
+    return entry, encode_frame(full_data)
+
+
+# Almacén de Quandl de cada proceso del pool de unión (ver _init_merge_worker).
+_worker_quandl = None
+
+
+def _init_merge_worker(quandl_store):
+    """Inicializa un proceso del pool con su propia vista del almacén de Quandl."""
+    global _worker_quandl
+    _worker_quandl = quandl_store
+
+
+def _prepare_ticker_task(task):
+    """
+    Tarea del pool de unión: carga los datos de Quandl pendientes (si los hay) y
+    prepara el ticker. Los errores se devuelven en lugar de lanzarse, para que un
+    ticker fallido no interrumpa los resultados del resto de la ventana.
+
+    Retorna:
+        - (prepared, error, seconds): Resultado de _prepare_ticker, mensaje de error
+          (o None) y segundos empleados.
+    """
+    ticker_wiki, ticker_yf, base_data, quandl_key, df_yfinance, source, verbose = task
+    start = time.perf_counter()
+    try:
+        if quandl_key is not None:
+            base_data = _worker_quandl[quandl_key]
+        prepared = _prepare_ticker(ticker_wiki, ticker_yf, base_data, df_yfinance, source, verbose)
+        return prepared, None, time.perf_counter() - start
+    except Exception as e:
+        return None, str(e), time.perf_counter() - start
+
+
+def _write_prepared(f, prepared):
+    """
+    Escribe en la salida un ticker preparado con _prepare_ticker.
+
+    Retorna:
+        - entry (dict): Entrada del manifiesto para el ticker, con su rango de bytes.
+    """
+    entry, data = prepared
+    if f.tell() == 0:
+        f.write(CSV_HEADER)
+    start = f.tell()
+    f.write(data)
+    return dict(entry, start=start, end=f.tell())
+
+
+def _encode_tails(window, previous_entries, yf_results):
+    """
+    Barras nuevas de los tickers incrementales de una ventana, codificadas de una vez
+    con csv_writer.encode_frames en lugar de un to_csv por ticker.
+
+    Retorna:
+        - dict: {ticker_wiki: (new_data, data)}, con las barras posteriores a la
+          última fecha escrita y su texto CSV (None si no se pudo codificar en lote;
+          entonces se codifica al escribir el ticker).
+    """
+    tails = {}
+    for ticker_wiki in window:
+        df_yfinance = yf_results.get(ticker_wiki)
+        if ticker_wiki not in previous_entries or df_yfinance is None:
+            continue
+        entry = previous_entries[ticker_wiki]
+        new_data = df_yfinance[df_yfinance.index > pd.Timestamp(entry['last_date'])]
+        if not new_data.empty:
+            tails[ticker_wiki] = new_data
+
+    with get_run_report().stage('write'):
+        frames = [_normalize_output(new_data.copy(), previous_entries[t]['ticker']) for t, new_data in tails.items()]
+        try:
+            encoded = encode_frames(frames)
+        except Exception:
+            encoded = [None] * len(frames)
+    return {ticker_wiki: (new_data, data) for (ticker_wiki, new_data), data in zip(tails.items(), encoded)}
+
+
+def _write_incremental_ticker(f, previous_file, ticker_wiki, previous_entry, tail, verbose=False):
+    """
+    Copia el bloque ya escrito de un ticker desde la salida anterior y le añade las
+    barras nuevas de yfinance.
 
-def process_and_save_data(all_tickers, quandl_dict, local_dict, output_path, correction_map, verbose=False):
+    Args:
+        tail (tuple): (new_data, data) de _encode_tails, o None si no hay barras nuevas.
+
+    Retorna:
+        - entry (dict): Entrada actualizada del manifiesto para el ticker.
+    """
+    entry = dict(previous_entry)
+
+    if f.tell() == 0:
+        f.write(CSV_HEADER)
+    start = f.tell()
+    previous_file.seek(entry['start'])
+    f.write(previous_file.read(entry['end'] - entry['start']))
+
+    if tail is not None:
+        new_data, data = tail
+        if data is None:
+            data = encode_frame(_normalize_output(new_data.copy(), entry['ticker']))
+        f.write(data)
+        entry['last_date'] = new_data.index.max().strftime('%Y-%m-%d')
+        entry['rows'] += len(new_data)
+        if verbose:
+            print(f"[INFO]: Ticker {ticker_wiki}: {len(new_data)} filas nuevas hasta {entry['last_date']}.")
+
+    entry['start'] = start
+    entry['end'] = f.tell()
+    return entry
+
+
+def _plan_window(window, previous_entries, quandl_dict, local_dict, symbols, verbose=False,
+                 load_quandl=True, store=None):
+    """
+    Planifica los tickers de una ventana (ver _plan_ticker y _plan_incremental).
+
+    Con `store` (ResolutionStore), cada ticker nuevo va directo a la fuente que lo
+    resolvió la última vez, y los que solo se pueden buscar en yfinance (sin datos
+    locales ni de Quandl) no se piden si no devolvieron nada y no ha vencido su
+    espera. La continuación en yfinance de los tickers con datos base se pide siempre:
+    una respuesta vacía puntual no debe dejar su serie cortada.
+
+    Retorna:
+        - (plans, ticker_seconds): Plan de cada ticker y segundos empleados en él.
+    """
+    report = get_run_report()
+    ticker_seconds = {}
+    plans = {}
+    with report.stage('plan'):
+        for ticker_wiki in window:
+            start = time.perf_counter()
+            if ticker_wiki in previous_entries:
+                plans[ticker_wiki] = _plan_incremental(previous_entries[ticker_wiki])
+            else:
+                ticker_yf = symbols[ticker_wiki][1]
+                plan = _plan_ticker(
+                    ticker_wiki, symbols[ticker_wiki], quandl_dict, local_dict, verbose, load_quandl=load_quandl,
+                    route=store.source(ticker_wiki, ticker_yf) if store is not None else None
+                )
+                retry_after = store.retry_after(ticker_wiki, ticker_yf) if store is not None else None
+                if plan[4] == 'yfinance' and plan[3] is not None and retry_after is not None:
+                    report.count('yfinance_known_failures_skipped')
+                    if verbose:
+                        print(f"[DEBUG] Ticker {ticker_wiki}: yfinance no tuvo datos de {ticker_yf} en ejecuciones "
+                              f"anteriores. No se vuelve a pedir hasta {retry_after}.")
+                    plan = plan[:3] + (None,) + plan[4:]
+                plans[ticker_wiki] = plan
+            ticker_seconds[ticker_wiki] = time.perf_counter() - start
+    return plans, ticker_seconds
+
+
+def _fetch_window(plans, verbose=False, store=None, previous_entries=()):
+    """
+    Descarga de yfinance, en lotes, lo que piden los planes de una ventana.
+
+    Si se pasa `store` (ResolutionStore), anota si yfinance tuvo datos de cada ticker
+    nuevo que solo se busca en yfinance. No se anotan los fallos transitorios, las
+    continuaciones de datos locales o de Quandl ni los tickers de previous_entries,
+    que solo piden las barras recientes y pueden no tenerlas aún.
+    """
+    yf_requests = {
+        ticker_wiki: (ticker_yf, yf_start)
+        for ticker_wiki, (ticker_yf, _, _, yf_start, _) in plans.items()
+        if yf_start is not None
+    }
+    transient = set()
+    with get_run_report().stage('fetch'):
+        results = fetch_yfinance_data(yf_requests, verbose, transient=transient) if yf_requests else {}
+    if store is not None:
+        for ticker_wiki, (ticker_yf, _) in yf_requests.items():
+            if (plans[ticker_wiki][4] == 'yfinance' and ticker_wiki not in previous_entries
+                    and ticker_wiki not in transient):
+                store.record_yfinance(ticker_wiki, ticker_yf, results.get(ticker_wiki) is not None)
+    return results
+
+
+def _merge_task(ticker_wiki, plan, df_yfinance, verbose=False):
+    """Tarea de _prepare_ticker_task para un ticker planificado."""
+    ticker_yf, base_data, quandl_key, _, source = plan
+    return ticker_wiki, ticker_yf, base_data, quandl_key, df_yfinance, source, verbose
+
+
+class _OrderedWriter:
+    """
+    Escritor único de la salida: escribe los tickers en el orden en que se le pasan,
+    descarta lo escrito a medias si un ticker falla, los anota en el checkpoint y lo
+    guarda cada config.CHECKPOINT_EVERY tickers. Si fallan las barras nuevas de un
+    ticker incremental, se vuelve a copiar su bloque anterior sin cambios.
+    """
+
+    def __init__(self, f, previous_file, previous_entries, checkpoint, output_path, verbose=False):
+        self.f = f
+        self.previous_file = previous_file
+        self.previous_entries = previous_entries
+        self.checkpoint = checkpoint
+        self.output_path = output_path
+        self.verbose = verbose
+        self.report = get_run_report()
+        self.since_checkpoint = 0
+
+    def write(self, ticker_wiki, seconds, tail=None, merged=None):
+        """
+        Escribe un ticker.
+
+        Args:
+            seconds (float): Segundos ya empleados en el ticker (plan).
+            tail (tuple): Barras nuevas de un ticker incremental (ver _encode_tails).
+            merged (tuple): Resultado de _prepare_ticker_task para el resto.
+        """
+        f = self.f
+        block_start = f.tell()
+        try:
+            if ticker_wiki in self.previous_entries:
+                start = time.perf_counter()
+                with self.report.stage('write'):
+                    previous_entry = self.previous_entries[ticker_wiki]
+                    try:
+                        entry = _write_incremental_ticker(
+                            f, self.previous_file, ticker_wiki, previous_entry, tail, self.verbose
+                        )
+                    except Exception as e:
+                        # Si fallan las barras nuevas, el historial ya publicado se
+                        # mantiene tal cual y el ticker no cuenta como fallido.
+                        print(f"[AVISO] Ticker {ticker_wiki}: no se pudieron añadir las barras nuevas ({e}). "
+                              f"Se mantiene el bloque anterior hasta {previous_entry['last_date']}.")
+                        self.report.count('incremental_tail_failures')
+                        f.rollback(block_start)
+                        entry = _write_incremental_ticker(
+                            f, self.previous_file, ticker_wiki, previous_entry, None, self.verbose
+                        )
+                seconds += time.perf_counter() - start
+            else:
+                prepared, error, merge_seconds = merged
+                seconds += merge_seconds
+                self.report.count('merge_seconds_in_workers' if config.MERGE_PROCESSES > 1 else 'merge_seconds',
+                                  merge_seconds)
+                if error is not None:
+                    raise RuntimeError(error)
+                start = time.perf_counter()
+                with self.report.stage('write'):
+                    entry = _write_prepared(f, prepared) if prepared is not None else None
+                seconds += time.perf_counter() - start
+                if entry is not None and self.verbose:
+                    print(f"[INFO]: Ticker {ticker_wiki} Procesado correctamente.")
+        except Exception as e:
+            # Se descarta lo que se haya escrito a medias de este ticker.
+            f.rollback(block_start)
+            entry = None
+            if self.verbose:
+                print(f"[ERROR] Ticker {ticker_wiki}: {e}")
+
+        if entry is not None:
+            self.checkpoint['tickers'][ticker_wiki] = entry
+            self.report.record_ticker(entry['source'], seconds)
+            self.report.count('bytes_written', entry['end'] - entry['start'])
+            self.report.count('rows_written', entry['rows'])
+        else:
+            self.checkpoint['failed'].append(ticker_wiki)
+            self.report.record_ticker('failed', seconds)
+        if self.verbose:
+            print("\n")
+
+        self.since_checkpoint += 1
+        if self.since_checkpoint >= config.CHECKPOINT_EVERY:
+            self.save_checkpoint()
+
+    def save_checkpoint(self):
+        with self.report.stage('write'):
+            _save_checkpoint(self.f, self.checkpoint, self.output_path)
+        self.since_checkpoint = 0
+
+
+def _run_sequential(windows, writer, merge_pool, plan_window, fetch_window, verbose=False):
+    """
+    Procesa las ventanas una tras otra: plan, descarga, unión (en el pool, si lo hay)
+    y escritura en orden.
+    """
+    map_tasks = merge_pool.map if merge_pool is not None else map
+    for window in windows:
+        plans, ticker_seconds = plan_window(window)
+        yf_results = fetch_window(plans)
+        tails = _encode_tails(window, writer.previous_entries, yf_results)
+
+        tasks = [
+            _merge_task(ticker_wiki, plans.pop(ticker_wiki), yf_results.get(ticker_wiki), verbose)
+            for ticker_wiki in window if ticker_wiki not in writer.previous_entries
+        ]
+        prepared_results = map_tasks(_prepare_ticker_task, tasks)
+
+        for ticker_wiki in window:
+            if ticker_wiki in writer.previous_entries:
+                writer.write(ticker_wiki, ticker_seconds[ticker_wiki], tail=tails.get(ticker_wiki))
+            else:
+                try:
+                    with writer.report.stage('merge'):
+                        merged = next(prepared_results)
+                except Exception as e:
+                    merged = (None, str(e), 0.0)
+                writer.write(ticker_wiki, ticker_seconds[ticker_wiki], merged=merged)
+
+
+async def _run_async(windows, writer, merge_pool, plan_window, fetch_window, verbose=False):
+    """
+    Procesa las ventanas como un pipeline productor/consumidor de tres etapas
+    unidas por colas acotadas (config.ASYNC_QUEUE_SIZE):
+
+    1. Descarga: planifica y descarga ventana a ventana (en un hilo) y encola cada ticker.
+    2. Unión: lanza la unión de cada ticker en el pool y encola el resultado pendiente.
+    3. Escritura: espera los resultados en el orden de llegada y los escribe (en un hilo).
+
+    Así la descarga de la ventana siguiente se solapa con la unión y la escritura de
+    la actual. Cuando una cola se llena, la etapa anterior espera, lo que acota la
+    memoria a unas pocas ventanas. El orden de los tickers no cambia, así que la
+    salida es idéntica a la de _run_sequential.
+    """
+    loop = asyncio.get_running_loop()
+    fetched = asyncio.Queue(maxsize=config.ASYNC_QUEUE_SIZE)
+    merged = asyncio.Queue(maxsize=config.ASYNC_QUEUE_SIZE)
+    fetch_executor = ThreadPoolExecutor(max_workers=1)
+    merge_executor = merge_pool if merge_pool is not None else ThreadPoolExecutor(max_workers=1)
+    write_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def fetch_stage():
+        for window in windows:
+            plans, ticker_seconds = await loop.run_in_executor(fetch_executor, plan_window, window)
+            yf_results = await loop.run_in_executor(fetch_executor, fetch_window, plans)
+            tails = await loop.run_in_executor(
+                fetch_executor, _encode_tails, window, writer.previous_entries, yf_results
+            )
+            for ticker_wiki in window:
+                await fetched.put((ticker_wiki, plans.pop(ticker_wiki), yf_results.pop(ticker_wiki, None),
+                                   tails.get(ticker_wiki), ticker_seconds[ticker_wiki]))
+        await fetched.put(None)
+
+    async def merge_stage():
+        while (item := await fetched.get()) is not None:
+            ticker_wiki, plan, df_yfinance, tail, seconds = item
+            pending = None
+            if ticker_wiki not in writer.previous_entries:
+                task = _merge_task(ticker_wiki, plan, df_yfinance, verbose)
+                pending = loop.run_in_executor(merge_executor, _prepare_ticker_task, task)
+            await merged.put((ticker_wiki, pending, tail, seconds))
+        await merged.put(None)
+
+    async def write_stage():
+        while (item := await merged.get()) is not None:
+            ticker_wiki, pending, tail, seconds = item
+            result = None
+            if pending is not None:
+                try:
+                    with writer.report.stage('merge'):
+                        result = await pending
+                except Exception as e:
+                    result = (None, str(e), 0.0)
+            await loop.run_in_executor(write_executor, partial(
+                writer.write, ticker_wiki, seconds, tail=tail, merged=result
+            ))
+
+    stages = [asyncio.ensure_future(stage()) for stage in (fetch_stage, merge_stage, write_stage)]
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        for stage in stages:
+            stage.cancel()
+        fetch_executor.shutdown(wait=True)
+        write_executor.shutdown(wait=True)
+        if merge_executor is not merge_pool:
+            merge_executor.shutdown(wait=True)
+
+
+def process_and_save_data(all_tickers, quandl_dict, local_dict, output_path, correction_map, verbose=False,
+                          incremental=False, async_pipeline=None, shard=None, retry_failed=False):
     """
     Función principal que implementa la "cascada" de datos:
     1. Intenta con datos locales.
     2. Intenta Quandl.
     3. Rellena/Extiende con yfinance.
     4. Guarda incrementalmente en el archivo de salida.
+
+    Los tickers se procesan por ventanas: las descargas de yfinance de cada ventana
+    se hacen a la vez (ver fetch_yfinance_data), la unión y conversión a CSV de cada
+    ticker se reparte en un pool de procesos (config.MERGE_PROCESSES) y un único
+    escritor guarda los resultados en orden, en bloques grandes (ver
+    csv_writer.CsvBatchWriter). La conversión a CSV es vectorizada y las barras
+    nuevas de los tickers incrementales se codifican por ventanas (ver
+    csv_writer.encode_frames). El tiempo de cada etapa y de cada ticker
+    queda en el informe de la ejecución (ver run_report.get_run_report).
+
+    Los símbolos de TICKER_CORRECTION_MAP se resuelven una vez al empezar y el
+    registro de resolución (config.RESOLUTION_STORE_PATH, ver
+    resolution_store.ResolutionStore) guarda la fuente de cada ticker y los símbolos
+    que yfinance no encontró, que no se vuelven a pedir hasta que vence su espera.
+
+    La salida se escribe primero en un archivo parcial con checkpoints periódicos
+    (config.CHECKPOINT_EVERY); si la ejecución se interrumpe, la siguiente continúa
+    en el primer ticker sin terminar. Al acabar, el parcial sustituye a la salida y
+    se guarda su manifiesto (rangos de bytes y última fecha de cada ticker).
+
+    Args:
+        incremental (bool): Si es True y existe un manifiesto completo de la salida
+                            anterior, los tickers ya escritos se copian tal cual y solo
+                            se descargan de yfinance las barras nuevas.
+        async_pipeline (bool, opcional): Si es True, las etapas se solapan en un pipeline
+                                         asyncio (ver _run_async). Por defecto
+                                         config.ASYNC_PIPELINE.
+        shard (tuple, opcional): (index, count) de main.py --shard; solo se procesan
+                                 los tickers de ese shard (ver shards.in_shard).
+        retry_failed (bool): Si es True, se vuelven a pedir a yfinance los símbolos que
+                             no encontró en ejecuciones anteriores.
     
     Retorna:
         - failed_tickers (list): Lista de tickers que no se pudieron encontrar.
         - tickers_encontrados (int): Conteo de tickers exitosos.
     """
+    if async_pipeline is None:
+        async_pipeline = config.ASYNC_PIPELINE
     
-    failed_tickers = []
-    tickers_encontrados = 0
-    
+    previous = None
+    if incremental:
+        previous = load_manifest(manifest_path_for(output_path))
+        if previous is None or not previous['complete'] or not os.path.exists(output_path):
+            if verbose:
+                print("[INFO] No hay un manifiesto completo de la salida anterior. Se reconstruye todo.")
+            previous = None
+    previous_entries = previous['tickers'] if previous else {}
+
+    window_size = max(1, config.YF_BATCH_SIZE * config.YF_MAX_WORKERS)
+    f, checkpoint = _open_checkpoint(output_path, previous, verbose)
+    done = set(checkpoint['tickers']) | set(checkpoint['failed'])
+    pending_tickers = [
+        t for t in sorted(set(all_tickers) | set(previous_entries)) if t not in done and in_shard(t, shard)
+    ]
+    windows = [pending_tickers[w:w + window_size] for w in range(0, len(pending_tickers), window_size)]
+    symbols = resolve_symbols(pending_tickers, correction_map)
+    store = ResolutionStore(config.RESOLUTION_STORE_PATH, ignore_failures=retry_failed)
+
+    # Con pool, los almacenes de Quandl perezosos (Parquet o índice) se envían una vez
+    # a cada proceso y cada uno lee sus tickers; con el diccionario en memoria o sin
+    # pool, los datos se cargan aquí y viajan con la tarea.
+    use_pool = config.MERGE_PROCESSES > 1
+    lazy_quandl = use_pool and hasattr(quandl_dict, 'last_date')
+    pool = ProcessPoolExecutor(
+        max_workers=config.MERGE_PROCESSES,
+        initializer=_init_merge_worker,
+        initargs=(quandl_dict if lazy_quandl else None,)
+    ) if use_pool else nullcontext()
+
+    def plan_window(window):
+        return _plan_window(
+            window, previous_entries, quandl_dict, local_dict, symbols, verbose, load_quandl=not lazy_quandl,
+            store=store
+        )
+
+    def fetch_window(plans):
+        return _fetch_window(plans, verbose, store=store, previous_entries=previous_entries)
+
     try:
-        with open(output_path, 'w', newline='', encoding='utf-8') as f:
-            
-            header_written = False 
-            
-            for i, ticker_wiki in enumerate(sorted(list(all_tickers))):
-                
-                full_data = None
-                ticker_yf = correction_map.get(ticker_wiki, {}).get("yfinance", ticker_wiki)
-
-                if ticker_wiki in local_dict:
-                    if verbose:
-                        print(f"[DEBUG] Ticker {ticker_wiki}: Encontrado en datos locales.")
-                    full_data = local_dict[ticker_wiki].copy()
-                
-                else:
-                    ticker_q = correction_map.get(ticker_wiki, {}).get("quandl", ticker_wiki)
-                    df_quandl = quandl_dict.get(ticker_q, pd.DataFrame()).copy()
-                    
-                    df_yfinance = None
-                    if not df_quandl.empty:
-                        if verbose:
-                            print(f"[DEBUG] Ticker {ticker_wiki}: Encontrado en Quandl.")
-                        last_quandl_date = df_quandl.index.max()
-                        if last_quandl_date < datetime.now() - pd.Timedelta(days=1):
-                            if verbose:
-                                print(f"[DEBUG] Ticker {ticker_wiki}: Intentando complementar la información con yfinance...")
-                            df_yfinance = get_yfinance_data(ticker_yf, last_quandl_date, verbose)
-                    else:
-                        if verbose:
-                            print(f"[DEBUG] Ticker {ticker_wiki}: No encontrado en Quandl. Intentando descargar la información completa con yfinance.")
-                        df_yfinance = get_yfinance_data(ticker_yf, '1990-01-01', verbose)
-                        
-                    if not df_quandl.empty or (df_yfinance is not None and not df_yfinance.empty):
-                        full_data = pd.concat([df_quandl, df_yfinance])
-                        full_data = full_data[~full_data.index.duplicated(keep='first')]
-                        full_data.sort_index(inplace=True)
-                        if verbose and df_yfinance is not None and not df_yfinance.empty:
-                            print(f"[DEBUG] Ticker {ticker_wiki}: Descargando la información completa. Datos desde {full_data.index.min().strftime('%Y-%m-%d')} hasta {full_data.index.max().strftime('%Y-%m-%d')}.")
-
-                if full_data is not None and not full_data.empty:
-                    full_data['ticker'] = ticker_yf
-                    full_data.reset_index(inplace=True) 
-                    
-                    cols = ['ticker', 'date', 'Open', 'High', 'Low', 'Adj Close', 'Volume']
-                    
-                    for col in cols:
-                        if col not in full_data.columns:
-                            full_data[col] = pd.NA
-
-                    full_data = full_data[cols]
-                    
-                    full_data.to_csv(f, header=(not header_written), index=False, mode='a')
-                    
-                    header_written = True 
-                    tickers_encontrados += 1
-                    if verbose:
-                        print(f"[INFO]: Ticker {ticker_wiki} Procesado correctamente.")
-                    
-                else:
-                    if verbose:
-                        print(f"[DEBUG] Ticker {ticker_wiki}: Falló el análisis con Quandl y yfinance.")
-                    failed_tickers.append(ticker_wiki)
-                if verbose:
-                    print("\n")
-        
-        return failed_tickers, tickers_encontrados
+        with pool, f, (open(output_path, 'rb') if previous else nullcontext()) as previous_file:
+            out = CsvBatchWriter(f)
+            writer = _OrderedWriter(out, previous_file, previous_entries, checkpoint, output_path, verbose)
+            merge_pool = pool if use_pool else None
+            if async_pipeline:
+                asyncio.run(_run_async(windows, writer, merge_pool, plan_window, fetch_window, verbose))
+            else:
+                _run_sequential(windows, writer, merge_pool, plan_window, fetch_window, verbose)
+            writer.save_checkpoint()
+
+        checkpoint['complete'] = True
+        os.replace(partial_path_for(output_path), output_path)
+        save_manifest(manifest_path_for(output_path), checkpoint)
+        os.remove(manifest_path_for(partial_path_for(output_path)))
 
     except Exception as e:
         if verbose:
             print(f"[ERROR] Ocurrió un error procesando los datos: {e}")
-        return failed_tickers, tickers_encontrados 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-v', '--verbose', action='store_true', help='Activa el modo verbose para depuración.')
-    args = parser.parse_args()
+    for ticker_wiki, entry in checkpoint['tickers'].items():
+        if ticker_wiki not in previous_entries:
+            store.record_source(ticker_wiki, entry['ticker'], entry['source'])
+    try:
+        store.save()
+    except OSError as e:
+        print(f"[AVISO] No se pudo guardar el registro de resolución de tickers: {e}")
+
+    failed_tickers = [t for t in checkpoint['failed'] if t not in checkpoint['tickers']]
+    return failed_tickers, len(checkpoint['tickers'])
 
-    df_current, df_cambios, all_tickers_ever = scrape_sp500_data()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construye el dataset de precios del S&P 500 sin sesgo de supervivencia.")
+    add_build_arguments(parser)
+    run(parser.parse_args(argv))
 
-    quandl_data_dict = load_and_preprocess_quandl(config.QUANDL_FILE_PATH)
-    local_data_dict = load_and_process_local_data(config.DATA_DIR)
 
-    if df_cambios is None or quandl_data_dict is None or all_tickers_ever is None:
-        print("Error en los pasos iniciales (Wikipedia o Quandl). Saliendo del script.")
-        sys.exit(1)
-        
-    failed_tickers, found_count = process_and_save_data(
-        all_tickers_ever,
-        quandl_data_dict,
-        local_data_dict,
-        config.FINAL_OUTPUT_PATH,
-        config.TICKER_CORRECTION_MAP,
-        args.verbose
-    )
+def run(args):
+    """Ejecuta la construcción del dataset con los argumentos de cli.add_build_arguments."""
+    # Cada shard escribe su propia salida e informe; el dataset final y los pasos que
+    # trabajan sobre él (columnar, panel, series derivadas, validación, instantánea,
+    # copia comprimida) son de --compact.
+    output_path = config.FINAL_OUTPUT_PATH
+    report_path = args.report
+    if args.shard is not None:
+        os.makedirs(config.SHARD_DIR, exist_ok=True)
+        output_path = shard_output_path(config.FINAL_OUTPUT_PATH, args.shard)
+        if report_path == config.RUN_REPORT_PATH:
+            report_path = shard_report_path(config.RUN_REPORT_PATH, args.shard)
+        if args.columnar or args.panel or args.derived or args.validate or args.snapshot or args.compress:
+            print("[AVISO] --columnar, --panel, --derived, --validate, --snapshot y --compress se aplican al "
+                  "dataset final; se omiten en los shards. Úsalos con --compact.")
+            args.columnar = args.panel = args.derived = args.validate = args.snapshot = False
+            args.compress = None
+
+    report = get_run_report()
+    report.start_profiling(cprofile=args.profile, trace_memory=args.trace_memory)
+    shard_reports = None
+
+    if args.compact is not None:
+        with report.stage('compact'):
+            compacted = compact_shards(output_path, args.compact, report_path=args.report, verbose=args.verbose)
+        if compacted is None:
+            report.stop_profiling(config.RUN_PROFILE_PATH if args.profile else None)
+            report.save(report_path)
+            sys.exit(1)
+        failed_tickers, found_count, shard_reports = compacted
+    else:
+        with report.stage('scrape'):
+            df_current, df_cambios, all_tickers_ever = scrape_sp500_data()
+
+        quandl_tickers = None
+        if all_tickers_ever is not None:
+            quandl_tickers = {
+                ticker_q for ticker_q, _ in resolve_symbols(
+                    [t for t in all_tickers_ever if in_shard(t, args.shard)], config.TICKER_CORRECTION_MAP
+                ).values()
+            }
+        with report.stage('quandl_load'):
+            quandl_data_dict = open_quandl_store(config.QUANDL_FILE_PATH, tickers=quandl_tickers, verbose=args.verbose)
+        with report.stage('local_load'):
+            local_data_dict = load_and_process_local_data(config.DATA_DIR)
+
+        if df_cambios is None or quandl_data_dict is None or all_tickers_ever is None:
+            print("Error en los pasos iniciales (Wikipedia o Quandl). Saliendo del script.")
+            report.stop_profiling(config.RUN_PROFILE_PATH if args.profile else None)
+            report.save(report_path)
+            sys.exit(1)
+
+        failed_tickers, found_count = process_and_save_data(
+            all_tickers_ever,
+            quandl_data_dict,
+            local_data_dict,
+            output_path,
+            config.TICKER_CORRECTION_MAP,
+            args.verbose,
+            incremental=args.incremental,
+            async_pipeline=args.async_pipeline,
+            shard=args.shard,
+            retry_failed=args.retry_failed
+        )
     
     print(f"\nREPORTE FINAL")
     print(f"Datos encontrados y guardados para {found_count} tickers.")
-    print(f"Dataset completo guardado en '{config.FINAL_OUTPUT_PATH}'.")
+    print(f"Dataset {'del shard' if args.shard is not None else 'completo'} guardado en '{output_path}'.")
+
+    if args.columnar:
+        with report.stage('columnar'):
+            columnar_stats = write_columnar_output(config.FINAL_OUTPUT_PATH, config.COLUMNAR_OUTPUT_DIR, verbose=args.verbose)
+        if columnar_stats is not None:
+            print(f"Dataset columnar guardado en '{config.COLUMNAR_OUTPUT_DIR}'.")
+
+    if args.panel:
+        build_or_update = update_panel if args.incremental else build_panel
+        with report.stage('panel'):
+            panel_meta = build_or_update(config.FINAL_OUTPUT_PATH, config.PANEL_DIR, verbose=args.verbose)
+        if panel_meta is not None:
+            print(f"Panel fechas x tickers guardado en '{config.PANEL_DIR}'.")
+
+    if args.derived:
+        with report.stage('derived'):
+            derived_meta = derive_features(config.FINAL_OUTPUT_PATH, config.DERIVED_DIR, verbose=args.verbose)
+        if derived_meta is not None:
+            print(f"Series derivadas guardadas en '{config.DERIVED_DIR}'.")
+
+    if args.validate:
+        with report.stage('validate'):
+            quality = validate_output(config.FINAL_OUTPUT_PATH, config.QUALITY_REPORT_PATH, verbose=args.verbose)
+        if quality is not None:
+            report.count('quality_flagged_tickers', int(quality['flagged'].sum()))
+
+    if args.snapshot:
+        with report.stage('snapshot'):
+            snapshot = publish_snapshot(config.FINAL_OUTPUT_PATH, config.SNAPSHOT_DIR, verbose=args.verbose)
+        if snapshot is not None:
+            report.count('snapshot_changed_tickers',
+                         len(snapshot['changes']['added']) + len(snapshot['changes']['changed']))
+            print(f"Instantánea {snapshot['version']} publicada en '{config.SNAPSHOT_DIR}'.")
+
+    if args.compress:
+        with report.stage('compress'):
+            compressed_path = compress_output(config.FINAL_OUTPUT_PATH, args.compress, verbose=args.verbose)
+        if compressed_path is not None:
+            print(f"Copia comprimida del dataset guardada en '{compressed_path}'.")
+
+    report.stop_profiling(config.RUN_PROFILE_PATH if args.profile else None)
+    report.save(report_path, shard_reports=shard_reports)
+    print(f"Informe de la ejecución guardado en '{report_path}'.")
 
     if failed_tickers:
         print(f"\nDatos NO encontrados para {len(failed_tickers)} tickers.")
@@ -1,7 +1,9 @@
 import pandas as pd
 import argparse
 import config
+from cli import add_constituents_arguments
 from data_fetchers import scrape_sp500_data
+from membership import build_membership_intervals
 
 def generate_files(current_only=False):
     """
@@ -10,8 +12,8 @@ def generate_files(current_only=False):
     Args:
         current_only (bool): Si es True, solo extrae y guarda los 
                              constituyentes actuales. Si es False, genera
-                             los archivos completos de cambios históricos
-                             y fechas de tickers.
+                             los archivos completos de cambios históricos,
+                             fechas de tickers e intervalos de pertenencia.
     """
     df_current, df_changes, all_tickers_ever = scrape_sp500_data()
 
@@ -51,16 +53,18 @@ def generate_files(current_only=False):
 
     print(f"Archivo de fechas de tickers generado: {config.TICKER_DATES_PATH}")
 
+    intervals, inconsistent = build_membership_intervals(current_tickers, df_changes)
+    intervals.to_csv(config.MEMBERSHIP_INTERVALS_PATH, index=False, date_format='%Y-%m-%d')
+    print(f"Intervalos exactos de pertenencia generados: {config.MEMBERSHIP_INTERVALS_PATH}")
+    if inconsistent:
+        print(f"Tickers añadidos sin rastro posterior en el índice (posibles cambios de símbolo): {inconsistent}")
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Generar archivos de datos de constituyentes del S&P 500 desde Wikipedia."
     )
-    parser.add_argument(
-        '--current-only',
-        action='store_true',
-        help="Si se establece, solo extrae y guarda los constituyentes actuales del S&P 500."
-    )
+    add_constituents_arguments(parser)
     args = parser.parse_args()
 
     generate_files(args.current_only)
\ No newline at end of file
@@ -0,0 +1,63 @@
+import json
+import os
+from datetime import datetime
+
+from utils import write_json_atomic
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(data_path):
+    """Ruta del manifiesto asociado a un archivo de datos."""
+    return data_path + '.manifest.json'
+
+
+def partial_path_for(data_path):
+    """Ruta del archivo parcial donde se escribe una ejecución en curso."""
+    return data_path + '.partial'
+
+
+def new_manifest(incremental=False):
+    """
+    Crea un manifiesto vacío.
+
+    El manifiesto registra, para cada ticker escrito, el símbolo usado en la salida,
+    la fuente de los datos, el rango de bytes [start, end) que ocupa en el CSV, la
+    última fecha y el número de filas. Si la serie continúa con yfinance tras los
+    datos de Quandl o locales, 'seam_date' es la última fecha de estos. También guarda los tickers fallidos y los
+    bytes escritos hasta el último checkpoint.
+    """
+    return {
+        'version': MANIFEST_VERSION,
+        'incremental': incremental,
+        'complete': False,
+        'bytes_written': 0,
+        'tickers': {},
+        'failed': [],
+        'updated_at': None
+    }
+
+
+def load_manifest(path):
+    """
+    Lee un manifiesto.
+
+    Retorna:
+        - dict: El manifiesto, o None si no existe, está corrupto o es de otra versión.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(path, manifest):
+    """Guarda el manifiesto de forma atómica, sellando la fecha de actualización."""
+    manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    write_json_atomic(path, manifest)
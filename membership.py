@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+import config
+
+# Las fechas se manejan como días desde 1970-01-01 (int64). Los intervalos abiertos
+# usan estos extremos.
+MIN_DAY = np.iinfo(np.int32).min
+MAX_DAY = np.iinfo(np.int32).max
+
+# Separación entre tickers en la clave compuesta (código, día) usada en is_member.
+_KEY_SPAN = np.int64(1) << 33
+
+
+def _to_days(dates):
+    """Convierte fechas a días desde epoch (int64). NaT se devuelve como MIN_DAY."""
+    values = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[D]')
+    days = values.astype(np.int64)
+    days[np.isnat(values)] = MIN_DAY
+    return days
+
+
+def build_membership_intervals(current_tickers, df_changes):
+    """
+    Reconstruye los intervalos exactos de pertenencia al índice recorriendo los
+    cambios históricos hacia atrás desde la composición actual.
+
+    Cada intervalo es semiabierto [start_date, end_date): el ticker añadido en una
+    fecha pertenece al índice ese mismo día y el eliminado ya no. Un ticker que salió
+    y volvió a entrar tiene varios intervalos. start_date vacío indica que ya era
+    miembro antes del primer cambio registrado; end_date vacío, que sigue en el índice.
+
+    Args:
+        current_tickers (iterable): Constituyentes actuales.
+        df_changes (pd.DataFrame): Cambios con columnas 'Date', 'Added_Ticker' y 'Removed_Ticker'.
+
+    Retorna:
+        - pd.DataFrame: Columnas ['ticker', 'start_date', 'end_date'], ordenado por ticker y fecha.
+        - list: Tickers añadidos según los cambios que no aparecen como miembros
+                posteriormente (historial incoherente); no generan intervalo.
+    """
+    changes = df_changes.dropna(subset=['Date']).sort_values('Date', ascending=False)
+    open_end = {ticker: pd.NaT for ticker in current_tickers}
+    intervals = []
+    inconsistent = []
+
+    for date, day_changes in changes.groupby('Date', sort=False):
+        for ticker in day_changes['Added_Ticker'].dropna():
+            if ticker in open_end:
+                intervals.append((ticker, date, open_end.pop(ticker)))
+            else:
+                inconsistent.append(ticker)
+        for ticker in day_changes['Removed_Ticker'].dropna():
+            if ticker not in open_end:
+                open_end[ticker] = date
+
+    for ticker, end_date in open_end.items():
+        intervals.append((ticker, pd.NaT, end_date))
+
+    df_intervals = pd.DataFrame(intervals, columns=['ticker', 'start_date', 'end_date'])
+    df_intervals['start_date'] = pd.to_datetime(df_intervals['start_date'])
+    df_intervals['end_date'] = pd.to_datetime(df_intervals['end_date'])
+    df_intervals = df_intervals.sort_values(['ticker', 'start_date'], na_position='first').reset_index(drop=True)
+
+    # Una salida y reentrada el mismo día (p. ej. cambios de clase de acción) no
+    # interrumpe la pertenencia: se fusionan los intervalos contiguos.
+    contiguous = (
+        (df_intervals['ticker'] == df_intervals['ticker'].shift()) &
+        (df_intervals['start_date'] == df_intervals['end_date'].shift())
+    )
+    group = (~contiguous).cumsum()
+    first_rows = df_intervals[~contiguous]
+    last_rows = df_intervals.groupby(group).tail(1)
+    df_intervals = pd.DataFrame({
+        'ticker': first_rows['ticker'].to_numpy(),
+        'start_date': first_rows['start_date'].to_numpy(),
+        'end_date': last_rows['end_date'].to_numpy()
+    })
+    return df_intervals, sorted(set(inconsistent))
+
+
+class MembershipIndex:
+    """
+    Índice de pertenencia al S&P 500 sobre arrays ordenados, pensado para consultas
+    masivas (muchas fechas × muchos tickers) en una sola llamada vectorizada.
+
+    Args:
+        intervals (pd.DataFrame): Salida de build_membership_intervals.
+    """
+
+    def __init__(self, intervals):
+        tickers = intervals['ticker'].astype(str).to_numpy()
+        self.tickers = np.unique(tickers)
+        codes = np.searchsorted(self.tickers, tickers)
+        starts = _to_days(intervals['start_date'])
+        ends = _to_days(intervals['end_date'])
+        ends[ends == MIN_DAY] = MAX_DAY
+
+        order = np.lexsort((starts, codes))
+        self._codes = codes[order]
+        self._starts = starts[order]
+        self._ends = ends[order]
+        self._keys = self._codes * _KEY_SPAN + (self._starts - MIN_DAY)
+
+    @classmethod
+    def from_files(cls, constituents_path=None, changes_path=None):
+        """Construye el índice a partir de los CSV de constituyentes y cambios históricos."""
+        df_current = pd.read_csv(constituents_path or config.CONSTITUENTS_PATH)
+        df_changes = pd.read_csv(changes_path or config.HISTORICAL_CHANGES_PATH, parse_dates=['Date'])
+        intervals, _ = build_membership_intervals(df_current['Symbol'], df_changes)
+        return cls(intervals)
+
+    @classmethod
+    def from_intervals_file(cls, path=None):
+        """Construye el índice a partir de los intervalos ya guardados por manage_constituents."""
+        intervals = pd.read_csv(
+            path or config.MEMBERSHIP_INTERVALS_PATH, parse_dates=['start_date', 'end_date'],
+            keep_default_na=False, na_values=['']
+        )
+        return cls(intervals)
+
+    def _ticker_codes(self, tickers):
+        tickers = np.asarray(tickers, dtype=str)
+        codes = np.searchsorted(self.tickers, tickers)
+        codes = np.minimum(codes, len(self.tickers) - 1)
+        known = self.tickers[codes] == tickers if len(self.tickers) else np.zeros(len(tickers), dtype=bool)
+        return np.where(known, codes, -1)
+
+    def is_member(self, tickers, dates):
+        """
+        Pertenencia de pares (ticker, fecha), p. ej. las filas de un dataset en formato largo.
+
+        Args:
+            tickers (array-like): Tickers, uno por fila.
+            dates (array-like): Fechas, una por fila.
+
+        Retorna:
+            - np.ndarray: Array booleano con una posición por par.
+        """
+        codes = self._ticker_codes(tickers)
+        days = _to_days(dates)
+        query = codes * _KEY_SPAN + (days - MIN_DAY)
+        idx = np.searchsorted(self._keys, query, side='right') - 1
+        valid = (idx >= 0) & (codes >= 0)
+        idx = np.where(valid, idx, 0)
+        return valid & (self._codes[idx] == codes) & (days < self._ends[idx]) & (days >= self._starts[idx])
+
+    def membership_matrix(self, dates, tickers):
+        """
+        Matriz booleana de pertenencia fechas × tickers, calculada en una sola pasada
+        sobre los intervalos (diferencias acumuladas), sin recorrer fecha a fecha.
+
+        Args:
+            dates (array-like): Fechas (filas de la matriz), en cualquier orden.
+            tickers (array-like): Tickers (columnas de la matriz).
+
+        Retorna:
+            - np.ndarray: Array booleano de forma (len(dates), len(tickers)).
+        """
+        days = _to_days(dates)
+        order = np.argsort(days, kind='stable')
+        sorted_days = days[order]
+
+        unique_tickers, inverse = np.unique(np.asarray(tickers, dtype=str), return_inverse=True)
+        columns = self._ticker_codes(unique_tickers)
+        column_of_code = np.full(len(self.tickers), -1)
+        requested = columns >= 0
+        column_of_code[columns[requested]] = np.flatnonzero(requested)
+
+        interval_columns = column_of_code[self._codes] if len(self._codes) else np.array([], dtype=int)
+        used = interval_columns >= 0
+        lo = np.searchsorted(sorted_days, self._starts[used], side='left')
+        hi = np.searchsorted(sorted_days, self._ends[used], side='left')
+
+        counts = np.zeros((len(sorted_days) + 1, len(columns)), dtype=np.int32)
+        np.add.at(counts, (lo, interval_columns[used]), 1)
+        np.add.at(counts, (hi, interval_columns[used]), -1)
+        sorted_matrix = np.cumsum(counts[:-1], axis=0) > 0
+
+        matrix = np.empty_like(sorted_matrix)
+        matrix[order] = sorted_matrix
+        return matrix[:, inverse]
+
+    def membership_frame(self, dates, tickers):
+        """Igual que membership_matrix, pero como DataFrame indexado por fecha y ticker."""
+        return pd.DataFrame(
+            self.membership_matrix(dates, tickers),
+            index=pd.DatetimeIndex(pd.to_datetime(dates), name='date'),
+            columns=pd.Index(tickers, name='ticker')
+        )
+
+    def members_on(self, date):
+        """Lista ordenada de los tickers que pertenecían al índice en `date`."""
+        return self.tickers[self.membership_matrix([date], self.tickers)[0]].tolist()
@@ -0,0 +1,259 @@
+import json
+import os
+import shutil
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import config
+from manifest import load_manifest, manifest_path_for
+from utils import write_json_atomic
+
+PANEL_FIELDS = ['Open', 'High', 'Low', 'Adj Close', 'Volume']
+PANEL_META_NAME = 'meta.json'
+DATES_FILE_NAME = 'dates.npy'
+
+# Filas extra reservadas al crear o ampliar los arrays, para poder añadir fechas sin copiar.
+PANEL_GROWTH_ROWS = 512
+
+
+def _field_file_name(field):
+    return field.lower().replace(' ', '_') + '.npy'
+
+
+def _read_csv_rows(f, header, start, end):
+    """Lee las filas del CSV de salida que ocupan el rango de bytes [start, end)."""
+    if end <= start:
+        return pd.DataFrame(columns=['date'] + PANEL_FIELDS)
+    f.seek(start)
+    data = f.read(end - start)
+    return pd.read_csv(
+        BytesIO(header + data),
+        usecols=['date'] + PANEL_FIELDS,
+        dtype={field: 'float64' for field in PANEL_FIELDS},
+        parse_dates=['date']
+    )
+
+
+def _to_days(dates):
+    return pd.DatetimeIndex(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+def _allocate(panel_dir, n_tickers, capacity):
+    """Crea los arrays vacíos (NaN) de todos los campos y el eje de fechas."""
+    arrays = {}
+    for field in PANEL_FIELDS:
+        array = np.lib.format.open_memmap(
+            os.path.join(panel_dir, _field_file_name(field)), mode='w+',
+            dtype=config.PANEL_DTYPE, shape=(capacity, n_tickers)
+        )
+        array[:] = np.nan
+        arrays[field] = array
+    dates = np.lib.format.open_memmap(
+        os.path.join(panel_dir, DATES_FILE_NAME), mode='w+', dtype=np.int64, shape=(capacity,)
+    )
+    return arrays, dates
+
+
+def _fill(arrays, days_axis, df, column, row_offset=0):
+    """Escribe las filas de un ticker en su columna, alineadas con el eje de fechas."""
+    rows = np.searchsorted(days_axis, _to_days(df['date'])) + row_offset
+    for field in PANEL_FIELDS:
+        arrays[field][rows, column] = df[field].to_numpy()
+
+
+def build_panel(csv_path, panel_dir, verbose=False):
+    """
+    Construye desde cero el panel fechas × tickers a partir del CSV de salida.
+
+    Se guarda un array 2-D por campo (.npy, abrible con memory-map) sobre un eje común
+    de días de negociación, más el eje de fechas (dates.npy) y los tickers (meta.json).
+    Los arrays se reservan con filas extra para poder añadir fechas sin copiarlos.
+
+    Args:
+        csv_path (str): Ruta al CSV de salida (debe tener un manifiesto completo).
+        panel_dir (str): Directorio del panel. Se reemplaza entero.
+        verbose (bool): Si es True, informa del progreso.
+
+    Retorna:
+        - meta (dict): Metadatos del panel, o None si falla.
+    """
+    manifest = load_manifest(manifest_path_for(csv_path))
+    if manifest is None or not manifest['complete']:
+        print(f"[ERROR] No hay un manifiesto completo para {csv_path}; no se genera el panel.")
+        return None
+
+    entries = sorted(manifest['tickers'].items(), key=lambda item: item[1]['start'])
+    tmp_dir = panel_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        all_dates = pd.read_csv(csv_path, usecols=['date'], parse_dates=['date'])['date']
+        days_axis = np.unique(_to_days(all_dates))
+        del all_dates
+
+        n_dates = len(days_axis)
+        capacity = n_dates + PANEL_GROWTH_ROWS
+        arrays, dates = _allocate(tmp_dir, len(entries), capacity)
+        dates[:n_dates] = days_axis
+
+        with open(csv_path, 'rb') as f:
+            header = f.readline()
+            for column, (_, entry) in enumerate(entries):
+                _fill(arrays, days_axis, _read_csv_rows(f, header, entry['start'], entry['end']), column)
+
+        for array in list(arrays.values()) + [dates]:
+            array.flush()
+        del arrays, dates
+
+        meta = {
+            'fields': PANEL_FIELDS,
+            'dtype': config.PANEL_DTYPE,
+            'n_dates': int(n_dates),
+            'capacity': int(capacity),
+            'tickers': [entry['ticker'] for _, entry in entries],
+            'wiki_tickers': [ticker_wiki for ticker_wiki, _ in entries],
+            'source_updated_at': manifest['updated_at'],
+            'source_blocks': {ticker_wiki: [entry['start'], entry['end']] for ticker_wiki, entry in entries}
+        }
+        write_json_atomic(os.path.join(tmp_dir, PANEL_META_NAME), meta)
+
+        old_dir = panel_dir + '.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(panel_dir):
+            os.replace(panel_dir, old_dir)
+        os.replace(tmp_dir, panel_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        if verbose:
+            print(f"[INFO] Panel generado en '{panel_dir}': {n_dates} fechas x {len(entries)} tickers.")
+        return meta
+
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"[ERROR] No se pudo generar el panel: {e}")
+        return None
+
+
+def _grow(panel_dir, meta, needed_rows):
+    """Amplía la capacidad (filas) de los arrays copiándolos a archivos nuevos."""
+    capacity = max(needed_rows, meta['n_dates'] + PANEL_GROWTH_ROWS, int(meta['capacity'] * 1.25))
+    n_tickers = len(meta['tickers'])
+    for name, shape, dtype in (
+        [(_field_file_name(field), (capacity, n_tickers), meta['dtype']) for field in meta['fields']] +
+        [(DATES_FILE_NAME, (capacity,), np.int64)]
+    ):
+        path = os.path.join(panel_dir, name)
+        old = np.load(path, mmap_mode='r')
+        new = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtype, shape=shape)
+        if new.ndim == 2:
+            new[:] = np.nan
+        new[:meta['n_dates']] = old[:meta['n_dates']]
+        new.flush()
+        del old, new
+        os.replace(path + '.tmp', path)
+    meta['capacity'] = int(capacity)
+
+
+def update_panel(csv_path, panel_dir, verbose=False):
+    """
+    Actualiza el panel tras una ejecución incremental añadiendo las fechas nuevas
+    en el propio archivo. Solo se leen del CSV los bytes añadidos al final del
+    bloque de cada ticker (según los manifiestos).
+
+    Si el panel no existe, el conjunto de tickers ha cambiado, la salida no procede
+    de una ejecución incremental sobre la que generó el panel o aparecen fechas
+    anteriores a la última del panel, se reconstruye entero con build_panel.
+
+    Retorna:
+        - meta (dict): Metadatos del panel, o None si falla.
+    """
+    meta_path = os.path.join(panel_dir, PANEL_META_NAME)
+    manifest = load_manifest(manifest_path_for(csv_path))
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+
+    can_append = (
+        meta is not None and manifest is not None and manifest['complete']
+        and manifest['incremental'] and manifest.get('base_updated_at') == meta['source_updated_at']
+        and sorted(manifest['tickers']) == sorted(meta['wiki_tickers'])
+    )
+    if not can_append:
+        return build_panel(csv_path, panel_dir, verbose)
+
+    last_day = np.load(os.path.join(panel_dir, DATES_FILE_NAME), mmap_mode='r')[meta['n_dates'] - 1]
+    tails = {}
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        for ticker_wiki in meta['wiki_tickers']:
+            entry = manifest['tickers'][ticker_wiki]
+            old_start, old_end = meta['source_blocks'][ticker_wiki]
+            df = _read_csv_rows(f, header, entry['start'] + (old_end - old_start), entry['end'])
+            if not df.empty:
+                tails[ticker_wiki] = df
+
+    new_days = np.unique(np.concatenate([_to_days(df['date']) for df in tails.values()])) if tails else np.array([], dtype=np.int64)
+    if len(new_days) and new_days[0] <= last_day:
+        if verbose:
+            print("[INFO] Hay fechas nuevas anteriores al final del panel. Se reconstruye.")
+        return build_panel(csv_path, panel_dir, verbose)
+
+    n_dates = meta['n_dates']
+    if n_dates + len(new_days) > meta['capacity']:
+        _grow(panel_dir, meta, n_dates + len(new_days))
+
+    arrays = {
+        field: np.load(os.path.join(panel_dir, _field_file_name(field)), mmap_mode='r+')
+        for field in meta['fields']
+    }
+    dates = np.load(os.path.join(panel_dir, DATES_FILE_NAME), mmap_mode='r+')
+    dates[n_dates:n_dates + len(new_days)] = new_days
+    column_of = {ticker_wiki: i for i, ticker_wiki in enumerate(meta['wiki_tickers'])}
+    for ticker_wiki, df in tails.items():
+        _fill(arrays, new_days, df, column_of[ticker_wiki], row_offset=n_dates)
+    for array in list(arrays.values()) + [dates]:
+        array.flush()
+    del arrays, dates
+
+    # meta.json se escribe al final: hasta entonces los lectores siguen viendo n_dates anterior.
+    meta['n_dates'] = int(n_dates + len(new_days))
+    meta['source_updated_at'] = manifest['updated_at']
+    meta['source_blocks'] = {t: [e['start'], e['end']] for t, e in manifest['tickers'].items()}
+    write_json_atomic(meta_path, meta)
+
+    if verbose:
+        print(f"[INFO] Panel actualizado: {len(new_days)} fechas nuevas.")
+    return meta
+
+
+def open_panel(panel_dir=None, fields=None):
+    """
+    Abre el panel con memory-map (solo lectura).
+
+    Args:
+        panel_dir (str, opcional): Directorio del panel. Por defecto config.PANEL_DIR.
+        fields (list, opcional): Campos a abrir. Por defecto todos.
+
+    Retorna:
+        - dates (pd.DatetimeIndex): Eje de fechas (filas).
+        - tickers (pd.Index): Tickers de la salida (columnas).
+        - arrays (dict): {campo: np.memmap de forma (len(dates), len(tickers))}
+    """
+    if panel_dir is None:
+        panel_dir = config.PANEL_DIR
+    with open(os.path.join(panel_dir, PANEL_META_NAME), encoding='utf-8') as f:
+        meta = json.load(f)
+
+    n_dates = meta['n_dates']
+    days = np.load(os.path.join(panel_dir, DATES_FILE_NAME), mmap_mode='r')[:n_dates]
+    dates = pd.DatetimeIndex(days.astype('datetime64[D]'), name='date')
+    tickers = pd.Index(meta['tickers'], name='ticker')
+    arrays = {
+        field: np.load(os.path.join(panel_dir, _field_file_name(field)), mmap_mode='r')[:n_dates]
+        for field in (fields or meta['fields'])
+    }
+    return dates, tickers, arrays
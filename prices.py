@@ -0,0 +1,271 @@
+import json
+import os
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import config
+from columnar_output import STATS_FILE_NAME
+from manifest import load_manifest, manifest_path_for
+from membership import MembershipIndex
+
+PRICE_FIELDS = ['Open', 'High', 'Low', 'Adj Close', 'Volume']
+KEY_COLUMNS = ['ticker', 'date']
+# Tipo de la columna 'date' en los resultados, sea cual sea el origen (Parquet,
+# CSV o resultado vacío), para que se puedan concatenar y comparar.
+DATE_DTYPE = 'datetime64[ns]'
+
+# Filas leídas de una vez cuando no se puede acotar la lectura por ticker (CSV sin
+# manifiesto) y tamaño máximo de los lotes devueltos desde el dataset Parquet.
+QUERY_BATCH_ROWS = 256 * 1024
+
+
+def _normalize_fields(fields):
+    if fields is None:
+        return list(PRICE_FIELDS)
+    fields = [fields] if isinstance(fields, str) else list(fields)
+    unknown = [field for field in fields if field not in PRICE_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {unknown}. Disponibles: {PRICE_FIELDS}")
+    return fields
+
+
+def _output_tickers(tickers, manifest):
+    """
+    Símbolos de la salida (los de yfinance) que corresponden a los tickers pedidos,
+    que pueden ser de Wikipedia o de yfinance.
+    """
+    tickers = set(tickers)
+    mapping = {
+        ticker_wiki: entry['ticker'] for ticker_wiki, entry in manifest['tickers'].items()
+    } if manifest else {
+        ticker_wiki: fix['yfinance'] for ticker_wiki, fix in config.TICKER_CORRECTION_MAP.items()
+    }
+    return tickers | {mapping[ticker] for ticker in tickers if ticker in mapping}
+
+
+def _wiki_aliases(manifest):
+    """
+    {símbolo de la salida: [tickers de Wikipedia]}. Un símbolo de yfinance puede
+    venir de varios tickers de Wikipedia (p. ej. KRFT y KHC se escriben como KHC).
+    Sin manifiesto se usa TICKER_CORRECTION_MAP y cada símbolo cuenta también como
+    ticker de Wikipedia.
+    """
+    aliases = {}
+    if manifest:
+        for ticker_wiki, entry in manifest['tickers'].items():
+            aliases.setdefault(entry['ticker'], []).append(ticker_wiki)
+        return aliases
+    for ticker_wiki, fix in config.TICKER_CORRECTION_MAP.items():
+        aliases.setdefault(fix['yfinance'], [fix['yfinance']]).append(ticker_wiki)
+    return aliases
+
+
+def _member_mask(index, tickers, dates, aliases):
+    """
+    Pertenencia al índice de cada fila (símbolo de la salida, fecha): una fila es
+    miembro si lo era alguno de los tickers de Wikipedia que escriben ese símbolo.
+    Los símbolos sin alias se consultan tal cual.
+    """
+    tickers = pd.Series(np.asarray(tickers, dtype=str))
+    mask = ~tickers.isin(list(aliases)).to_numpy() & index.is_member(tickers.to_numpy(), dates)
+    depth = max((len(names) for names in aliases.values()), default=0)
+    for k in range(depth):
+        alias = {ticker: names[k] for ticker, names in aliases.items() if len(names) > k}
+        mapped = tickers.map(alias)
+        if mapped.notna().any():
+            mask |= index.is_member(mapped.fillna('').to_numpy(dtype=str), dates)
+    return mask
+
+
+def _filter_dates(df, start, end):
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= (df['date'] >= start).to_numpy()
+    if end is not None:
+        mask &= (df['date'] <= end).to_numpy()
+    return df[mask] if not mask.all() else df
+
+
+def _columnar_is_current(csv_path, columnar_dir):
+    """True si el dataset Parquet existe y se generó después de la última escritura del CSV."""
+    stats_path = os.path.join(columnar_dir, STATS_FILE_NAME)
+    if not os.path.exists(stats_path):
+        return False
+    csv_manifest = manifest_path_for(csv_path)
+    reference = csv_manifest if os.path.exists(csv_manifest) else csv_path
+    return not os.path.exists(reference) or os.path.getmtime(stats_path) >= os.path.getmtime(reference)
+
+
+def _iter_parquet(columnar_dir, tickers, start, end, fields, batch_rows):
+    """Lotes del dataset Parquet; el filtro se evalúa en el escáner (particiones y row groups)."""
+    with open(os.path.join(columnar_dir, STATS_FILE_NAME), encoding='utf-8') as f:
+        partitioning = json.load(f)['partitioning']
+    partition_schema = pa.schema([
+        pa.field(field, pa.string() if field == 'ticker' else pa.int16()) for field in partitioning
+    ])
+    dataset = ds.dataset(
+        columnar_dir, format='parquet', partitioning=ds.partitioning(partition_schema, flavor='hive'),
+        exclude_invalid_files=False, ignore_prefixes=['_', '.']
+    )
+
+    conditions = []
+    if tickers is not None:
+        conditions.append(ds.field('ticker').isin(sorted(tickers)))
+    if start is not None:
+        conditions.append(ds.field('date') >= pa.scalar(start.date(), pa.date32()))
+        if 'year' in partitioning:
+            conditions.append(ds.field('year') >= start.year)
+    if end is not None:
+        conditions.append(ds.field('date') <= pa.scalar(end.date(), pa.date32()))
+        if 'year' in partitioning:
+            conditions.append(ds.field('year') <= end.year)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    for batch in dataset.to_batches(columns=KEY_COLUMNS + fields, filter=expression, batch_size=batch_rows):
+        if batch.num_rows == 0:
+            continue
+        df = batch.to_pandas()
+        df['ticker'] = df['ticker'].astype(str)
+        df['date'] = pd.to_datetime(df['date'])
+        if 'Volume' in fields:
+            df['Volume'] = df['Volume'].astype('float64')
+        yield df
+
+
+def _iter_csv(csv_path, manifest, tickers, start, end, fields, batch_rows):
+    """
+    Bloques del CSV de salida. Con manifiesto se leen solo los rangos de bytes de los
+    tickers pedidos (y se saltan los que terminan antes de `start`); sin él, el
+    archivo se recorre por trozos de `batch_rows` filas.
+    """
+    dtypes = {field: 'float64' for field in fields}
+    dtypes['ticker'] = 'str'
+    usecols = KEY_COLUMNS + fields
+
+    if manifest is None:
+        for df in pd.read_csv(csv_path, usecols=usecols, dtype=dtypes, parse_dates=['date'],
+                              chunksize=batch_rows, keep_default_na=False, na_values=['']):
+            if tickers is not None:
+                df = df[df['ticker'].isin(tickers)]
+            df = _filter_dates(df, start, end)
+            if len(df):
+                yield df[usecols], None
+        return
+
+    entries = sorted(manifest['tickers'].items(), key=lambda item: item[1]['start'])
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        for ticker_wiki, entry in entries:
+            if tickers is not None and ticker_wiki not in tickers and entry['ticker'] not in tickers:
+                continue
+            if start is not None and entry.get('last_date') and pd.Timestamp(entry['last_date']) < start:
+                continue
+            if entry['end'] <= entry['start']:
+                continue
+            f.seek(entry['start'])
+            data = f.read(entry['end'] - entry['start'])
+            df = pd.read_csv(BytesIO(header + data), usecols=usecols, dtype=dtypes, parse_dates=['date'],
+                             keep_default_na=False, na_values=[''])
+            df = _filter_dates(df, start, end)
+            if len(df):
+                yield df[usecols], ticker_wiki
+
+
+def iter_prices(tickers=None, start=None, end=None, fields=None, point_in_time=True,
+                csv_path=None, columnar_dir=None, source=None, batch_rows=QUERY_BATCH_ROWS):
+    """
+    Lee el dataset de precios por lotes, aplicando los filtros en la capa de
+    almacenamiento para no cargar filas ni columnas que no se piden.
+
+    Si existe la salida columnar (--columnar) y está al día, se consulta con
+    pyarrow.dataset: el filtro de tickers y fechas descarta particiones y row groups
+    por sus estadísticas. Si no, se usan los rangos de bytes del manifiesto del CSV
+    para leer solo los bloques de los tickers pedidos.
+
+    Args:
+        tickers (iterable, opcional): Tickers de Wikipedia o de yfinance. Por defecto, todos.
+        start (str o fecha, opcional): Primera fecha (incluida).
+        end (str o fecha, opcional): Última fecha (incluida).
+        fields (list, opcional): Columnas de precios a leer. Por defecto PRICE_FIELDS.
+        point_in_time (bool): Si es True, solo se devuelven las filas de fechas en las
+                              que el ticker pertenecía al índice (intervalos de
+                              config.MEMBERSHIP_INTERVALS_PATH).
+        csv_path (str, opcional): CSV de salida. Por defecto config.FINAL_OUTPUT_PATH.
+        columnar_dir (str, opcional): Dataset Parquet. Por defecto config.COLUMNAR_OUTPUT_DIR.
+        source (str, opcional): "parquet" o "csv" para forzar el origen. Por defecto
+                                se elige automáticamente.
+        batch_rows (int): Tamaño máximo de los lotes leídos del Parquet o del CSV sin manifiesto.
+
+    Retorna:
+        - iterator: DataFrames con las columnas ['ticker', 'date'] + fields ('date'
+          siempre como DATE_DTYPE).
+    """
+    fields = _normalize_fields(fields)
+    csv_path = csv_path or config.FINAL_OUTPUT_PATH
+    columnar_dir = columnar_dir or config.COLUMNAR_OUTPUT_DIR
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    if source is None:
+        source = 'parquet' if _columnar_is_current(csv_path, columnar_dir) else 'csv'
+    if source not in ('parquet', 'csv'):
+        raise ValueError(f"Origen desconocido: {source}")
+
+    manifest = load_manifest(manifest_path_for(csv_path))
+    if manifest is not None and not manifest['complete']:
+        manifest = None
+    if tickers is not None:
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+
+    index = None
+    aliases = None
+    if point_in_time:
+        if os.path.exists(config.MEMBERSHIP_INTERVALS_PATH):
+            index = MembershipIndex.from_intervals_file()
+        else:
+            index = MembershipIndex.from_files()
+        aliases = _wiki_aliases(manifest)
+
+    if source == 'parquet':
+        wanted = _output_tickers(tickers, manifest) if tickers is not None else None
+        blocks = ((df, None) for df in _iter_parquet(columnar_dir, wanted, start, end, fields, batch_rows))
+    else:
+        # Con manifiesto, cada bloque se identifica por su ticker de Wikipedia y su símbolo.
+        wanted = None
+        if tickers is not None:
+            wanted = set(tickers) if manifest is not None else _output_tickers(tickers, None)
+        blocks = _iter_csv(csv_path, manifest, wanted, start, end, fields, batch_rows)
+
+    for df, ticker_wiki in blocks:
+        if index is not None:
+            if ticker_wiki is not None:
+                mask = index.is_member(np.full(len(df), ticker_wiki), df['date'])
+            else:
+                mask = _member_mask(index, df['ticker'], df['date'], aliases)
+            df = df[mask]
+        if len(df):
+            df = df.reset_index(drop=True)
+            df['date'] = df['date'].astype(DATE_DTYPE)
+            yield df
+
+
+def load_prices(tickers=None, start=None, end=None, fields=None, point_in_time=True, **kwargs):
+    """
+    Igual que iter_prices, pero devuelve un único DataFrame en formato largo.
+
+    Retorna:
+        - pd.DataFrame: Columnas ['ticker', 'date'] + fields.
+    """
+    fields = _normalize_fields(fields)
+    frames = list(iter_prices(tickers, start, end, fields, point_in_time, **kwargs))
+    if not frames:
+        return pd.DataFrame({
+            column: pd.Series(dtype=DATE_DTYPE if column == 'date' else 'str' if column == 'ticker' else 'float64')
+            for column in KEY_COLUMNS + fields
+        })
+    return pd.concat(frames, ignore_index=True)
@@ -1,52 +1,159 @@
 import pandas as pd
 import os
 import glob
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-def parse_volume(volume_str):
-    """Convierte el volumen de formato '1.21M' a 1210000."""
-    if isinstance(volume_str, str):
-        volume_str = volume_str.strip()
-        if volume_str.endswith('M'):
-            return float(volume_str[:-1]) * 1_000_000
-        elif volume_str.endswith('K'):
-            return float(volume_str[:-1]) * 1_000
-        elif volume_str == '' or volume_str == '-':
-            return 0
-    return float(volume_str)
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 
-def load_and_process_local_data(data_dir):
+import config
+from run_report import get_run_report
+
+# Sufijos del volumen en los archivos de Investing.com ('1.21M', '350.5K', '1.02B').
+VOLUME_MULTIPLIERS = {'K': 1_000, 'M': 1_000_000, 'B': 1_000_000_000}
+_VOLUME_SUFFIXES = pa.array(list(VOLUME_MULTIPLIERS))
+_VOLUME_FACTORS = pa.array([float(m) for m in VOLUME_MULTIPLIERS.values()])
+# Números válidos (sin separadores de miles); el resto pasa a NaN.
+_NUMBER_PATTERN = r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$'
+
+LOCAL_DATE_FORMAT = '%m/%d/%Y'
+
+LOCAL_COLUMNS = {
+    'Date': 'date',
+    'Price': 'Adj Close',
+    'Open': 'Open',
+    'High': 'High',
+    'Low': 'Low',
+    'Vol.': 'Volume'
+}
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Adj Close']
+
+def _to_float(text):
+    """Convierte un array de texto de pyarrow a float64; lo que no es un número pasa a nulo."""
+    try:
+        return pc.cast(text, pa.float64())
+    except pa.ArrowInvalid:
+        # Separadores de miles, espacios o texto no numérico: camino lento, con validación.
+        pass
+    text = pc.replace_substring(pc.utf8_trim_whitespace(text), ',', '')
+    text = pc.if_else(pc.match_substring_regex(text, _NUMBER_PATTERN), text, pa.scalar(None, pa.string()))
+    return pc.cast(text, pa.float64())
+
+def _parse_volume_array(text):
     """
-    Carga y procesa archivos de datos locales desde el directorio especificado.
+    Volumen de un array de texto de pyarrow ('1.21M' -> 1210000.0): aplica los
+    sufijos de VOLUME_MULTIPLIERS, admite separadores de miles y convierte '' y '-'
+    en 0. Los nulos se mantienen y lo que no se puede interpretar pasa a nulo.
+    """
+    text = pc.utf8_trim_whitespace(text)
+    suffix = pc.index_in(pc.utf8_upper(pc.utf8_slice_codeunits(text, -1)), value_set=_VOLUME_SUFFIXES)
+    number = _to_float(pc.if_else(pc.is_valid(suffix), pc.utf8_slice_codeunits(text, 0, -1), text))
+    volume = pc.multiply(number, pc.fill_null(pc.take(_VOLUME_FACTORS, suffix), 1.0))
+    return pc.if_else(pc.is_in(text, value_set=pa.array(['', '-'])), 0.0, volume)
+
+def discover_local_files(data_dir, file_mapping=None, file_glob=None):
     """
-    local_data_dict = {}
-    file_mapping = {
-        "Avaya Stock Price History.csv": "AV",
-        "Catalent Inc Stock Price History.csv": "CTLT",
-        "First Data Corp Stock Price History.csv": "FDC",
-        "NYSE Euronext Stock Price History.csv": "NYX"
-    }
+    Lista los archivos locales a cargar: los de `file_mapping` que existan y los que
+    encajen con `file_glob`, cuyo ticker es el nombre del archivo sin extensión. Si
+    un ticker aparece dos veces, se queda el primer archivo.
 
+    Args:
+        data_dir (str): Directorio base de los archivos.
+        file_mapping (dict, opcional): {nombre de archivo: ticker}. Por defecto,
+                                       config.LOCAL_FILE_MAPPING.
+        file_glob (str, opcional): Patrón relativo a `data_dir`. Por defecto,
+                                   config.LOCAL_FILE_GLOB.
+
+    Retorna:
+        - list: Pares (ruta, ticker) en orden de carga.
+    """
+    if file_mapping is None:
+        file_mapping = config.LOCAL_FILE_MAPPING
+    if file_glob is None:
+        file_glob = config.LOCAL_FILE_GLOB
+
+    files = []
+    seen = set()
     for filename, ticker in file_mapping.items():
         file_path = os.path.join(data_dir, filename)
         if os.path.exists(file_path):
-            df = pd.read_csv(file_path)
-            
-            df.rename(columns={
-                'Date': 'date',
-                'Price': 'Adj Close',
-                'Vol.': 'Volume'
-            }, inplace=True)
-
-            df['date'] = pd.to_datetime(df['date'], format='%m/%d/%Y')
-            df.set_index('date', inplace=True)
-            
-            df['Volume'] = df['Volume'].apply(parse_volume)
-
-            for col in ['Open', 'High', 'Low', 'Adj Close', 'Volume']:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-            df = df[['Open', 'High', 'Low', 'Adj Close', 'Volume']]
-            
-            local_data_dict[ticker] = df
-
-    return local_data_dict
+            files.append((file_path, ticker))
+            seen.add(ticker)
+
+    if file_glob:
+        for file_path in sorted(glob.glob(os.path.join(data_dir, file_glob))):
+            ticker = os.path.splitext(os.path.basename(file_path))[0]
+            if ticker in seen:
+                print(f"  -> Aviso: {file_path} ignorado, ya hay datos locales de {ticker}.")
+                continue
+            files.append((file_path, ticker))
+            seen.add(ticker)
+
+    return files
+
+def load_local_file(file_path):
+    """
+    Lee un archivo de precios con el formato de Investing.com (fechas mm/dd/YYYY,
+    'Price' como precio de cierre y volumen con sufijos).
+
+    Todo el archivo se lee como texto con pyarrow.csv y se convierte por columnas
+    con pyarrow.compute, sin pasar por Python fila a fila y sin retener el GIL, de
+    modo que varios archivos se pueden leer a la vez en hilos.
+
+    Retorna:
+        - pd.DataFrame: Columnas Open, High, Low, Adj Close y Volume, indexado por fecha.
+    """
+    table = pa_csv.read_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(use_threads=False),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=list(LOCAL_COLUMNS),
+            column_types={column: pa.string() for column in LOCAL_COLUMNS},
+            strings_can_be_null=True
+        )
+    )
+    dates = pc.strptime(table['Date'].combine_chunks(), format=LOCAL_DATE_FORMAT, unit='us')
+
+    columns = {}
+    for source, column in LOCAL_COLUMNS.items():
+        if column in PRICE_COLUMNS:
+            columns[column] = _to_float(table[source].combine_chunks())
+    columns['Volume'] = _parse_volume_array(table['Vol.'].combine_chunks())
+
+    return pd.DataFrame(
+        {column: values.to_numpy(zero_copy_only=False) for column, values in columns.items()},
+        index=pd.DatetimeIndex(dates.to_numpy(zero_copy_only=False), name='date')
+    )[PRICE_COLUMNS + ['Volume']]
+
+def load_and_process_local_data(data_dir, file_mapping=None, file_glob=None, max_workers=None):
+    """
+    Carga y procesa archivos de datos locales desde el directorio especificado.
+
+    Los archivos se descubren con discover_local_files y se leen en paralelo en un
+    pool de hilos (config.LOCAL_MAX_WORKERS por defecto).
+
+    Retorna:
+        - dict: {ticker: DataFrame} en el orden de discover_local_files.
+    """
+    report = get_run_report()
+    files = discover_local_files(data_dir, file_mapping, file_glob)
+    if max_workers is None:
+        max_workers = config.LOCAL_MAX_WORKERS
+
+    def load(file_path):
+        start = time.perf_counter()
+        df = load_local_file(file_path)
+        report.observe('local_file', time.perf_counter() - start)
+        report.count('local_rows', len(df))
+        return df
+
+    paths = [file_path for file_path, _ in files]
+    if max_workers and max_workers > 1 and len(files) > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+            frames = list(executor.map(load, paths))
+    else:
+        frames = [load(file_path) for file_path in paths]
+
+    return {ticker: df for (_, ticker), df in zip(files, frames)}
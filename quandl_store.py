@@ -0,0 +1,414 @@
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+from io import BytesIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import config
+from data_fetchers import (
+    iter_quandl_tickers,
+    load_and_preprocess_quandl,
+    quandl_read_csv_kwargs,
+    quandl_ticker_frame
+)
+from utils import file_lock, write_json_atomic
+
+CACHE_FILE_NAME = "wiki_prices.parquet"
+CACHE_META_NAME = "wiki_prices.json"
+# Archivo de bloqueo de la comprobación y generación de la caché (ver load_quandl_cache).
+CACHE_LOCK_NAME = "wiki_prices.lock"
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def file_fingerprint(path, with_hash=True):
+    """
+    Calcula la huella de un archivo: tamaño, fecha de modificación y (opcionalmente)
+    el hash SHA-256 de su contenido.
+
+    Args:
+        path (str): Ruta al archivo.
+        with_hash (bool): Si es False, no se lee el contenido del archivo.
+
+    Retorna:
+        - dict: {'size': int, 'mtime_ns': int, 'sha256': str o None}
+    """
+    stat = os.stat(path)
+    digest = None
+    if with_hash:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+
+
+def source_matches(path, source):
+    """
+    Comprueba si un archivo sigue siendo el mismo que describe `source`.
+    Si el tamaño y la fecha coinciden no se lee el archivo; si solo cambia la
+    fecha (p. ej. se copió de nuevo), se compara el hash y se actualiza `source`.
+
+    Retorna:
+        - bool: True si el contenido no ha cambiado.
+    """
+    current = file_fingerprint(path, with_hash=False)
+    if current['size'] != source.get('size'):
+        return False
+    if current['mtime_ns'] == source.get('mtime_ns'):
+        return True
+    if file_fingerprint(path)['sha256'] != source.get('sha256'):
+        return False
+    source['mtime_ns'] = current['mtime_ns']
+    return True
+
+
+def _quandl_schema(float32_prices):
+    price_type = pa.float32() if float32_prices else pa.float64()
+    return pa.schema([
+        ('date', pa.timestamp('ns')),
+        ('ticker', pa.dictionary(pa.int32(), pa.string())),
+        ('Open', price_type),
+        ('High', price_type),
+        ('Low', price_type),
+        ('Adj Close', price_type),
+        ('Volume', pa.int64()),
+    ])
+
+
+def build_quandl_cache(csv_path, cache_dir, verbose=False):
+    """
+    Convierte WIKI_PRICES.csv en un archivo Parquet con un row group por ticker,
+    de forma que después se pueda leer cualquier ticker sin parsear el CSV.
+
+    Args:
+        csv_path (str): Ruta al archivo WIKI_PRICES.csv
+        cache_dir (str): Directorio donde se guarda la caché.
+        verbose (bool): Si es True, informa del progreso.
+
+    Retorna:
+        - meta (dict): Metadatos de la caché (huella del origen e índice de tickers).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, CACHE_FILE_NAME)
+    # Temporal propio de cada proceso: un shard que lo generase sin el bloqueo de
+    # load_quandl_cache no pisaría el archivo a medias de otro.
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    float32_prices = config.QUANDL_FLOAT32_PRICES
+    schema = _quandl_schema(float32_prices)
+
+    if verbose:
+        print(f"[INFO] Generando caché de Quandl en {cache_path}...")
+
+    source = file_fingerprint(csv_path)
+    row_groups = {}
+    num_row_groups = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for ticker, df in iter_quandl_tickers(csv_path, float32_prices=float32_prices):
+                df = df.reset_index()
+                df['ticker'] = ticker
+                table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+                writer.write_table(table, row_group_size=max(1, len(df)))
+                # Un row group por ticker (si el CSV no viene ordenado, puede haber varios).
+                row_groups.setdefault(ticker, []).append(num_row_groups)
+                num_row_groups += 1
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    meta = {
+        'source': source,
+        'float32_prices': float32_prices,
+        'row_groups': row_groups
+    }
+    write_json_atomic(os.path.join(cache_dir, CACHE_META_NAME), meta)
+    return meta
+
+
+class QuandlParquetStore(Mapping):
+    """
+    Acceso perezoso a la caché Parquet de Quandl con la misma interfaz que el
+    diccionario {ticker: DataFrame}. El archivo se abre con memory-map y cada
+    ticker se lee solo cuando se pide.
+    """
+
+    def __init__(self, cache_path, row_groups):
+        self._cache_path = cache_path
+        self._parquet = pq.ParquetFile(cache_path, memory_map=True)
+        self._row_groups = row_groups
+
+    def __getstate__(self):
+        # Al enviarse a otro proceso solo viaja la ruta; cada proceso hace su propio memory-map.
+        return {'cache_path': self._cache_path, 'row_groups': self._row_groups}
+
+    def __setstate__(self, state):
+        self.__init__(state['cache_path'], state['row_groups'])
+
+    def __getitem__(self, ticker):
+        groups = self._row_groups[ticker]
+        table = self._parquet.read_row_groups(groups)
+        df = table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+        return df.set_index('date')
+
+    def last_date(self, ticker):
+        """Última fecha de un ticker, leída de las estadísticas del Parquet (sin cargar datos)."""
+        metadata = self._parquet.metadata
+        column = self._parquet.schema_arrow.get_field_index('date')
+        return max(
+            pd.Timestamp(metadata.row_group(i).column(column).statistics.max)
+            for i in self._row_groups[ticker]
+        )
+
+    def __iter__(self):
+        return iter(self._row_groups)
+
+    def __len__(self):
+        return len(self._row_groups)
+
+    def __contains__(self, ticker):
+        return ticker in self._row_groups
+
+
+def load_quandl_cache(csv_path, cache_dir=None, verbose=False):
+    """
+    Abre la caché Parquet de Quandl, generándola antes si no existe o si el
+    archivo de origen ha cambiado (tamaño, fecha de modificación y hash).
+
+    La comprobación y la generación se hacen con un bloqueo exclusivo
+    (CACHE_LOCK_NAME): si varios shards arrancan a la vez con la caché vacía o
+    desfasada, uno la genera y el resto esperan y la reutilizan.
+
+    Args:
+        csv_path (str): Ruta al archivo WIKI_PRICES.csv
+        cache_dir (str, opcional): Directorio de la caché. Por defecto config.QUANDL_CACHE_DIR.
+        verbose (bool): Si es True, informa de si se reutiliza o se regenera la caché.
+
+    Retorna:
+        - QuandlParquetStore: Mapeo perezoso {ticker: DataFrame}, o None si falla.
+    """
+    if cache_dir is None:
+        cache_dir = config.QUANDL_CACHE_DIR
+    cache_path = os.path.join(cache_dir, CACHE_FILE_NAME)
+    meta_path = os.path.join(cache_dir, CACHE_META_NAME)
+
+    try:
+        if not os.path.exists(csv_path):
+            return None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with file_lock(os.path.join(cache_dir, CACHE_LOCK_NAME)):
+            meta = None
+            if os.path.exists(cache_path) and os.path.exists(meta_path):
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+                mtime_before = meta['source'].get('mtime_ns')
+                if meta.get('float32_prices') != config.QUANDL_FLOAT32_PRICES or \
+                   not source_matches(csv_path, meta['source']):
+                    meta = None
+                elif meta['source']['mtime_ns'] != mtime_before:
+                    write_json_atomic(meta_path, meta)
+
+            if meta is None:
+                meta = build_quandl_cache(csv_path, cache_dir, verbose)
+            elif verbose:
+                print(f"[INFO] Usando caché de Quandl en {cache_path}.")
+
+        return QuandlParquetStore(cache_path, meta['row_groups'])
+
+    except Exception as e:
+        if verbose:
+            print(f"[ERROR] No se pudo usar la caché de Quandl: {e}")
+        return None
+
+
+def _iter_lines(f, sha):
+    """Recorre un archivo binario por bloques y produce (offset, línea) sin el salto final."""
+    offset = 0
+    remainder = b''
+    for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+        sha.update(block)
+        lines = (remainder + block).split(b'\n')
+        remainder = lines.pop()
+        for line in lines:
+            yield offset, line
+            offset += len(line) + 1
+    if remainder:
+        yield offset, remainder
+
+
+def build_quandl_index(csv_path, index_path, verbose=False):
+    """
+    Recorre WIKI_PRICES.csv una sola vez y guarda, para cada ticker, los rangos
+    de bytes [inicio, fin) que ocupan sus filas y su última fecha. Las columnas
+    'ticker' y 'date' se localizan por su nombre en la cabecera.
+
+    Args:
+        csv_path (str): Ruta al archivo WIKI_PRICES.csv
+        index_path (str): Ruta del índice (JSON) a generar.
+        verbose (bool): Si es True, informa del progreso.
+
+    Retorna:
+        - index (dict): Huella del origen, cabecera del CSV y rangos por ticker.
+    """
+    if verbose:
+        print(f"[INFO] Generando índice de Quandl en {index_path}...")
+
+    stat = os.stat(csv_path)
+    sha = hashlib.sha256()
+    ranges = {}
+    last_dates = {}
+    header = None
+    ticker_column = date_column = None
+    current_ticker = None
+    previous_line = None
+    range_start = 0
+    offset = 0
+
+    def close_range(end):
+        ticker = current_ticker.decode()
+        ranges.setdefault(ticker, []).append([range_start, end])
+        last_date = previous_line.split(b',', date_column + 1)[date_column].rstrip(b'\r').decode()
+        last_dates[ticker] = max(last_dates.get(ticker, last_date), last_date)
+
+    with open(csv_path, 'rb') as f:
+        for line_start, line in _iter_lines(f, sha):
+            if header is None:
+                header = line
+                columns = header.rstrip(b'\r').split(b',')
+                if b'ticker' not in columns or b'date' not in columns:
+                    raise ValueError(f"{csv_path} no tiene columnas 'ticker' y 'date' en la cabecera.")
+                ticker_column, date_column = columns.index(b'ticker'), columns.index(b'date')
+                continue
+            ticker = line.split(b',', ticker_column + 1)[ticker_column]
+            if ticker != current_ticker:
+                if current_ticker is not None:
+                    close_range(line_start)
+                current_ticker = ticker
+                range_start = line_start
+            previous_line = line
+            offset = line_start + len(line) + 1
+
+    if current_ticker is not None:
+        close_range(min(offset, stat.st_size))
+
+    index = {
+        'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha.hexdigest()},
+        'header': header.decode().rstrip('\r'),
+        'ranges': ranges,
+        'last_dates': last_dates
+    }
+    write_json_atomic(index_path, index)
+    return index
+
+
+class QuandlCsvIndexStore(Mapping):
+    """
+    Acceso perezoso al CSV original de Quandl mediante el índice de bytes: cada
+    ticker se lee con un seek y solo se parsean sus filas.
+    """
+
+    def __init__(self, csv_path, header, ranges, last_dates):
+        self._csv_path = csv_path
+        self._header = header.encode() + b'\n'
+        self._ranges = ranges
+        self._last_dates = last_dates
+
+    def __getitem__(self, ticker):
+        ranges = self._ranges[ticker]
+        parts = []
+        with open(self._csv_path, 'rb') as f:
+            for start, end in ranges:
+                f.seek(start)
+                data = f.read(end - start)
+                parts.append(pd.read_csv(BytesIO(self._header + data), **quandl_read_csv_kwargs()))
+        return quandl_ticker_frame(parts)
+
+    def last_date(self, ticker):
+        """Última fecha de un ticker, guardada en el índice (sin leer el CSV)."""
+        return pd.Timestamp(self._last_dates[ticker])
+
+    def __iter__(self):
+        return iter(self._ranges)
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, ticker):
+        return ticker in self._ranges
+
+
+def load_quandl_index(csv_path, index_path=None, verbose=False):
+    """
+    Abre el CSV de Quandl a través de su índice de bytes, generándolo antes si no
+    existe o si el archivo de origen ha cambiado. Como en load_quandl_cache, la
+    comprobación y la generación se hacen con un bloqueo (index_path + '.lock').
+
+    Args:
+        csv_path (str): Ruta al archivo WIKI_PRICES.csv
+        index_path (str, opcional): Ruta del índice. Por defecto config.QUANDL_INDEX_PATH.
+        verbose (bool): Si es True, informa de si se reutiliza o se regenera el índice.
+
+    Retorna:
+        - QuandlCsvIndexStore: Mapeo perezoso {ticker: DataFrame}, o None si falla.
+    """
+    if index_path is None:
+        index_path = config.QUANDL_INDEX_PATH
+
+    try:
+        if not os.path.exists(csv_path):
+            return None
+
+        with file_lock(index_path + '.lock'):
+            index = None
+            if os.path.exists(index_path):
+                with open(index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+                mtime_before = index['source'].get('mtime_ns')
+                if 'last_dates' not in index or not source_matches(csv_path, index['source']):
+                    index = None
+                elif index['source']['mtime_ns'] != mtime_before:
+                    write_json_atomic(index_path, index)
+
+            if index is None:
+                index = build_quandl_index(csv_path, index_path, verbose)
+            elif verbose:
+                print(f"[INFO] Usando índice de Quandl en {index_path}.")
+
+        return QuandlCsvIndexStore(csv_path, index['header'], index['ranges'], index['last_dates'])
+
+    except Exception as e:
+        if verbose:
+            print(f"[ERROR] No se pudo usar el índice de Quandl: {e}")
+        return None
+
+
+def open_quandl_store(csv_path, tickers=None, backend=None, verbose=False):
+    """
+    Devuelve los datos de Quandl con la interfaz {ticker: DataFrame} según el
+    backend configurado.
+
+    Args:
+        csv_path (str): Ruta al archivo WIKI_PRICES.csv
+        tickers (set, opcional): Tickers necesarios (solo lo usa el backend "memory").
+        backend (str, opcional): "parquet", "index" o "memory". Por defecto config.QUANDL_BACKEND.
+        verbose (bool): Si es True, muestra mensajes informativos.
+
+    Retorna:
+        - Mapeo {ticker: DataFrame}, o None si falla.
+    """
+    if backend is None:
+        backend = config.QUANDL_BACKEND
+
+    if backend == "parquet":
+        return load_quandl_cache(csv_path, verbose=verbose)
+    if backend == "index":
+        return load_quandl_index(csv_path, verbose=verbose)
+    if backend == "memory":
+        return load_and_preprocess_quandl(csv_path, tickers=tickers)
+    raise ValueError(f"QUANDL_BACKEND desconocido: {backend}")
@@ -0,0 +1,123 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import config
+from utils import file_lock, write_json_atomic
+
+RESOLUTION_STORE_VERSION = 1
+
+
+def resolve_symbols(tickers, correction_map):
+    """
+    Símbolos de Quandl y de yfinance de cada ticker de Wikipedia según
+    TICKER_CORRECTION_MAP, resueltos una sola vez antes de procesar los tickers.
+
+    Retorna:
+        - dict: {ticker_wiki: (ticker_quandl, ticker_yf)}
+    """
+    symbols = {}
+    for ticker in tickers:
+        fix = correction_map.get(ticker, {})
+        symbols[ticker] = (fix.get("quandl", ticker), fix.get("yfinance", ticker))
+    return symbols
+
+
+class ResolutionStore:
+    """
+    Registro persistente de cómo se resolvió cada ticker de Wikipedia en ejecuciones
+    anteriores: el símbolo de yfinance usado, la fuente de la que salieron sus datos
+    y, si yfinance no devolvió nada para ese símbolo, cuántas veces ha fallado y hasta
+    cuándo no se vuelve a pedir.
+
+    Tras un fallo de yfinance la espera es de config.RESOLUTION_RETRY_DAYS días y se
+    duplica en cada fallo seguido hasta config.RESOLUTION_MAX_RETRY_DAYS. Un cambio
+    del símbolo de yfinance en TICKER_CORRECTION_MAP invalida la entrada.
+
+    Args:
+        path (str): Archivo JSON del registro (config.RESOLUTION_STORE_PATH), o
+                    None para no leer ni guardar nada.
+        ignore_failures (bool): Si es True, se vuelven a pedir a yfinance los símbolos
+                                que fallaron aunque no haya vencido su espera.
+    """
+
+    def __init__(self, path=None, ignore_failures=False):
+        self.path = path
+        self.ignore_failures = ignore_failures
+        self.tickers = self._load()
+        self._changed = set()
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != RESOLUTION_STORE_VERSION:
+            return {}
+        return data.get('tickers', {})
+
+    def _entry(self, ticker_wiki, ticker_yf):
+        entry = self.tickers.get(ticker_wiki)
+        if entry is None or entry.get('ticker') != ticker_yf:
+            entry = {'ticker': ticker_yf, 'source': None, 'failures': 0, 'retry_after': None}
+            self.tickers[ticker_wiki] = entry
+        self._changed.add(ticker_wiki)
+        return entry
+
+    def source(self, ticker_wiki, ticker_yf):
+        """Fuente de la que salieron los datos del ticker la última vez, o None."""
+        entry = self.tickers.get(ticker_wiki)
+        if entry is None or entry.get('ticker') != ticker_yf:
+            return None
+        return entry.get('source')
+
+    def retry_after(self, ticker_wiki, ticker_yf):
+        """
+        Fecha hasta la que no se debe pedir el símbolo a yfinance.
+
+        Retorna:
+            - str: Fecha ISO, o None si se puede pedir ya.
+        """
+        entry = self.tickers.get(ticker_wiki)
+        if self.ignore_failures or entry is None or entry.get('ticker') != ticker_yf:
+            return None
+        retry_after = entry.get('retry_after')
+        if retry_after is None or datetime.fromisoformat(retry_after) <= datetime.now():
+            return None
+        return retry_after
+
+    def record_yfinance(self, ticker_wiki, ticker_yf, found):
+        """Anota si yfinance devolvió datos para el símbolo del ticker."""
+        entry = self._entry(ticker_wiki, ticker_yf)
+        now = datetime.now()
+        entry['checked_at'] = now.isoformat(timespec='seconds')
+        if found:
+            entry['failures'] = 0
+            entry['retry_after'] = None
+            return
+        entry['failures'] += 1
+        days = min(config.RESOLUTION_RETRY_DAYS * 2 ** (entry['failures'] - 1), config.RESOLUTION_MAX_RETRY_DAYS)
+        entry['retry_after'] = (now + timedelta(days=days)).isoformat(timespec='seconds')
+
+    def record_source(self, ticker_wiki, ticker_yf, source):
+        """Anota la fuente de la que salieron los datos escritos del ticker."""
+        self._entry(ticker_wiki, ticker_yf)['source'] = source
+
+    def save(self):
+        """
+        Guarda el registro de forma atómica. Solo se escriben las entradas que ha
+        tocado esta ejecución, sobre lo que haya en disco en ese momento, para no
+        pisar lo que guarden a la vez otros shards. La lectura y la escritura se
+        hacen con un bloqueo exclusivo (path + '.lock').
+        """
+        if self.path is None or not self._changed:
+            return
+        with file_lock(self.path + '.lock'):
+            stored = ResolutionStore(self.path).tickers
+            stored.update({ticker: self.tickers[ticker] for ticker in self._changed})
+            write_json_atomic(self.path, {'version': RESOLUTION_STORE_VERSION, 'tickers': stored})
+        self.tickers = stored
+        self._changed = set()
@@ -0,0 +1,299 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+from utils import write_json_atomic
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Límites (segundos) de los intervalos de los histogramas de latencia.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PROFILE_TOP_FUNCTIONS = 30
+# Cada cuánto se mide la memoria residente mientras hay alguna etapa en curso.
+RSS_SAMPLE_SECONDS = 0.05
+TRACEMALLOC_TOP_LINES = 20
+
+
+def peak_rss_mb(children=False):
+    """
+    Memoria residente máxima (MB) alcanzada hasta ahora por este proceso o, con
+    `children`, por sus procesos hijos ya terminados. None si no se puede medir.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss está en KB en Linux y en bytes en macOS.
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss / divisor, 1)
+
+
+def current_rss_mb():
+    """
+    Memoria residente actual (MB) de este proceso, leída de /proc/self/statm. None si
+    no se puede medir (fuera de Linux).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+
+
+def latency_summary(samples):
+    """Resumen de una serie de latencias: percentiles e histograma por LATENCY_BUCKETS."""
+    values = np.asarray(samples, dtype='float64')
+    if not len(values):
+        return {'count': 0}
+    counts = np.bincount(np.searchsorted(LATENCY_BUCKETS, values, side='left'), minlength=len(LATENCY_BUCKETS) + 1)
+    # Cada intervalo se identifica por su límite superior ('le'); None es el último (sin límite).
+    bounds = list(LATENCY_BUCKETS) + [None]
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        'count': int(len(values)),
+        'total_seconds': round(float(values.sum()), 6),
+        'p50': round(float(p50), 6),
+        'p90': round(float(p90), 6),
+        'p99': round(float(p99), 6),
+        'max': round(float(values.max()), 6),
+        'histogram': [{'le': bound, 'count': int(count)} for bound, count in zip(bounds, counts) if count]
+    }
+
+
+def _merge_summaries(summaries):
+    """
+    Une resúmenes de latency_summary de varios informes: suma recuentos, tiempos e
+    histogramas y toma el máximo. Los percentiles no se pueden combinar y se omiten.
+    """
+    summaries = [summary for summary in summaries if summary.get('count')]
+    if not summaries:
+        return {'count': 0}
+    histogram = {}
+    for summary in summaries:
+        for bucket in summary['histogram']:
+            histogram[bucket['le']] = histogram.get(bucket['le'], 0) + bucket['count']
+    bounds = list(LATENCY_BUCKETS) + [None]
+    return {
+        'count': sum(summary['count'] for summary in summaries),
+        'total_seconds': round(sum(summary['total_seconds'] for summary in summaries), 6),
+        'max': max(summary['max'] for summary in summaries),
+        'histogram': [{'le': bound, 'count': histogram[bound]} for bound in bounds if bound in histogram]
+    }
+
+
+def merge_reports(reports):
+    """
+    Combina los informes (ya en forma de dict, ver RunReport.to_dict) de varias
+    ejecuciones paralelas, p. ej. los shards de main.py --shard: etapas, latencias y
+    contadores se suman, la memoria pico es la máxima y el tiempo total, el del
+    shard más lento. El resumen de cada informe queda en 'shards'.
+    """
+    merged = {
+        'started_at': min(report['started_at'] for report in reports),
+        'finished_at': max(report['finished_at'] for report in reports),
+        'wall_seconds': max(report['wall_seconds'] for report in reports),
+        'peak_rss_mb': max((report['peak_rss_mb'] or 0 for report in reports), default=None),
+        'peak_rss_children_mb': max((report['peak_rss_children_mb'] or 0 for report in reports), default=None),
+        'stages': {},
+        'counters': {},
+        'shards': [
+            {key: report.get(key) for key in ('shard', 'started_at', 'wall_seconds', 'peak_rss_mb', 'counters')}
+            for report in reports
+        ]
+    }
+    for report in reports:
+        for name, stage in report['stages'].items():
+            total = merged['stages'].setdefault(name, {'seconds': 0.0, 'calls': 0, 'peak_rss_mb': None})
+            total['seconds'] = round(total['seconds'] + stage['seconds'], 6)
+            total['calls'] += stage['calls']
+            total['peak_rss_mb'] = max(filter(None, [total['peak_rss_mb'], stage['peak_rss_mb']]), default=None)
+        for name, value in report['counters'].items():
+            merged['counters'][name] = merged['counters'].get(name, 0) + value
+    for section in ('tickers', 'latencies'):
+        names = {name for report in reports for name in report[section]}
+        merged[section] = {
+            name: _merge_summaries([report[section].get(name, {}) for report in reports]) for name in sorted(names)
+        }
+    return merged
+
+
+class RunReport:
+    """
+    Métricas de una ejecución: tiempo y memoria pico de cada etapa, latencias por
+    ticker (agrupadas por fuente) y de otras operaciones, y contadores (bytes y
+    filas escritos, llamadas a yfinance, etc.). Se guarda como JSON al terminar.
+
+    La memoria pico de una etapa es la máxima memoria residente medida mientras
+    estaba en curso: al empezar, al terminar y cada RSS_SAMPLE_SECONDS desde un hilo
+    en segundo plano (las etapas pueden solaparse, p. ej. en el pipeline asyncio).
+    Solo se mide en Linux; en otros sistemas queda en None y solo se informa del
+    pico del proceso (peak_rss_mb).
+
+    Los métodos se pueden llamar desde varios hilos.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.tickers = {}
+        self.latencies = {}
+        self.counters = {}
+        self.profile = {}
+        self._profiler = None
+        self._lock = threading.Lock()
+        # Memoria pico de cada etapa en curso, actualizada por _sample_rss.
+        self._active_peaks = {}
+        self._sampling = threading.Event()
+        self._sampler = None
+
+    def _sample_rss(self):
+        """Bucle del hilo de muestreo: solo mide mientras hay etapas en curso."""
+        while True:
+            self._sampling.wait()
+            rss = current_rss_mb()
+            with self._lock:
+                if not self._active_peaks:
+                    self._sampling.clear()
+                    continue
+                for token, peak in self._active_peaks.items():
+                    self._active_peaks[token] = max(peak, rss)
+            time.sleep(RSS_SAMPLE_SECONDS)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Mide una etapa. Si se repite (p. ej. una vez por ventana de tickers), se
+        acumulan el tiempo y el número de llamadas, y la memoria pico es la máxima
+        de todas ellas.
+        """
+        start = time.perf_counter()
+        token = object()
+        rss = current_rss_mb()
+        if rss is not None:
+            with self._lock:
+                self._active_peaks[token] = rss
+                if self._sampler is None:
+                    self._sampler = threading.Thread(target=self._sample_rss, name='rss-sampler', daemon=True)
+                    self._sampler.start()
+            self._sampling.set()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            rss = current_rss_mb()
+            with self._lock:
+                peaks = [self._active_peaks.pop(token, None), rss]
+                stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'peak_rss_mb': None})
+                stage['seconds'] += elapsed
+                stage['calls'] += 1
+                stage['peak_rss_mb'] = max(filter(None, peaks + [stage['peak_rss_mb']]), default=None)
+
+    def record_ticker(self, source, seconds):
+        """Registra lo que ha tardado en procesarse un ticker, según su fuente."""
+        with self._lock:
+            self.tickers.setdefault(source, []).append(seconds)
+
+    def observe(self, series, seconds):
+        """Registra una latencia en la serie `series` (p. ej. cada llamada a yfinance)."""
+        with self._lock:
+            self.latencies.setdefault(series, []).append(seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def start_profiling(self, cprofile=False, trace_memory=False):
+        """Activa cProfile y/o tracemalloc para el análisis de los puntos calientes."""
+        if cprofile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if trace_memory:
+            tracemalloc.start()
+
+    def stop_profiling(self, profile_path=None):
+        """
+        Detiene el perfilado y añade al informe las funciones más costosas (cProfile)
+        y las líneas con más memoria reservada (tracemalloc). Con `profile_path`, las
+        estadísticas completas de cProfile se guardan también en ese archivo.
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            if profile_path:
+                self._profiler.dump_stats(profile_path)
+                self.profile['cprofile_path'] = profile_path
+            text = io.StringIO()
+            pstats.Stats(self._profiler, stream=text).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+            self.profile['cprofile_top'] = text.getvalue().splitlines()
+            self._profiler = None
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.profile['tracemalloc_peak_mb'] = round(peak / (1024 * 1024), 1)
+            self.profile['tracemalloc_top'] = [
+                {'location': str(stat.traceback), 'size_mb': round(stat.size / (1024 * 1024), 3), 'blocks': stat.count}
+                for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP_LINES]
+            ]
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'finished_at': datetime.now().isoformat(timespec='seconds'),
+                'wall_seconds': round(time.perf_counter() - self._start, 3),
+                'peak_rss_mb': peak_rss_mb(),
+                'peak_rss_children_mb': peak_rss_mb(children=True),
+                'stages': {
+                    name: dict(stage, seconds=round(stage['seconds'], 6)) for name, stage in self.stages.items()
+                },
+                'tickers': {source: latency_summary(samples) for source, samples in self.tickers.items()},
+                'latencies': {series: latency_summary(samples) for series, samples in self.latencies.items()},
+                'counters': dict(self.counters),
+                'profile': dict(self.profile)
+            }
+
+    def save(self, path, shard_reports=None):
+        """
+        Guarda el informe como JSON (de forma atómica). Con `shard_reports` (informes
+        de los shards compactados en esta ejecución), se guarda el combinado.
+        """
+        report = self.to_dict()
+        if shard_reports:
+            report = merge_reports(list(shard_reports) + [dict(report, shard='compact')])
+        write_json_atomic(path, report)
+
+
+_run_report = None
+_run_report_lock = threading.Lock()
+
+
+def get_run_report():
+    """Devuelve el informe de la ejecución en curso (se crea en la primera llamada)."""
+    global _run_report
+    with _run_report_lock:
+        if _run_report is None:
+            _run_report = RunReport()
+        return _run_report
+
+
+def reset_run_report():
+    """Empieza un informe nuevo (p. ej. entre ejecuciones dentro del mismo proceso)."""
+    global _run_report
+    with _run_report_lock:
+        _run_report = RunReport()
+        return _run_report
@@ -0,0 +1,126 @@
+import json
+import os
+import zlib
+
+import config
+from manifest import load_manifest, manifest_path_for, new_manifest, partial_path_for, save_manifest
+
+
+def parse_shard(text):
+    """
+    Interpreta una especificación de shard "i/N" (1 <= i <= N).
+
+    Retorna:
+        - (index, count): Shard (empezando en 1) y número total de shards.
+    """
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f"Shard inválido: '{text}'. Formato esperado: i/N (p. ej. 2/4).")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard inválido: '{text}'. Debe cumplirse 1 <= i <= N.")
+    return index, count
+
+
+def shard_of(ticker, count):
+    """Shard (empezando en 1) de un ticker: CRC32 del símbolo, estable entre máquinas y ejecuciones."""
+    return zlib.crc32(ticker.encode('utf-8')) % count + 1
+
+
+def in_shard(ticker, shard):
+    """True si el ticker pertenece al shard (index, count). Sin shard, todos pertenecen."""
+    return shard is None or shard_of(ticker, shard[1]) == shard[0]
+
+
+def _shard_path(path, shard, shard_dir=None):
+    stem, ext = os.path.splitext(os.path.basename(path))
+    index, count = shard
+    return os.path.join(shard_dir or config.SHARD_DIR, f"{stem}.shard-{index:03d}-of-{count:03d}{ext}")
+
+
+def shard_output_path(output_path, shard, shard_dir=None):
+    """CSV de salida del shard (index, count), en config.SHARD_DIR por defecto."""
+    return _shard_path(output_path, shard, shard_dir)
+
+
+def shard_report_path(report_path, shard, shard_dir=None):
+    """Informe de ejecución del shard (index, count), junto a su salida."""
+    return _shard_path(report_path, shard, shard_dir)
+
+
+def compact_shards(output_path, count, shard_dir=None, report_path=None, verbose=False):
+    """
+    Une las salidas de los N shards en el dataset final y su manifiesto.
+
+    Los tickers se copian por rangos de bytes en el orden alfabético de su símbolo de
+    Wikipedia, el mismo de una ejecución sin shards, así que el resultado es idéntico
+    al que habría escrito un único proceso con los mismos datos. Los fallidos de
+    todos los shards se reúnen en el manifiesto.
+
+    Args:
+        output_path (str): CSV final (p. ej. config.FINAL_OUTPUT_PATH).
+        count (int): Número de shards (N).
+        shard_dir (str, opcional): Directorio de los shards. Por defecto config.SHARD_DIR.
+        report_path (str, opcional): Informe de ejecución a partir del que se nombran
+                                     los de los shards. Por defecto config.RUN_REPORT_PATH.
+        verbose (bool): Si es True, informa del progreso.
+
+    Retorna:
+        - (failed_tickers, found_count, shard_reports): Tickers fallidos, tickers
+          escritos e informes de ejecución de los shards que lo tengan, o None si
+          falta algún shard o no terminó.
+    """
+    sources = {}
+    manifests = []
+    shard_reports = []
+    for index in range(1, count + 1):
+        shard_path = shard_output_path(output_path, (index, count), shard_dir)
+        manifest = load_manifest(manifest_path_for(shard_path))
+        if manifest is None or not manifest['complete'] or not os.path.exists(shard_path):
+            print(f"[ERROR] El shard {index}/{count} no ha terminado ({shard_path}); no se compacta.")
+            return None
+        for ticker_wiki, entry in manifest['tickers'].items():
+            if ticker_wiki in sources:
+                print(f"[ERROR] {ticker_wiki} aparece en más de un shard; ¿se generaron con distinto N?")
+                return None
+            sources[ticker_wiki] = (shard_path, entry)
+        manifests.append(manifest)
+
+        shard_report = shard_report_path(report_path or config.RUN_REPORT_PATH, (index, count), shard_dir)
+        if os.path.exists(shard_report):
+            with open(shard_report, encoding='utf-8') as f:
+                shard_reports.append(dict(json.load(f), shard=f"{index}/{count}"))
+
+    combined = new_manifest(incremental=any(manifest['incremental'] for manifest in manifests))
+    combined['failed'] = sorted({t for manifest in manifests for t in manifest['failed']} - set(sources))
+
+    partial_path = partial_path_for(output_path)
+    handles = {}
+    try:
+        with open(partial_path, 'wb') as out:
+            for ticker_wiki in sorted(sources):
+                shard_path, entry = sources[ticker_wiki]
+                if shard_path not in handles:
+                    handles[shard_path] = open(shard_path, 'rb')
+                    header = handles[shard_path].readline()
+                    if out.tell() == 0:
+                        out.write(header)
+                f = handles[shard_path]
+                f.seek(entry['start'])
+                start = out.tell()
+                out.write(f.read(entry['end'] - entry['start']))
+                combined['tickers'][ticker_wiki] = dict(entry, start=start, end=out.tell())
+            out.flush()
+            os.fsync(out.fileno())
+            combined['bytes_written'] = out.tell()
+    finally:
+        for f in handles.values():
+            f.close()
+
+    combined['complete'] = True
+    os.replace(partial_path, output_path)
+    save_manifest(manifest_path_for(output_path), combined)
+    if verbose:
+        print(f"[INFO] {count} shards compactados en '{output_path}': {len(sources)} tickers, "
+              f"{len(combined['failed'])} fallidos.")
+    return combined['failed'], len(sources), shard_reports
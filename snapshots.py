@@ -0,0 +1,434 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+import config
+from manifest import load_manifest, manifest_path_for, new_manifest, save_manifest
+from utils import write_json_atomic
+
+SNAPSHOT_FORMAT = 1
+
+OBJECTS_DIR = 'objects'
+DELTAS_DIR = 'deltas'
+VERSIONS_DIR = 'versions'
+LATEST_FILE_NAME = 'LATEST'
+
+# Nivel de gzip de objetos y deltas: el 1 comprime ~5 veces más rápido que el 6 y
+# ocupa solo un ~7 % más.
+GZIP_LEVEL = 1
+
+# Campos de la entrada del manifiesto del CSV que no se guardan en la instantánea
+# (dependen de la posición del ticker en el archivo).
+_BYTE_RANGE_FIELDS = ('start', 'end')
+
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _object_path(snapshot_dir, digest, compression):
+    suffix = '.csv.gz' if compression == 'gzip' else '.csv'
+    return os.path.join(snapshot_dir, OBJECTS_DIR, digest[:2], digest + suffix)
+
+
+def _delta_path(snapshot_dir, base, digest, compression):
+    suffix = '.csv.gz' if compression == 'gzip' else '.csv'
+    return os.path.join(snapshot_dir, DELTAS_DIR, digest[:2], f"{base}-{digest}{suffix}")
+
+
+def _write_blob(path, data, compression):
+    """Escribe un objeto de forma atómica. Si ya existe, su contenido es el mismo y no se toca."""
+    if os.path.exists(path):
+        return 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if compression == 'gzip':
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return len(data)
+
+
+def _read_blob(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    return gzip.decompress(data) if path.endswith('.gz') else data
+
+
+def _rows_by_date(block):
+    """{fecha: línea} de un bloque de filas del CSV (la fecha es el segundo campo)."""
+    return {line.split(b',', 2)[1]: line for line in block.splitlines(keepends=True)}
+
+
+def compute_delta(old_block, new_block):
+    """
+    Filas que cambian entre dos versiones del bloque de un ticker.
+
+    Retorna:
+        - (mode, rows, removed): 'append' si el bloque nuevo empieza por el anterior
+          (`rows` son los bytes añadidos) o 'patch' en otro caso (`rows` son las
+          líneas nuevas o modificadas y `removed` las fechas que desaparecen).
+    """
+    if new_block.startswith(old_block):
+        return 'append', new_block[len(old_block):], []
+    old_rows = _rows_by_date(old_block)
+    new_rows = _rows_by_date(new_block)
+    rows = b''.join(line for date, line in new_rows.items() if old_rows.get(date) != line)
+    removed = sorted(date.decode() for date in old_rows.keys() - new_rows.keys())
+    return 'patch', rows, removed
+
+
+def apply_delta(old_block, mode, rows, removed=()):
+    """Reconstruye el bloque nuevo de un ticker a partir del anterior y su delta."""
+    if mode == 'append':
+        return old_block + rows
+    merged = _rows_by_date(old_block)
+    for date in removed:
+        merged.pop(date.encode(), None)
+    merged.update(_rows_by_date(rows))
+    return b''.join(merged[date] for date in sorted(merged))
+
+
+def latest_version(snapshot_dir):
+    """Identificador de la última instantánea publicada en `snapshot_dir`, o None."""
+    path = os.path.join(snapshot_dir, LATEST_FILE_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return f.read().strip() or None
+
+
+def load_snapshot(snapshot_dir, version=None):
+    """
+    Lee el manifiesto de una instantánea (por defecto, la última).
+
+    Retorna:
+        - dict: El manifiesto, o None si no hay instantáneas o es de otro formato.
+    """
+    version = version or latest_version(snapshot_dir)
+    if version is None:
+        return None
+    path = os.path.join(snapshot_dir, VERSIONS_DIR, version + '.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    return snapshot if snapshot.get('format') == SNAPSHOT_FORMAT else None
+
+
+def _set_latest(snapshot_dir, version):
+    tmp_path = os.path.join(snapshot_dir, LATEST_FILE_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, os.path.join(snapshot_dir, LATEST_FILE_NAME))
+
+
+def diff_snapshots(old, new):
+    """
+    Tickers añadidos, modificados y eliminados entre dos instantáneas (`old` puede ser None).
+
+    Retorna:
+        - dict: Listas 'added', 'changed' y 'removed' y el número de 'unchanged'.
+    """
+    old_partitions = old['partitions'] if old else {}
+    new_partitions = new['partitions']
+    added = [t for t in new['order'] if t not in old_partitions]
+    changed = [t for t in new['order']
+               if t in old_partitions and old_partitions[t]['hash'] != new_partitions[t]['hash']]
+    removed = sorted(set(old_partitions) - set(new_partitions))
+    return {
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+        'unchanged': len(new_partitions) - len(added) - len(changed)
+    }
+
+
+def _referenced_files(snapshot_dir, snapshot):
+    compression = snapshot['compression']
+    paths = set()
+    for partition in snapshot['partitions'].values():
+        paths.add(_object_path(snapshot_dir, partition['hash'], compression))
+        if 'delta' in partition:
+            paths.add(_delta_path(snapshot_dir, partition['delta']['base'], partition['hash'], compression))
+    return paths
+
+
+def prune_snapshots(snapshot_dir, keep_versions=None, verbose=False):
+    """
+    Borra las instantáneas más antiguas (se conservan las `keep_versions` últimas,
+    por defecto config.SNAPSHOT_KEEP_VERSIONS) y los objetos y deltas que ya no usa
+    ninguna de las que quedan.
+    """
+    keep_versions = config.SNAPSHOT_KEEP_VERSIONS if keep_versions is None else keep_versions
+    versions_dir = os.path.join(snapshot_dir, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return
+    versions = sorted(name[:-len('.json')] for name in os.listdir(versions_dir) if name.endswith('.json'))
+    latest = latest_version(snapshot_dir)
+    kept = set(versions[-max(keep_versions, 1):]) | ({latest} if latest else set())
+
+    referenced = set()
+    for version in versions:
+        if version not in kept:
+            os.remove(os.path.join(versions_dir, version + '.json'))
+            continue
+        snapshot = load_snapshot(snapshot_dir, version)
+        if snapshot is not None:
+            referenced |= _referenced_files(snapshot_dir, snapshot)
+
+    removed = 0
+    for subdir in (OBJECTS_DIR, DELTAS_DIR):
+        for root, _, files in os.walk(os.path.join(snapshot_dir, subdir)):
+            for name in files:
+                path = os.path.join(root, name)
+                if path not in referenced:
+                    os.remove(path)
+                    removed += 1
+    if verbose and removed:
+        print(f"[INFO] Instantáneas: {removed} objetos y deltas sin referencias eliminados.")
+
+
+def publish_snapshot(csv_path=None, snapshot_dir=None, compression=None, keep_versions=None, verbose=False):
+    """
+    Publica una instantánea versionada del CSV de salida, direccionada por contenido.
+
+    Cada ticker es una partición: su bloque de filas (el rango de bytes del manifiesto
+    del CSV) se guarda una sola vez en objects/ con su hash SHA-256 como nombre, así
+    que las particiones que no cambian entre ejecuciones no se vuelven a escribir. Si
+    un ticker ya estaba en la instantánea anterior y ha cambiado, se guarda además en
+    deltas/ solo lo que cambia: las filas añadidas al final o, si se ha reescrito la
+    serie, las filas nuevas o modificadas y las fechas eliminadas. El manifiesto de la
+    versión (versions/<versión>.json) registra el hash, las filas y el delta de cada
+    ticker, y LATEST apunta a la última versión.
+
+    Si el contenido no ha cambiado desde la última instantánea, no se crea otra.
+
+    Args:
+        csv_path (str, opcional): CSV de salida. Por defecto config.FINAL_OUTPUT_PATH.
+        snapshot_dir (str, opcional): Directorio de instantáneas. Por defecto config.SNAPSHOT_DIR.
+        compression (str, opcional): "gzip" o "none". Por defecto config.SNAPSHOT_COMPRESSION.
+        keep_versions (int, opcional): Versiones conservadas (ver prune_snapshots).
+        verbose (bool): Si es True, informa de los cambios.
+
+    Retorna:
+        - snapshot (dict): Manifiesto de la instantánea publicada, o None si falla.
+    """
+    csv_path = csv_path or config.FINAL_OUTPUT_PATH
+    snapshot_dir = snapshot_dir or config.SNAPSHOT_DIR
+    compression = compression or config.SNAPSHOT_COMPRESSION
+    if compression == 'none':
+        compression = None
+
+    manifest = load_manifest(manifest_path_for(csv_path))
+    if manifest is None or not manifest['complete']:
+        print(f"[ERROR] No hay un manifiesto completo para {csv_path}; no se publica la instantánea.")
+        return None
+
+    previous = load_snapshot(snapshot_dir)
+    previous_partitions = previous['partitions'] if previous else {}
+    entries = sorted(manifest['tickers'].items(), key=lambda item: item[1]['start'])
+
+    partitions = {}
+    deltas = {}
+    dataset_hash = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        dataset_hash.update(header)
+        for ticker_wiki, entry in entries:
+            f.seek(entry['start'])
+            block = f.read(entry['end'] - entry['start'])
+            digest = _hash(block)
+            partition = {k: v for k, v in entry.items() if k not in _BYTE_RANGE_FIELDS}
+            partition.update(hash=digest, bytes=len(block))
+            partitions[ticker_wiki] = partition
+            dataset_hash.update(f"{ticker_wiki}\0{digest}\n".encode())
+
+            old = previous_partitions.get(ticker_wiki)
+            if old is None or old['hash'] == digest:
+                deltas[ticker_wiki] = (block, None)
+                continue
+            # Añadir filas al final es el caso habitual y se detecta solo con hashes.
+            if old['bytes'] <= len(block) and _hash(block[:old['bytes']]) == old['hash']:
+                delta = ('append', block[old['bytes']:], [])
+            else:
+                old_block = _read_blob(_object_path(snapshot_dir, old['hash'], previous['compression']))
+                delta = compute_delta(old_block, block)
+                if apply_delta(old_block, *delta) != block:
+                    delta = None
+            deltas[ticker_wiki] = (block, delta)
+
+    version_hash = dataset_hash.hexdigest()
+    if previous is not None and previous['dataset_hash'] == version_hash:
+        if verbose:
+            print(f"[INFO] Sin cambios desde la instantánea {previous['version']}.")
+        return previous
+
+    sequence = previous['sequence'] + 1 if previous else 1
+    version = f"{sequence:06d}-{version_hash[:12]}"
+    written = 0
+    for ticker_wiki, (block, delta) in deltas.items():
+        partition = partitions[ticker_wiki]
+        written += _write_blob(_object_path(snapshot_dir, partition['hash'], compression), block, compression)
+        if delta is not None:
+            mode, rows, removed = delta
+            base = previous_partitions[ticker_wiki]['hash']
+            written += _write_blob(_delta_path(snapshot_dir, base, partition['hash'], compression), rows, compression)
+            partition['delta'] = {
+                'base': base,
+                'mode': mode,
+                'rows': rows.count(b'\n'),
+                'bytes': len(rows),
+                'removed_dates': removed
+            }
+
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'sequence': sequence,
+        'parent': previous['version'] if previous else None,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'dataset_hash': version_hash,
+        'compression': compression,
+        'header': header.decode('utf-8'),
+        'failed': manifest['failed'],
+        'order': [ticker_wiki for ticker_wiki, _ in entries],
+        'partitions': partitions,
+    }
+    snapshot['changes'] = diff_snapshots(previous, snapshot)
+
+    os.makedirs(os.path.join(snapshot_dir, VERSIONS_DIR), exist_ok=True)
+    write_json_atomic(os.path.join(snapshot_dir, VERSIONS_DIR, version + '.json'), snapshot)
+    _set_latest(snapshot_dir, version)
+    prune_snapshots(snapshot_dir, keep_versions, verbose)
+
+    if verbose:
+        changes = snapshot['changes']
+        print(f"[INFO] Instantánea {version} publicada en '{snapshot_dir}': {len(changes['added'])} tickers "
+              f"nuevos, {len(changes['changed'])} modificados, {len(changes['removed'])} eliminados, "
+              f"{changes['unchanged']} sin cambios ({written / 1e6:.1f} MB escritos).")
+    return snapshot
+
+
+def sync_snapshot(source_dir, mirror_dir, version=None, verbose=False):
+    """
+    Sincroniza una réplica (`mirror_dir`, con la misma estructura) con una instantánea
+    de `source_dir` descargando solo las particiones que le faltan.
+
+    Para cada ticker cuyo objeto no está en la réplica se usa su delta si la réplica
+    tiene el bloque base; el resultado se comprueba con el hash del manifiesto. Si no
+    hay delta o no cuadra, se copia el objeto completo. Al terminar se borran de la
+    réplica los objetos que ya no usa la versión sincronizada.
+
+    Retorna:
+        - stats (dict): Objetos copiados, deltas aplicados y bytes leídos del origen,
+          o None si no hay instantánea que sincronizar.
+    """
+    snapshot = load_snapshot(source_dir, version)
+    if snapshot is None:
+        print(f"[ERROR] No hay instantáneas en {source_dir}.")
+        return None
+    compression = snapshot['compression']
+    stats = {'version': snapshot['version'], 'objects_copied': 0, 'deltas_applied': 0, 'bytes_transferred': 0}
+
+    for ticker_wiki in snapshot['order']:
+        partition = snapshot['partitions'][ticker_wiki]
+        target = _object_path(mirror_dir, partition['hash'], compression)
+        if os.path.exists(target):
+            continue
+
+        delta = partition.get('delta')
+        if delta is not None:
+            base_path = _object_path(mirror_dir, delta['base'], compression)
+            delta_path = _delta_path(source_dir, delta['base'], partition['hash'], compression)
+            if os.path.exists(base_path) and os.path.exists(delta_path):
+                block = apply_delta(_read_blob(base_path), delta['mode'], _read_blob(delta_path),
+                                    delta['removed_dates'])
+                if _hash(block) == partition['hash']:
+                    _write_blob(target, block, compression)
+                    stats['deltas_applied'] += 1
+                    stats['bytes_transferred'] += os.path.getsize(delta_path)
+                    continue
+
+        source = _object_path(source_dir, partition['hash'], compression)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target + '.tmp')
+        os.replace(target + '.tmp', target)
+        stats['objects_copied'] += 1
+        stats['bytes_transferred'] += os.path.getsize(source)
+
+    os.makedirs(os.path.join(mirror_dir, VERSIONS_DIR), exist_ok=True)
+    write_json_atomic(os.path.join(mirror_dir, VERSIONS_DIR, snapshot['version'] + '.json'), snapshot)
+    _set_latest(mirror_dir, snapshot['version'])
+    prune_snapshots(mirror_dir, keep_versions=1)
+
+    if verbose:
+        print(f"[INFO] Réplica '{mirror_dir}' en la versión {snapshot['version']}: "
+              f"{stats['deltas_applied']} deltas aplicados, {stats['objects_copied']} objetos copiados "
+              f"({stats['bytes_transferred'] / 1e6:.1f} MB).")
+    return stats
+
+
+def checkout_snapshot(snapshot_dir, output_path, version=None):
+    """
+    Reconstruye el CSV de salida (idéntico byte a byte al publicado) y su manifiesto
+    a partir de una instantánea.
+
+    Retorna:
+        - snapshot (dict): Manifiesto de la instantánea, o None si no existe.
+    """
+    snapshot = load_snapshot(snapshot_dir, version)
+    if snapshot is None:
+        print(f"[ERROR] No hay instantáneas en {snapshot_dir}.")
+        return None
+
+    manifest = new_manifest()
+    manifest['failed'] = list(snapshot['failed'])
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(snapshot['header'].encode('utf-8'))
+        for ticker_wiki in snapshot['order']:
+            partition = snapshot['partitions'][ticker_wiki]
+            block = _read_blob(_object_path(snapshot_dir, partition['hash'], snapshot['compression']))
+            entry = {k: v for k, v in partition.items() if k not in ('hash', 'bytes', 'delta')}
+            entry['start'] = f.tell()
+            f.write(block)
+            entry['end'] = f.tell()
+            manifest['tickers'][ticker_wiki] = entry
+        manifest['bytes_written'] = f.tell()
+    os.replace(tmp_path, output_path)
+    manifest['complete'] = True
+    save_manifest(manifest_path_for(output_path), manifest)
+    return snapshot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Instantáneas versionadas del dataset de precios.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    publish = subparsers.add_parser('publish', help='Publica una instantánea del CSV de salida.')
+    publish.add_argument('--input', default=config.FINAL_OUTPUT_PATH, help='CSV de salida.')
+    publish.add_argument('--dir', default=config.SNAPSHOT_DIR, help='Directorio de instantáneas.')
+
+    sync = subparsers.add_parser('sync', help='Sincroniza una réplica con la última instantánea.')
+    sync.add_argument('mirror', help='Directorio de la réplica.')
+    sync.add_argument('--dir', default=config.SNAPSHOT_DIR, help='Directorio de instantáneas de origen.')
+    sync.add_argument('--version', help='Versión a sincronizar (por defecto, la última).')
+
+    checkout = subparsers.add_parser('checkout', help='Reconstruye el CSV de una instantánea.')
+    checkout.add_argument('output', help='CSV a generar.')
+    checkout.add_argument('--dir', default=config.SNAPSHOT_DIR, help='Directorio de instantáneas.')
+    checkout.add_argument('--version', help='Versión a reconstruir (por defecto, la última).')
+
+    args = parser.parse_args()
+    if args.command == 'publish':
+        publish_snapshot(args.input, args.dir, verbose=True)
+    elif args.command == 'sync':
+        sync_snapshot(args.dir, args.mirror, args.version, verbose=True)
+    else:
+        checkout_snapshot(args.dir, args.output, args.version)
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+import http_cache
+from http_cache import ResponseCache
+
+# Entradas que pickle no puede cargar: basura, un módulo que no existe (como un
+# pickle de otra versión de pandas) y un atributo que no existe en el módulo.
+UNREADABLE_ENTRIES = [
+    b'not a pickle',
+    b'cmodulo_que_no_existe\nClase\n)\x81.',
+    b'cpandas\nClaseQueNoExiste\n)\x81.',
+    b'\x80\x04K\x01.',
+]
+
+
+class _FakeResponse:
+    status_code = 200
+    text = '<html>fresh</html>'
+    headers = {}
+
+    def raise_for_status(self):
+        pass
+
+
+def _corrupt(cache, source, key, data):
+    path = cache._path(source, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+@pytest.mark.parametrize('data', UNREADABLE_ENTRIES)
+def test_cached_call_refetches_unreadable_entry(tmp_path, data):
+    cache = ResponseCache(str(tmp_path))
+    path = _corrupt(cache, 'fred', ('SP500', '1990-01-01'), data)
+
+    assert cache.cached_call('fred', ('SP500', '1990-01-01'), lambda: 'fetched') == 'fetched'
+    assert cache.load('fred', ('SP500', '1990-01-01'))['value'] == 'fetched'
+    assert os.path.exists(path)
+
+
+@pytest.mark.parametrize('data', UNREADABLE_ENTRIES)
+def test_get_text_refetches_unreadable_entry(tmp_path, monkeypatch, data):
+    cache = ResponseCache(str(tmp_path))
+    url = 'https://example.com/page'
+    _corrupt(cache, 'wikipedia', ('GET', url), data)
+    calls = []
+    monkeypatch.setattr(http_cache.requests, 'get', lambda *args, **kwargs: calls.append(args) or _FakeResponse())
+
+    assert cache.get_text('wikipedia', url) == '<html>fresh</html>'
+    assert len(calls) == 1
+
+
+def test_unreadable_entry_is_removed(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    path = _corrupt(cache, 'yfinance', ('AAPL', '2018-03-28'), UNREADABLE_ENTRIES[0])
+
+    assert cache.load('yfinance', ('AAPL', '2018-03-28')) is None
+    assert not os.path.exists(path)
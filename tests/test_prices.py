@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from columnar_output import write_columnar_output
+from manifest import manifest_path_for, new_manifest, save_manifest
+from prices import load_prices
+
+TICKERS = {'AAPL': 'AAPL', 'BF.B': 'BF-B'}
+
+
+@pytest.fixture
+def output(tmp_path):
+    """CSV de salida de dos tickers con su manifiesto y su copia columnar."""
+    csv_path = str(tmp_path / 'prices.csv')
+    manifest = new_manifest()
+    dates = pd.bdate_range('2017-12-20', '2018-01-10')
+    with open(csv_path, 'wb') as f:
+        f.write(b'ticker,date,Open,High,Low,Adj Close,Volume\n')
+        for i, (ticker_wiki, ticker_yf) in enumerate(TICKERS.items()):
+            price = 100.0 + i + np.arange(len(dates))
+            block = pd.DataFrame({
+                'ticker': ticker_yf, 'date': dates.strftime('%Y-%m-%d'), 'Open': price, 'High': price + 1,
+                'Low': price - 1, 'Adj Close': price, 'Volume': 1000 + np.arange(len(dates))
+            }).to_csv(header=False, index=False, lineterminator='\n').encode()
+            start = f.tell()
+            f.write(block)
+            manifest['tickers'][ticker_wiki] = {
+                'ticker': ticker_yf, 'source': 'quandl', 'start': start, 'end': f.tell(),
+                'last_date': dates[-1].strftime('%Y-%m-%d'), 'rows': len(dates)
+            }
+    manifest['complete'] = True
+    save_manifest(manifest_path_for(csv_path), manifest)
+    columnar_dir = str(tmp_path / 'columnar')
+    assert write_columnar_output(csv_path, columnar_dir) is not None
+    return csv_path, columnar_dir
+
+
+@pytest.mark.parametrize('query', [
+    {},
+    {'tickers': ['BF.B'], 'start': '2018-01-01'},
+    {'tickers': ['AAPL'], 'start': '2030-01-01'},
+])
+def test_backends_return_the_same_dtypes(output, query):
+    csv_path, columnar_dir = output
+    frames = {
+        source: load_prices(point_in_time=False, csv_path=csv_path, columnar_dir=columnar_dir, source=source, **query)
+        for source in ('parquet', 'csv')
+    }
+
+    assert frames['parquet']['date'].dtype == 'datetime64[ns]'
+    assert frames['parquet'].dtypes.equals(frames['csv'].dtypes)
+    pd.testing.assert_frame_equal(
+        frames['parquet'].sort_values(['ticker', 'date'], ignore_index=True),
+        frames['csv'].sort_values(['ticker', 'date'], ignore_index=True)
+    )
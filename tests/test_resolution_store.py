@@ -0,0 +1,28 @@
+import multiprocessing
+
+from resolution_store import ResolutionStore
+
+
+def _save_shard(path, shard, tickers_per_shard):
+    # Cada "shard" guarda muchas veces para que las escrituras se solapen.
+    for i in range(tickers_per_shard):
+        store = ResolutionStore(path)
+        store.record_yfinance(f"S{shard}_{i}", f"S{shard}_{i}", found=False)
+        store.save()
+
+
+def test_concurrent_saves_keep_every_shard(tmp_path):
+    path = str(tmp_path / "ticker_resolution.json")
+    shards, tickers_per_shard = 4, 25
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_save_shard, args=(path, shard, tickers_per_shard))
+                 for shard in range(shards)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    stored = ResolutionStore(path).tickers
+    assert len(stored) == shards * tickers_per_shard
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
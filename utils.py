@@ -1,5 +1,15 @@
+import json
+import os
 import pandas as pd
 import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 def categorize_change(reason):
     """
@@ -24,4 +34,67 @@ def categorize_change(reason):
     if "reorganization" in reason_lower or "bankruptcy" in reason_lower:
         return "Reorganización"
     
-    return "Otros"
\ No newline at end of file
+    return "Otros"
+
+def write_json_atomic(path, data):
+    """
+    Escribe `data` como JSON en `path` de forma atómica (archivo temporal + rename).
+    El temporal es propio de cada proceso e hilo, para que dos escritores no se pisen.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Bloqueo exclusivo entre procesos (fcntl.flock sobre el archivo auxiliar `path`),
+    p. ej. para que varios shards en la misma máquina no generen a la vez la misma
+    caché. Espera hasta que el bloqueo quede libre. En Windows no bloquea.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """
+    Limitador de tasa global (token bucket) compartido entre hilos.
+
+    Args:
+        rate (float): Unidades permitidas por segundo. Si es None o <= 0, no limita.
+        burst (float, opcional): Capacidad máxima acumulable. Por defecto igual a `rate`.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = max(burst or rate or 1, 1)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        Reserva `amount` unidades y espera lo necesario para respetar la tasa media.
+        Las reservas mayores que la capacidad quedan "en deuda" y retrasan a las siguientes.
+        """
+        if not self.rate or self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)